@@ -2,11 +2,14 @@ import logging
 import asyncio
 import sys
 import os
-from aiogram import Bot, Dispatcher, F
+import asyncpg
+from aiogram import Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
 from typing import Optional
 from datetime import datetime
@@ -16,6 +19,9 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..'))
 
 from config import config
 from shared.storage.user_storage import UserStorage
+from shared.storage.fsm_storage import PostgresFSMStorage
+from shared.telegram.api import create_bot
+from shared.telegram.webhook import UpdateDeduplicator, WebhookServer
 
 logger = logging.getLogger(__name__)
 
@@ -25,10 +31,33 @@ class TicketStates(StatesGroup):
     waiting_for_close_reason = State()
 
 class AdminBot:
-    def __init__(self):
-        self.bot = Bot(token=config.TELEGRAM_TOKEN)
-        self.dp = Dispatcher()
-        self.user_storage = UserStorage(config.database_url)
+    def __init__(self, pool: Optional[asyncpg.Pool] = None, session: Optional[AiohttpSession] = None,
+                 fsm_storage: Optional[PostgresFSMStorage] = None):
+        """Общие ресурсы (пул БД, HTTP-сессию, FSM-хранилище) передает хост нескольких ботов"""
+        self.bot = create_bot(config.TELEGRAM_TOKEN, config.TELEGRAM_API_URL, session=session)
+        self._owns_session = session is None
+        self.user_storage = UserStorage(
+            config.database_url,
+            super_admin_id=config.SUPER_ADMIN_ID,
+            pool=pool,
+            admin_refresh_interval=config.ADMIN_CACHE_REFRESH_INTERVAL,
+            admin_denied_ttl=config.ADMIN_DENIED_TTL,
+            token_rollup_interval=config.TOKEN_ROLLUP_INTERVAL,
+            token_rollup_grace_minutes=config.TOKEN_ROLLUP_GRACE_MINUTES
+        )
+        # Состояния ответа на тикет храним в БД, чтобы рестарт не обрывал ответ админа
+        self.fsm_storage: Optional[PostgresFSMStorage] = fsm_storage
+        if self.fsm_storage is None and config.FSM_STORAGE == "postgres":
+            self.fsm_storage = PostgresFSMStorage(
+                self.user_storage.db,
+                cache_ttl=config.FSM_CACHE_TTL,
+                state_ttl_hours=config.FSM_STATE_TTL_HOURS
+            )
+        self.dp = Dispatcher(storage=self.fsm_storage or MemoryStorage())
+        self.webhook_server: Optional[WebhookServer] = None
+        
+        self._stopping = False
+        self._closed = False
         
         self._register_handlers()
         logger.info("✅ AdminBot initialized")
@@ -37,6 +66,8 @@ class AdminBot:
         """Инициализирует зависимости бота"""
         try:
             await self.user_storage.initialize()
+            if self.fsm_storage:
+                await self.fsm_storage.initialize()
             
             # Запускаем миграции
             from shared.storage.migrations import migrate_support_tickets
@@ -47,8 +78,33 @@ class AdminBot:
             logger.error(f"❌ Failed to initialize admin bot dependencies: {e}")
             raise
     
+    async def stop_intake(self):
+        """Прекращает прием новых обновлений (polling или вебхук)"""
+        if self._stopping:
+            return
+        self._stopping = True
+        logger.info("🛑 Stopping admin bot update intake...")
+        
+        if self.webhook_server:
+            await self.webhook_server.stop()
+            self.webhook_server = None
+            return
+        
+        try:
+            await self.dp.stop_polling()
+        except RuntimeError:
+            # Polling еще не запущен - start() увидит флаг и не запустит его
+            pass
+    
     async def close(self):
-        """Корректно закрывает ресурсы бота"""
+        """Корректно закрывает ресурсы бота: сначала прием обновлений, затем пул БД"""
+        if self._closed:
+            return
+        self._closed = True
+        
+        await self.stop_intake()
+        if self.fsm_storage:
+            await self.fsm_storage.close()
         await self.user_storage.close()
         logger.info("✅ Admin bot resources closed")
     
@@ -59,12 +115,9 @@ class AdminBot:
         user_id = message.from_user.id
         
         # Проверяем права админа
-        is_admin = await self.user_storage.is_admin(user_id)
-        is_super_admin = await self.user_storage.is_super_admin(user_id)
-        
-        if not (is_admin or is_super_admin):
-            await message.answer("❌ У вас нет прав доступа к этому боту.")
+        if not await self._check_admin(user_id, message, denied_text="❌ У вас нет прав доступа к этому боту."):
             return
+        is_super_admin = await self.user_storage.is_super_admin(user_id)
         
         # Проверяем deep link для тикета
         args = message.text.split()[1:] if len(message.text.split()) > 1 else []
@@ -376,7 +429,9 @@ class AdminBot:
                 "📊 **СТАТИСТИКА БОТА**\n\n"
                 f"👥 Всего пользователей: **{stats.get('total_users', 0)}**\n"
                 f"✅ Активных (30 дней): **{stats.get('active_users_30d', 0)}**\n"
+                f"🆕 Новых (30 дней): **{stats.get('new_users_30d', 0)}**\n"
                 f"💬 Всего сообщений: **{stats.get('total_messages', 0)}**\n"
+                f"📨 Сообщений (30 дней): **{stats.get('messages_30d', 0)}**\n"
             )
             
             await message.answer(stats_text, parse_mode=ParseMode.MARKDOWN)
@@ -568,16 +623,16 @@ class AdminBot:
     
     # ==================== ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ====================
     
-    async def _check_admin(self, user_id: int, message: Message) -> bool:
-        """Проверяет права админа"""
-        is_admin = await self.user_storage.is_admin(user_id)
-        is_super_admin = await self.user_storage.is_super_admin(user_id)
-        
-        if not (is_admin or is_super_admin):
-            await message.answer("❌ У вас нет прав доступа")
-            return False
-        
-        return True
+    async def _check_admin(self, user_id: int, message: Message,
+                           denied_text: str = "❌ У вас нет прав доступа") -> bool:
+        """Проверяет права админа (по кэшу, без запросов к БД)"""
+        if await self.user_storage.has_admin_access(user_id):
+            return True
+        
+        # Повторные команды без прав в течение ADMIN_DENIED_TTL остаются без ответа
+        if self.user_storage.admin_cache.remember_denied(user_id):
+            await message.answer(denied_text)
+        return False
 
     async def _update_ticket_in_group(self, ticket: dict, status_text: str):
         """Редактирует сообщение о тикете в группе"""
@@ -698,7 +753,16 @@ class AdminBot:
         logger.info("✅ All admin handlers registered")
     
     async def start(self):
-        """Запуск админского бота"""
+        """Запуск админского бота в режиме polling или webhook (UPDATES_MODE)"""
+        allowed_updates = ["message", "callback_query"]
+        
+        if self._stopping:
+            return
+        
+        if config.UPDATES_MODE == "webhook":
+            await self._start_webhook(allowed_updates)
+            return
+        
         logger.info("🔄 Starting admin bot polling...")
         
         try:
@@ -707,14 +771,44 @@ class AdminBot:
             
             await asyncio.sleep(1)
             
-            allowed_updates = ["message", "callback_query"]
-            
             await self.dp.start_polling(
                 self.bot,
                 allowed_updates=allowed_updates,
-                skip_updates=True
+                skip_updates=True,
+                # Сигналы обрабатывает main.py: остановка должна пройти через close()
+                handle_signals=False,
+                # Общую с другими ботами сессию закрывает хост
+                close_bot_session=self._owns_session
             )
             
         except Exception as e:
             logger.error(f"❌ Failed to start admin bot: {e}")
             raise
+    
+    async def _start_webhook(self, allowed_updates: list):
+        """Прием обновлений через вебхук"""
+        logger.info("🔄 Starting admin bot in webhook mode...")
+        
+        try:
+            deduplicator = UpdateDeduplicator(self.user_storage.db, self.bot.id)
+            await deduplicator.initialize()
+            
+            self.webhook_server = WebhookServer(
+                self.bot,
+                self.dp,
+                deduplicator,
+                base_url=config.WEBHOOK_BASE_URL,
+                path=config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET,
+                host=config.WEBHOOK_HOST,
+                port=config.WEBHOOK_PORT,
+                allowed_updates=allowed_updates,
+                intake_size=config.WEBHOOK_INTAKE_SIZE,
+                consumers=config.MAX_WORKERS
+            )
+            await self.webhook_server.start()
+            await self.webhook_server.serve_forever()
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to start admin bot webhook: {e}")
+            raise
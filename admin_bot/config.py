@@ -33,6 +33,33 @@ class Config:
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "5"))
     
+    # Прием обновлений: "polling" или "webhook"
+    UPDATES_MODE: str = os.getenv("UPDATES_MODE", "polling")
+    WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "")
+    WEBHOOK_SECRET: str = os.getenv("ADMIN_BOT_WEBHOOK_SECRET", "")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("ADMIN_BOT_WEBHOOK_PORT", "8082"))
+    WEBHOOK_PATH: str = os.getenv("ADMIN_BOT_WEBHOOK_PATH", "/webhook/admin")
+    WEBHOOK_INTAKE_SIZE: int = int(os.getenv("WEBHOOK_INTAKE_SIZE", "1000"))
+    
+    # Адрес Bot API (локальный Bot API сервер или тестовая заглушка), пусто - api.telegram.org
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "")
+    
+    # FSM (диалоги поддержки/тикетов): "postgres" - переживает рестарт, "memory" - в процессе
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "postgres")
+    FSM_CACHE_TTL: float = float(os.getenv("FSM_CACHE_TTL", "5"))
+    FSM_STATE_TTL_HOURS: int = int(os.getenv("FSM_STATE_TTL_HOURS", "24"))
+    
+    # Кэш админов: обновляется по NOTIFY и не реже чем раз в ADMIN_CACHE_REFRESH_INTERVAL секунд;
+    # пользователь без прав получает отказ не чаще раза в ADMIN_DENIED_TTL секунд
+    ADMIN_CACHE_REFRESH_INTERVAL: float = float(os.getenv("ADMIN_CACHE_REFRESH_INTERVAL", "300"))
+    ADMIN_DENIED_TTL: float = float(os.getenv("ADMIN_DENIED_TTL", "60"))
+    
+    # Дневная свертка token_usage: досворачивается раз в TOKEN_ROLLUP_INTERVAL секунд,
+    # прошедший день сворачивается через TOKEN_ROLLUP_GRACE_MINUTES минут после полуночи
+    TOKEN_ROLLUP_INTERVAL: float = float(os.getenv("TOKEN_ROLLUP_INTERVAL", "300"))
+    TOKEN_ROLLUP_GRACE_MINUTES: int = int(os.getenv("TOKEN_ROLLUP_GRACE_MINUTES", "10"))
+    
     @property
     def database_url(self) -> str:
         """Возвращает URL для подключения к PostgreSQL"""
@@ -51,6 +78,10 @@ class Config:
             "ADMIN_CHANNEL_ID": self.ADMIN_CHANNEL_ID
         }
         
+        if self.UPDATES_MODE == "webhook":
+            required_vars["WEBHOOK_BASE_URL"] = self.WEBHOOK_BASE_URL
+            required_vars["WEBHOOK_SECRET"] = self.WEBHOOK_SECRET
+        
         for var_name, var_value in required_vars.items():
             if not var_value:
                 raise ValueError(f"{var_name} is required")
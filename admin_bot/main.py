@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import signal
 import sys
 import os
 from datetime import datetime
@@ -36,6 +37,22 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+_shutdown_tasks = set()
+
+def install_signal_handlers(bot):
+    """SIGTERM/SIGINT запускают корректную остановку: сначала прекращается прием обновлений,
+    затем start() возвращается и close() в finally дообрабатывает и сохраняет очередь"""
+    loop = asyncio.get_running_loop()
+    
+    def on_signal(sig):
+        logger.info(f"Received {sig.name}, shutting down gracefully")
+        task = asyncio.create_task(bot.stop_intake())
+        _shutdown_tasks.add(task)
+        task.add_done_callback(_shutdown_tasks.discard)
+    
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, on_signal, sig)
+
 async def main():
     bot = None
     try:
@@ -49,13 +66,12 @@ async def main():
         
         bot = AdminBot()
         logger.info("Admin bot instance created")
+        install_signal_handlers(bot)
         
         await bot.initialize()
         logger.info("Admin bot dependencies initialized")
         
-        await bot.bot.delete_webhook()
-        logger.info("Webhook deleted successfully")
-        
+        logger.info(f"Starting admin bot ({config.UPDATES_MODE})")
         await bot.start()
         
     except Exception as e:
@@ -81,6 +81,19 @@ CREATE TABLE IF NOT EXISTS admins (
 CREATE INDEX IF NOT EXISTS idx_admins_user_id ON admins(user_id);
 CREATE INDEX IF NOT EXISTS idx_admins_is_active ON admins(is_active);
 
+-- Уведомление об изменении админов: admin_bot перечитывает кэш прав
+CREATE OR REPLACE FUNCTION notify_admins_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('admins_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS admins_changed ON admins;
+CREATE TRIGGER admins_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON admins
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_admins_changed();
+
 -- Таблица статистики использования токенов
 CREATE TABLE IF NOT EXISTS token_usage (
     usage_id BIGSERIAL PRIMARY KEY,
@@ -90,13 +103,35 @@ CREATE TABLE IF NOT EXISTS token_usage (
     total_tokens INTEGER DEFAULT 0,
     model VARCHAR(100),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    created_date DATE DEFAULT CURRENT_DATE
+    created_date DATE DEFAULT CURRENT_DATE,
+    -- Строка учтена в token_usage_daily
+    rolled_up BOOLEAN NOT NULL DEFAULT FALSE
 );
 
 -- Индексы для token_usage
 CREATE INDEX IF NOT EXISTS idx_token_usage_user_id ON token_usage(user_id);
 CREATE INDEX IF NOT EXISTS idx_token_usage_created_at ON token_usage(created_at);
 CREATE INDEX IF NOT EXISTS idx_token_usage_created_date ON token_usage(user_id, created_date DESC);
+CREATE INDEX IF NOT EXISTS idx_token_usage_unrolled ON token_usage(created_date) WHERE NOT rolled_up;
+
+-- Дневная свертка token_usage (досворачивается админ-ботом) и ее водяной знак
+CREATE TABLE IF NOT EXISTS token_usage_daily (
+    usage_date DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    completion_tokens BIGINT NOT NULL DEFAULT 0,
+    total_tokens BIGINT NOT NULL DEFAULT 0,
+    request_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (usage_date, user_id, model)
+);
+CREATE INDEX IF NOT EXISTS idx_token_usage_daily_user ON token_usage_daily(user_id, usage_date DESC);
+
+CREATE TABLE IF NOT EXISTS token_usage_rollup_state (
+    name TEXT PRIMARY KEY,
+    rolled_through DATE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
 
 -- Таблица контента для кнопок и тем
 CREATE TABLE IF NOT EXISTS bot_content (
@@ -119,6 +154,19 @@ CREATE INDEX IF NOT EXISTS idx_bot_content_category ON bot_content(category);
 CREATE INDEX IF NOT EXISTS idx_bot_content_key ON bot_content(key);
 CREATE INDEX IF NOT EXISTS idx_bot_content_is_active ON bot_content(is_active);
 
+-- Уведомление об изменении контента: процессы user_bot перечитывают кэш bot_content
+CREATE OR REPLACE FUNCTION notify_bot_content_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('bot_content_changed', TG_OP);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bot_content_changed ON bot_content;
+CREATE TRIGGER bot_content_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON bot_content
+    FOR EACH STATEMENT EXECUTE PROCEDURE notify_bot_content_changed();
+
 -- Таблица реферальной системы
 CREATE TABLE IF NOT EXISTS referrals (
     referral_id BIGSERIAL PRIMARY KEY,
@@ -140,6 +188,8 @@ GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO bot_user;
 ALTER TABLE users OWNER TO bot_user;
 ALTER TABLE messages OWNER TO bot_user;
 ALTER TABLE token_usage OWNER TO bot_user;
+ALTER TABLE token_usage_daily OWNER TO bot_user;
+ALTER TABLE token_usage_rollup_state OWNER TO bot_user;
 ALTER TABLE bot_content OWNER TO bot_user;
 ALTER TABLE admins OWNER TO bot_user;
 ALTER TABLE support_tickets OWNER TO bot_user;
@@ -0,0 +1,221 @@
+"""
+Хост нескольких ботов в одном процессе (необязательный режим для небольших установок):
+user_bot, admin_bot и дополнительные токены user_bot работают в одном цикле событий
+с общим пулом PostgreSQL, одной HTTP-сессией к Bot API, общим FSM-хранилищем с кэшем
+и одним кэшем контента (bot_content) с одним LISTEN-подключением на все user-боты.
+Уведомления user_bot -> admin_bot идут вызовом в процессе, а не отдельным HTTP-клиентом
+"""
+import asyncio
+import importlib
+import logging
+import os
+import signal
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+load_dotenv(ROOT_DIR / '.env')
+sys.path.insert(0, str(ROOT_DIR))
+
+from shared.storage.database import Database
+from shared.storage.fsm_storage import PostgresFSMStorage
+from shared.storage.queries import queries
+from shared.telegram.api import create_session
+
+os.makedirs('logs', exist_ok=True)
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+host_handler = logging.FileHandler(
+    filename='logs/host.log',
+    encoding='utf-8',
+    mode='a'
+)
+host_handler.setFormatter(formatter)
+host_handler.setLevel(logging.INFO)
+
+console_handler = logging.StreamHandler(sys.stdout)
+console_handler.setFormatter(formatter)
+console_handler.setLevel(logging.INFO)
+
+logging.basicConfig(
+    level=logging.INFO,
+    handlers=[host_handler, console_handler]
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HostConfig:
+    # Дополнительные токены user_bot через запятую (тот же ассистент и та же БД)
+    EXTRA_BOT_TOKENS: List[str] = field(default_factory=lambda: [
+        token.strip() for token in os.getenv("HOST_EXTRA_BOT_TOKENS", "").split(',') if token.strip()
+    ])
+    # Один пул на все боты вместо 5-20 подключений у каждого
+    DB_POOL_MIN: int = int(os.getenv("HOST_DB_POOL_MIN", "5"))
+    DB_POOL_MAX: int = int(os.getenv("HOST_DB_POOL_MAX", "20"))
+    ADMIN_BOT_ENABLED: bool = os.getenv("HOST_ADMIN_BOT_ENABLED", "true").lower() == "true"
+
+
+host_config = HostConfig()
+
+# У ботов одинаковые имена пакетов верхнего уровня
+BOT_MODULES = ('app', 'config')
+_bot_modules = {}
+
+
+def _is_bot_module(name: str) -> bool:
+    return name in BOT_MODULES or any(name.startswith(f"{module}.") for module in BOT_MODULES)
+
+
+def load_bot(directory: Path, module: str, class_name: str):
+    """
+    Импортирует класс бота и его config из каталога бота. После импорта модули
+    app.* и config убираются из sys.modules: код бота держит ссылки на свои модули,
+    а следующий бот импортирует собственные с теми же именами
+    """
+    path = str(directory)
+    sys.path.insert(0, path)
+    try:
+        bot_class = getattr(importlib.import_module(module), class_name)
+        bot_config = sys.modules['config'].config
+    finally:
+        sys.path.remove(path)
+        for name in [name for name in sys.modules if _is_bot_module(name)]:
+            _bot_modules[f"{directory.name}:{name}"] = sys.modules.pop(name)
+    return bot_class, bot_config
+
+
+_shutdown_tasks = set()
+
+
+def install_signal_handlers(bots):
+    """SIGTERM/SIGINT останавливают прием у всех ботов, SIGHUP перечитывает приоритеты user_bot"""
+    loop = asyncio.get_running_loop()
+
+    def on_signal(sig):
+        logger.info(f"🛑 Received {sig.name}, shutting down all bots gracefully...")
+        for bot in bots:
+            task = asyncio.create_task(bot.stop_intake())
+            _shutdown_tasks.add(task)
+            task.add_done_callback(_shutdown_tasks.discard)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, on_signal, sig)
+
+    def on_reload():
+        load_dotenv(ROOT_DIR / '.env', override=True)
+        for bot in bots:
+            if hasattr(bot, 'reload_priorities'):
+                bot.reload_priorities()
+
+    loop.add_signal_handler(signal.SIGHUP, on_reload)
+
+
+async def run_bots(bots):
+    """Запускает боты; если один остановился или упал - останавливает остальные"""
+    tasks = [asyncio.create_task(bot.start(), name=f"bot-{index}") for index, bot in enumerate(bots)]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+    for bot in bots:
+        await bot.stop_intake()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    for task in done:
+        # Исключение упавшего бота - наружу, чтобы supervisor перезапустил процесс
+        task.result()
+
+
+async def main():
+    UserBot, user_config = load_bot(ROOT_DIR / 'user_bot', 'app.bot.core', 'TelegramBot')
+    AdminBot, admin_config = None, None
+    if host_config.ADMIN_BOT_ENABLED:
+        AdminBot, admin_config = load_bot(ROOT_DIR / 'admin_bot', 'app.bot.admin_core', 'AdminBot')
+
+    logger.info("=" * 50)
+    logger.info("🚀 BOT HOST STARTING")
+    logger.info(f"📅 Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    logger.info("=" * 50)
+
+    user_config.validate()
+    if admin_config:
+        admin_config.validate()
+    if host_config.EXTRA_BOT_TOKENS and (
+        user_config.UPDATES_MODE != "polling" or user_config.MESSAGE_QUEUE != "memory"
+        or user_config.BOT_ROLE != "all"
+    ):
+        # У вебхука один порт на процесс, а inbox не различает ботов
+        raise ValueError("HOST_EXTRA_BOT_TOKENS requires UPDATES_MODE=polling, MESSAGE_QUEUE=memory, BOT_ROLE=all")
+
+    # Кэш запросов подключений рассчитан на все запросы реестра
+    pool = await queries.create_pool(
+        user_config.database_url,
+        min_size=host_config.DB_POOL_MIN,
+        max_size=host_config.DB_POOL_MAX,
+        command_timeout=60
+    )
+    session = create_session(user_config.TELEGRAM_API_URL)
+    fsm_storage = None
+    if user_config.FSM_STORAGE == "postgres":
+        # Ключи FSM содержат bot_id, поэтому одно хранилище (и один кэш) подходит всем ботам
+        fsm_storage = PostgresFSMStorage(
+            Database(user_config.database_url, pool=pool),
+            cache_ttl=user_config.FSM_CACHE_TTL,
+            state_ttl_hours=user_config.FSM_STATE_TTL_HOURS
+        )
+
+    # Один снимок bot_content (и одно LISTEN-подключение) на все user-боты
+    content_cache = UserBot.create_content_cache(pool)
+
+    bots = []
+    admin_bot = None
+    try:
+        if AdminBot:
+            admin_bot = AdminBot(pool=pool, session=session, fsm_storage=fsm_storage)
+            bots.append(admin_bot)
+
+        shared = dict(pool=pool, session=session, fsm_storage=fsm_storage, content_cache=content_cache,
+                      admin_bot=admin_bot.bot if admin_bot else None)
+        bots.append(UserBot(**shared))
+        for token in host_config.EXTRA_BOT_TOKENS:
+            bots.append(UserBot(token=token, **shared))
+        logger.info(f"🤖 {len(bots)} bots created (pool {host_config.DB_POOL_MIN}-{host_config.DB_POOL_MAX})")
+
+        install_signal_handlers(bots)
+        for bot in bots:
+            await bot.initialize()
+        # Таблицы созданы ботами; до загрузки снимка контент читается из БД
+        if content_cache:
+            await content_cache.start()
+
+        await run_bots(bots)
+
+    except Exception as e:
+        logger.error(f"❌ Bot host failed: {e}", exc_info=True)
+        raise
+
+    finally:
+        await asyncio.gather(*(bot.close() for bot in bots), return_exceptions=True)
+        if content_cache:
+            await content_cache.stop()
+        if fsm_storage:
+            await fsm_storage.close()
+        await session.close()
+        await pool.close()
+        logger.info("✅ Bot host shutdown complete")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except Exception:
+        sys.exit(1)
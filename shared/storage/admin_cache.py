@@ -0,0 +1,98 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional
+
+from .database import Database
+from .notify import ChangeListener, change_channel, install_notify_trigger
+
+logger = logging.getLogger(__name__)
+
+
+class AdminCache:
+    """
+    Множество активных админов в памяти: проверка прав не ходит в БД. Множество
+    загружается при старте и перечитывается целиком по NOTIFY от триггера на admins
+    (add_admin/remove_admin из любого процесса, правки руками) и не реже чем раз в
+    refresh_interval.
+
+    Отдельно хранится недавний отказ (негативный кэш): пользователь без прав получает
+    ответ "нет доступа" не чаще раза в denied_ttl секунд, а пока множество не загружено
+    (БД была недоступна при старте), его повторные команды не проверяются в БД
+    """
+
+    def __init__(self, database: Database, refresh_interval: float = 300.0,
+                 denied_ttl: float = 60.0, denied_limit: int = 10000):
+        self.db = database
+        self.denied_ttl = denied_ttl
+        self.denied_limit = denied_limit
+        self._admins: Optional[FrozenSet[int]] = None
+        self._denied: "OrderedDict[int, float]" = OrderedDict()
+        self._listener = ChangeListener(
+            database.database_url, change_channel('admins'), self.refresh, refresh_interval
+        )
+        self._refreshes = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._admins is not None
+
+    async def start(self):
+        await install_notify_trigger(self.db, 'admins')
+        await self.refresh()
+        await self._listener.start()
+
+    async def stop(self):
+        await self._listener.stop()
+
+    def invalidate(self):
+        """Перечитать множество в фоне (после изменения админов этим процессом)"""
+        self._listener.invalidate()
+
+    async def refresh(self) -> bool:
+        """Перечитывает админов. При ошибке остается прежнее множество"""
+        try:
+            rows = await self.db.fetch('admins.active_ids')
+            self._admins = frozenset(row['user_id'] for row in rows)
+            # Новый админ не должен ждать истечения отказа
+            self._denied.clear()
+            self._refreshes += 1
+            logger.info(f"✅ Admin cache loaded: {len(self._admins)} admins")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to refresh admin cache: {e}")
+            return False
+
+    def is_admin(self, user_id: int) -> Optional[bool]:
+        """Проверка без запроса. None - множество не загружено, решает БД"""
+        if self._admins is None:
+            return False if self.is_denied(user_id) else None
+        return user_id in self._admins
+
+    def is_denied(self, user_id: int) -> bool:
+        """Пользователю недавно отказали в доступе"""
+        expires = self._denied.get(user_id)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del self._denied[user_id]
+            return False
+        return True
+
+    def remember_denied(self, user_id: int) -> bool:
+        """Запоминает отказ. True - первый отказ за denied_ttl (стоит ответить пользователю)"""
+        first = not self.is_denied(user_id)
+        if first:
+            self._denied[user_id] = time.monotonic() + self.denied_ttl
+            self._denied.move_to_end(user_id)
+            while len(self._denied) > self.denied_limit:
+                self._denied.popitem(last=False)
+        return first
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'loaded': self.loaded,
+            'admins': len(self._admins) if self._admins is not None else 0,
+            'denied': len(self._denied),
+            'refreshes_total': self._refreshes
+        }
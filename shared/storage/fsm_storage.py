@@ -0,0 +1,143 @@
+"""
+FSM хранилище aiogram в PostgreSQL с локальным кешем чтения
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .queries import queries
+
+logger = logging.getLogger(__name__)
+
+
+class PostgresFSMStorage(BaseStorage):
+    """
+    Состояния и данные FSM в таблице fsm_storage (одна строка на ключ).
+
+    Переживает рестарт и общее для нескольких процессов. Чтения проходят через
+    небольшой TTL кеш: проверка состояния на каждом сообщении обычно не ходит в БД.
+    Запись идет сразу в БД и обновляет кеш, поэтому внутри процесса кеш не отстает;
+    изменения из другого процесса становятся видны не позже чем через cache_ttl.
+    Состояния, которые не менялись дольше state_ttl, считаются брошенными и удаляются.
+    """
+
+    def __init__(self, db, cache_ttl: float = 5.0, cache_size: int = 10000,
+                 state_ttl_hours: int = 24, cleanup_interval: float = 3600.0):
+        self.db = db
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.state_ttl_hours = state_ttl_hours
+        self.cleanup_interval = cleanup_interval
+        self._cache: "OrderedDict[str, Tuple[float, Optional[str], Dict[str, Any]]]" = OrderedDict()
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    async def initialize(self):
+        """Создает таблицу и запускает периодическую очистку"""
+        async with self.db.get_connection() as conn:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_storage (
+                    key TEXT PRIMARY KEY,
+                    bot_id BIGINT NOT NULL,
+                    state TEXT,
+                    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+                    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at
+                ON fsm_storage(updated_at)
+            ''')
+
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop(), name="fsm-cleanup")
+        logger.info("✅ PostgreSQL FSM storage initialized")
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(part) if part is not None else '' for part in (
+            key.bot_id,
+            key.chat_id,
+            key.user_id,
+            key.thread_id,
+            getattr(key, 'business_connection_id', None),
+            key.destiny
+        ))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        db_key = self._key(key)
+
+        async with self.db.get_connection() as conn:
+            data = await queries.fetchval(conn, 'fsm.set_state', db_key, key.bot_id, value, self.state_ttl_hours)
+
+        self._remember(db_key, value, json.loads(data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        db_key = self._key(key)
+        payload = json.dumps(dict(data), ensure_ascii=False, default=str)
+
+        async with self.db.get_connection() as conn:
+            state = await queries.fetchval(conn, 'fsm.set_data', db_key, key.bot_id, payload, self.state_ttl_hours)
+
+        self._remember(db_key, state, json.loads(payload))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self._key(key))
+        return dict(data)
+
+    async def close(self) -> None:
+        """Останавливает очистку. Пул подключений принадлежит хранилищу бота и здесь не закрывается"""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            await asyncio.gather(self._cleanup_task, return_exceptions=True)
+            self._cleanup_task = None
+        self._cache.clear()
+
+    async def cleanup(self) -> int:
+        """Удаляет брошенные и пустые состояния"""
+        try:
+            async with self.db.get_connection() as conn:
+                result = await queries.execute(conn, 'fsm.cleanup', self.state_ttl_hours)
+            deleted = int(result.split()[-1])
+            if deleted:
+                logger.info(f"🧹 Removed {deleted} expired FSM states")
+            return deleted
+        except Exception as e:
+            logger.error(f"❌ Failed to clean FSM storage: {e}")
+            return 0
+
+    async def _load(self, db_key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        cached = self._cache.get(db_key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(db_key)
+            return cached[1], cached[2]
+
+        async with self.db.get_connection() as conn:
+            row = await queries.fetchrow(conn, 'fsm.get', db_key, self.state_ttl_hours)
+
+        # Отсутствие состояния тоже кешируется - это самый частый случай
+        state = row['state'] if row else None
+        data = json.loads(row['data']) if row else {}
+        self._remember(db_key, state, data)
+        return state, data
+
+    def _remember(self, db_key: str, state: Optional[str], data: Dict[str, Any]):
+        self._cache[db_key] = (time.monotonic() + self.cache_ttl, state, data)
+        self._cache.move_to_end(db_key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _cleanup_loop(self):
+        while True:
+            await self.cleanup()
+            await asyncio.sleep(self.cleanup_interval)
@@ -0,0 +1,119 @@
+"""
+Уведомления об изменении таблиц: триггер с NOTIFY и фоновый LISTEN для кэшей в памяти
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+def change_channel(table: str) -> str:
+    """Канал NOTIFY для таблицы"""
+    return f"{table}_changed"
+
+
+def notify_trigger_sql(table: str) -> str:
+    """Функция и statement-level триггер: любое изменение таблицы шлет NOTIFY в change_channel(table)"""
+    channel = change_channel(table)
+    return f'''
+        CREATE OR REPLACE FUNCTION notify_{channel}() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{channel}', TG_OP);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgname = '{channel}' AND tgrelid = '{table}'::regclass
+            ) THEN
+                CREATE TRIGGER {channel}
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE PROCEDURE notify_{channel}();
+            END IF;
+        END
+        $$;
+    '''
+
+
+async def install_notify_trigger(db, table: str) -> bool:
+    """Создает триггер, если его еще нет. False - не удалось (кэш обновится по таймеру)"""
+    try:
+        async with db.get_connection() as conn:
+            await conn.execute(notify_trigger_sql(table))
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to install notify trigger on {table}: {e}")
+        return False
+
+
+class ChangeListener:
+    """
+    Слушает канал NOTIFY на отдельном подключении (подключения пула при возврате
+    делают UNLISTEN) и вызывает on_change на каждое уведомление. Уведомления,
+    пришедшие во время on_change, схлопываются в один повторный вызов. Раз в
+    refresh_interval подключение проверяется, а on_change вызывается на случай
+    пропущенного уведомления; после переподключения - сразу
+    """
+
+    def __init__(self, database_url: str, channel: str, on_change: Callable[[], Awaitable[Any]],
+                 refresh_interval: float = 300.0):
+        self.database_url = database_url
+        self.channel = channel
+        self.on_change = on_change
+        self.refresh_interval = refresh_interval
+        self._changed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen_loop(), name=f"listen-{self.channel}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def invalidate(self):
+        """Вызвать on_change в фоне (изменение сделано этим процессом)"""
+        self._changed.set()
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._changed.set()
+
+    async def _listen_loop(self):
+        reconnect = False
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.database_url)
+                await conn.add_listener(self.channel, self._on_notify)
+                # Пока слушателя не было, изменения могли пройти мимо
+                if reconnect:
+                    self._changed.clear()
+                    await self.on_change()
+                reconnect = True
+
+                while True:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=self.refresh_interval)
+                    except asyncio.TimeoutError:
+                        # Проверяем, что LISTEN-подключение живо
+                        await conn.execute('SELECT 1')
+                    self._changed.clear()
+                    await self.on_change()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ Listener on {self.channel} disconnected: {e}, reconnecting in 5s")
+                await asyncio.sleep(5)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
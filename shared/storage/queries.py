@@ -0,0 +1,812 @@
+"""
+Реестр SQL-запросов хранилищ: каждый запрос (кроме DDL при инициализации) описан здесь
+один раз и вызывается по имени. Запросы выполняются текстом одного и того же SQL, поэтому
+asyncpg готовит каждый один раз на подключение и дальше берет из своего кэша запросов
+подключения
+"""
+import logging
+import textwrap
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Query:
+    name: str
+    sql: str
+
+
+class QueryRegistry:
+    def __init__(self):
+        self._queries: Dict[str, Query] = {}
+        self._calls: Counter = Counter()
+
+    def register(self, name: str, sql: str) -> str:
+        """Регистрирует запрос под именем"""
+        sql = textwrap.dedent(sql).strip()
+        existing = self._queries.get(name)
+        if existing and existing.sql != sql:
+            raise ValueError(f"Query {name} is already registered with different SQL")
+        self._queries[name] = Query(name, sql)
+        return name
+
+    def sql(self, name: str) -> str:
+        return self._queries[name].sql
+
+    async def create_pool(self, database_url: str, **kwargs) -> asyncpg.Pool:
+        """
+        Пул для запросов реестра. Подготовленные запросы живут в кэше каждого подключения
+        asyncpg (statement_cache_size) и переживают возврат подключения в пул, в отличие от
+        объектов conn.prepare(), которые asyncpg закрывает при release.
+
+        Прогрева нет: у asyncpg нет публичного способа положить запрос в этот кэш, кроме
+        как выполнить его, а init пула срабатывает раньше, чем созданы таблицы. Поэтому
+        первое выполнение каждого запроса на каждом подключении платит лишний Parse/Describe
+        (не больше числа запросов на размер пула за время жизни подключений)
+        """
+        kwargs.setdefault('statement_cache_size', max(100, 2 * len(self._queries)))
+        return await asyncpg.create_pool(database_url, **kwargs)
+
+    def _sql(self, name: str) -> str:
+        self._calls[name] += 1
+        return self.sql(name)
+
+    async def fetch(self, conn, name: str, *args) -> List[asyncpg.Record]:
+        return await conn.fetch(self._sql(name), *args)
+
+    async def fetchrow(self, conn, name: str, *args) -> Optional[asyncpg.Record]:
+        return await conn.fetchrow(self._sql(name), *args)
+
+    async def fetchval(self, conn, name: str, *args) -> Any:
+        return await conn.fetchval(self._sql(name), *args)
+
+    async def execute(self, conn, name: str, *args) -> str:
+        """Выполняет запрос без результата. Возвращает статус команды (как conn.execute)"""
+        return await conn.execute(self._sql(name), *args)
+
+    async def executemany(self, conn, name: str, args: List[tuple]):
+        self._calls[name] += len(args)
+        await conn.executemany(self.sql(name), args)
+
+    def counts(self) -> Dict[str, int]:
+        """Число выполнений каждого запроса с момента старта процесса"""
+        return dict(self._calls.most_common())
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'registered': len(self._queries),
+            'calls_total': sum(self._calls.values()),
+            'calls': self.counts()
+        }
+
+
+queries = QueryRegistry()
+register = queries.register
+
+
+# --- users ---
+
+register('users.get', 'SELECT * FROM users WHERE user_id = $1')
+
+register('users.upsert', '''
+    INSERT INTO users
+    (user_id, username, first_name, last_name, language_code, is_premium, last_activity)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        username = EXCLUDED.username,
+        first_name = EXCLUDED.first_name,
+        last_name = EXCLUDED.last_name,
+        language_code = EXCLUDED.language_code,
+        is_premium = EXCLUDED.is_premium,
+        last_activity = GREATEST(users.last_activity, EXCLUDED.last_activity),
+        is_active = TRUE
+''')
+
+# Вариант admin_bot: повторное сохранение считается сообщением
+register('users.upsert_counted', '''
+    INSERT INTO users
+    (user_id, username, first_name, last_name, language_code, is_premium, last_activity)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        username = EXCLUDED.username,
+        first_name = EXCLUDED.first_name,
+        last_name = EXCLUDED.last_name,
+        language_code = EXCLUDED.language_code,
+        is_premium = EXCLUDED.is_premium,
+        last_activity = EXCLUDED.last_activity,
+        message_count = users.message_count + 1,
+        is_active = TRUE
+''')
+
+register('users.update_thread', 'UPDATE users SET openai_thread_id = $1 WHERE user_id = $2')
+
+register('users.touch_activity',
+         'UPDATE users SET last_activity = $1, message_count = message_count + 1 WHERE user_id = $2')
+
+# Пачка ActivityAggregator передается массивами - текст один для любого размера пачки
+register('users.flush_activity', '''
+    UPDATE users AS u SET
+        last_activity = GREATEST(u.last_activity, v.last_activity),
+        message_count = u.message_count + v.messages,
+        is_active = TRUE
+    FROM unnest($1::bigint[], $2::timestamptz[], $3::int[]) AS v(user_id, last_activity, messages)
+    WHERE u.user_id = v.user_id
+''')
+
+register('users.all', 'SELECT * FROM users ORDER BY created_at DESC')
+
+# Окна задаются числом дней ($N::int -> make_interval); граница слева - константа
+# на время запроса, поэтому условия идут по индексам на last_activity/created_at
+register('users.active', '''
+    SELECT * FROM users
+    WHERE last_activity >= NOW() - make_interval(days => $1::int)
+    ORDER BY last_activity DESC
+''')
+
+register('users.count_active', '''
+    SELECT COUNT(*) FROM users
+    WHERE last_activity >= NOW() - make_interval(days => $1::int)
+''')
+
+register('users.count_new', '''
+    SELECT COUNT(*) FROM users
+    WHERE created_at >= NOW() - make_interval(days => $1::int)
+''')
+
+# Сводка для /stats одним запросом
+register('users.window_stats', '''
+    SELECT
+        (SELECT COUNT(*) FROM users) AS total_users,
+        (SELECT COUNT(*) FROM users
+         WHERE last_activity >= NOW() - make_interval(days => $1::int)) AS active_users,
+        (SELECT COUNT(*) FROM users
+         WHERE created_at >= NOW() - make_interval(days => $1::int)) AS new_users,
+        (SELECT COUNT(*) FROM messages) AS total_messages,
+        (SELECT COUNT(*) FROM messages
+         WHERE created_at >= NOW() - make_interval(days => $1::int)) AS messages
+''')
+
+# --- журналы ---
+
+register('messages.insert', '''
+    INSERT INTO messages
+    (user_id, message_text, message_type, openai_thread_id, openai_message_id, tokens_used)
+    VALUES ($1, $2, $3, $4, $5, $6)
+''')
+
+register('messages.count', 'SELECT COUNT(*) FROM messages')
+
+register('messages.count_since', '''
+    SELECT COUNT(*) FROM messages
+    WHERE created_at >= NOW() - make_interval(days => $1::int)
+''')
+
+register('openai_activity.insert', '''
+    INSERT INTO openai_activity
+    (user_id, thread_id, run_id, status, error_message)
+    VALUES ($1, $2, $3, $4, $5)
+''')
+
+register('pending_messages.insert', '''
+    INSERT INTO pending_messages (bot_id, user_id, payload, interrupted)
+    VALUES ($1, $2, $3::jsonb, $4)
+''')
+
+# bot_id = 0 - строки, сохраненные до появления колонки
+register('pending_messages.pop', '''
+    DELETE FROM pending_messages
+    WHERE bot_id = $1 OR bot_id = 0
+    RETURNING id, user_id, payload::text AS payload, interrupted
+''')
+
+# --- admins ---
+
+register('admins.upsert', '''
+    INSERT INTO admins (user_id, username, first_name, added_by)
+    VALUES ($1, $2, $3, $4)
+    ON CONFLICT (user_id)
+    DO UPDATE SET
+        username = EXCLUDED.username,
+        first_name = EXCLUDED.first_name,
+        is_active = TRUE
+''')
+
+register('admins.delete', 'DELETE FROM admins WHERE user_id = $1')
+
+register('admins.active_ids', 'SELECT user_id FROM admins WHERE is_active = TRUE')
+
+register('admins.is_active', 'SELECT 1 FROM admins WHERE user_id = $1 AND is_active = TRUE')
+
+register('admins.all', '''
+    SELECT a.*, u.username as added_by_username
+    FROM admins a
+    LEFT JOIN users u ON a.added_by = u.user_id
+    WHERE a.is_active = TRUE
+    ORDER BY a.added_at DESC
+''')
+
+# --- token_usage ---
+
+register('token_usage.insert', '''
+    INSERT INTO token_usage
+    (user_id, thread_id, message_id, model, prompt_tokens, completion_tokens, total_tokens)
+    VALUES ($1, $2, $3, $4, $5, $6, $7)
+''')
+
+
+def _token_usage_window(days: str, user_id: str = '') -> str:
+    """
+    CTE usage(usage_date, user_id, model, prompt_tokens, completion_tokens, total_tokens,
+    request_count) за последние days дней: свернутое - из token_usage_daily, остальное
+    (сегодня, еще не свернутые дни и запоздавшие строки уже свернутых дней) - из
+    token_usage по rolled_up = FALSE. Сырых строк читается не больше пары дней,
+    сколько бы ни накопилось истории
+    """
+    daily_user = f"AND d.user_id = {user_id}" if user_id else ""
+    raw_user = f"AND t.user_id = {user_id}" if user_id else ""
+    return f'''
+    WITH usage AS (
+        SELECT d.usage_date, d.user_id, d.model, d.prompt_tokens, d.completion_tokens,
+               d.total_tokens, d.request_count
+        FROM token_usage_daily d
+        WHERE d.usage_date >= CURRENT_DATE - {days} {daily_user}
+        UNION ALL
+        SELECT t.created_date, t.user_id, COALESCE(t.model, ''), SUM(t.prompt_tokens),
+               SUM(t.completion_tokens), SUM(t.total_tokens), COUNT(*)
+        FROM token_usage t
+        WHERE NOT t.rolled_up AND t.created_date >= CURRENT_DATE - {days}
+              AND t.user_id IS NOT NULL {raw_user}
+        GROUP BY t.created_date, t.user_id, COALESCE(t.model, '')
+    )
+    '''
+
+
+register('token_usage.user_total', _token_usage_window('$2::int', '$1') + '''
+    SELECT
+        COALESCE(SUM(prompt_tokens), 0)::bigint as total_prompt_tokens,
+        COALESCE(SUM(completion_tokens), 0)::bigint as total_completion_tokens,
+        COALESCE(SUM(total_tokens), 0)::bigint as total_tokens,
+        COALESCE(SUM(request_count), 0)::bigint as request_count
+    FROM usage
+''')
+
+register('token_usage.user_daily', _token_usage_window('$2::int', '$1') + '''
+    SELECT
+        usage_date as created_date,
+        SUM(prompt_tokens)::bigint as prompt_tokens,
+        SUM(completion_tokens)::bigint as completion_tokens,
+        SUM(total_tokens)::bigint as total_tokens,
+        SUM(request_count)::bigint as request_count
+    FROM usage
+    GROUP BY usage_date
+    ORDER BY usage_date DESC
+''')
+
+register('token_usage.user_models', _token_usage_window('$2::int', '$1') + '''
+    SELECT
+        model,
+        SUM(prompt_tokens)::bigint as prompt_tokens,
+        SUM(completion_tokens)::bigint as completion_tokens,
+        SUM(total_tokens)::bigint as total_tokens,
+        SUM(request_count)::bigint as request_count
+    FROM usage
+    GROUP BY model
+    ORDER BY total_tokens DESC
+''')
+
+register('token_usage.global_total', _token_usage_window('$1::int') + '''
+    SELECT
+        COALESCE(SUM(prompt_tokens), 0)::bigint as total_prompt_tokens,
+        COALESCE(SUM(completion_tokens), 0)::bigint as total_completion_tokens,
+        COALESCE(SUM(total_tokens), 0)::bigint as total_tokens,
+        COUNT(DISTINCT user_id) as unique_users,
+        COALESCE(SUM(request_count), 0)::bigint as total_requests
+    FROM usage
+''')
+
+register('token_usage.global_top_users', _token_usage_window('$1::int') + '''
+    SELECT
+        u.user_id,
+        u.username,
+        u.first_name,
+        SUM(usage.total_tokens)::bigint as total_tokens,
+        SUM(usage.request_count)::bigint as request_count
+    FROM usage
+    JOIN users u ON usage.user_id = u.user_id
+    GROUP BY u.user_id, u.username, u.first_name
+    ORDER BY total_tokens DESC
+    LIMIT 10
+''')
+
+register('token_usage.global_daily', _token_usage_window('$1::int') + '''
+    SELECT
+        usage_date as created_date,
+        SUM(prompt_tokens)::bigint as prompt_tokens,
+        SUM(completion_tokens)::bigint as completion_tokens,
+        SUM(total_tokens)::bigint as total_tokens,
+        COUNT(DISTINCT user_id) as unique_users,
+        SUM(request_count)::bigint as request_count
+    FROM usage
+    GROUP BY usage_date
+    ORDER BY usage_date DESC
+''')
+
+# Свертка: несвернутые строки дней [$1, $2] отмечаются rolled_up и прибавляются к дневным
+# итогам одним запросом - повторный прогон их уже не видит и ничего не удваивает
+register('token_rollup.lock', 'SELECT pg_try_advisory_xact_lock($1)')
+
+register('token_rollup.state', '''
+    SELECT rolled_through FROM token_usage_rollup_state WHERE name = 'daily'
+''')
+
+register('token_rollup.first_unrolled_date', '''
+    SELECT MIN(created_date) FROM token_usage WHERE NOT rolled_up AND user_id IS NOT NULL
+''')
+
+# Последний полный день: после полуночи ждем $1 минут, пока закоммитятся запоздавшие вставки
+register('token_rollup.last_complete_date', '''
+    SELECT (NOW() - make_interval(mins => $1::int))::date - 1
+''')
+
+register('token_rollup.roll_range', '''
+    WITH rolled AS (
+        UPDATE token_usage SET rolled_up = TRUE
+        WHERE NOT rolled_up AND user_id IS NOT NULL AND created_date BETWEEN $1 AND $2
+        RETURNING created_date, user_id, COALESCE(model, '') AS model,
+                  prompt_tokens, completion_tokens, total_tokens
+    )
+    INSERT INTO token_usage_daily AS d
+    (usage_date, user_id, model, prompt_tokens, completion_tokens, total_tokens, request_count)
+    SELECT created_date, user_id, model, COALESCE(SUM(prompt_tokens), 0),
+           COALESCE(SUM(completion_tokens), 0), COALESCE(SUM(total_tokens), 0), COUNT(*)
+    FROM rolled
+    GROUP BY created_date, user_id, model
+    ON CONFLICT (usage_date, user_id, model) DO UPDATE SET
+        prompt_tokens = d.prompt_tokens + EXCLUDED.prompt_tokens,
+        completion_tokens = d.completion_tokens + EXCLUDED.completion_tokens,
+        total_tokens = d.total_tokens + EXCLUDED.total_tokens,
+        request_count = d.request_count + EXCLUDED.request_count
+''')
+
+register('token_rollup.set_watermark', '''
+    INSERT INTO token_usage_rollup_state AS s (name, rolled_through, updated_at)
+    VALUES ('daily', $1, NOW())
+    ON CONFLICT (name) DO UPDATE SET
+        rolled_through = GREATEST(s.rolled_through, EXCLUDED.rolled_through),
+        updated_at = EXCLUDED.updated_at
+''')
+
+# --- bot_content ---
+
+# Полная загрузка для кэша контента user_bot
+register('content.all_active', '''
+    SELECT * FROM bot_content
+    WHERE is_active = TRUE
+    ORDER BY order_index, id
+''')
+
+register('content.by_key', 'SELECT * FROM bot_content WHERE key = $1 AND is_active = TRUE')
+
+register('content.more_buttons', '''
+    SELECT
+        id,
+        key,
+        button_text,
+        command,
+        content_text,
+        model,
+        order_index,
+        is_active
+    FROM bot_content
+    WHERE category = 'more_buttons' AND is_active = TRUE
+    ORDER BY order_index
+''')
+
+register('content.button_by_id', 'SELECT * FROM bot_content WHERE id = $1 AND is_active = TRUE')
+
+register('content.button_by_command', '''
+    SELECT
+        id,
+        key,
+        button_text,
+        command,
+        content_text,
+        model,
+        order_index
+    FROM bot_content
+    WHERE command = $1 AND is_active = TRUE
+''')
+
+register('content.upsert_button', '''
+    INSERT INTO bot_content
+    (key, button_text, command, content_text, model, order_index, category, is_active, content_type)
+    VALUES ($1, $2, $3, $4, $5, $6, 'more_buttons', TRUE, 'prompt')
+    ON CONFLICT (key) DO UPDATE SET
+        button_text = EXCLUDED.button_text,
+        command = EXCLUDED.command,
+        content_text = EXCLUDED.content_text,
+        model = EXCLUDED.model,
+        order_index = EXCLUDED.order_index,
+        is_active = TRUE
+''')
+
+register('content.support_topics', '''
+    SELECT
+        id,
+        key as name,
+        button_text as emoji,
+        content_text as description,
+        order_index,
+        is_active
+    FROM bot_content
+    WHERE category = 'support_topics' AND is_active = TRUE
+    ORDER BY order_index, id
+''')
+
+# Темы поддержки для клавиатуры user_bot: emoji разбирается из button_text
+register('content.support_topic_buttons', '''
+    SELECT
+        id,
+        key as name,
+        button_text,
+        content_text as description
+    FROM bot_content
+    WHERE category = 'support_topics' AND is_active = TRUE
+    ORDER BY order_index
+''')
+
+register('button_clicks.insert', '''
+    INSERT INTO button_clicks (user_id, button_key, button_text)
+    VALUES ($1, $2, $3)
+''')
+
+register('button_clicks.total', '''
+    SELECT
+        COUNT(*) as total_clicks,
+        COUNT(DISTINCT user_id) as unique_users
+    FROM button_clicks
+    WHERE created_at >= NOW() - make_interval(days => $1::int)
+''')
+
+register('button_clicks.by_button', '''
+    SELECT
+        button_key,
+        button_text,
+        COUNT(*) as click_count,
+        COUNT(DISTINCT user_id) as unique_users
+    FROM button_clicks
+    WHERE created_at >= NOW() - make_interval(days => $1::int)
+    GROUP BY button_key, button_text
+    ORDER BY click_count DESC
+''')
+
+# --- referrals ---
+
+register('referrals.exists', 'SELECT 1 FROM referrals WHERE referral_id = $1')
+
+register('referrals.insert', '''
+    INSERT INTO referrals (referrer_id, referral_id, referral_code)
+    VALUES ($1, $2, $3)
+''')
+
+register('referrals.referrer', 'SELECT referrer_id FROM referrals WHERE referral_id = $1')
+
+register('referrals.count', 'SELECT COUNT(*) FROM referrals WHERE referrer_id = $1')
+
+register('referrals.count_30d', '''
+    SELECT COUNT(*) FROM referrals
+    WHERE referrer_id = $1 AND created_at >= NOW() - INTERVAL '30 days'
+''')
+
+register('referrals.recent', '''
+    SELECT r.referral_id, u.first_name, u.username, r.created_at
+    FROM referrals r
+    LEFT JOIN users u ON r.referral_id = u.user_id
+    WHERE r.referrer_id = $1
+    ORDER BY r.created_at DESC
+    LIMIT 10
+''')
+
+# --- support_tickets ---
+
+register('tickets.insert', '''
+    INSERT INTO support_tickets
+    (user_id, ticket_number, topic, user_message, status, created_at)
+    VALUES ($1, $2, $3, $4, 'open', $5)
+''')
+
+register('tickets.insert_returning', '''
+    INSERT INTO support_tickets
+    (ticket_number, user_id, topic, user_message, status, created_at)
+    VALUES ($1, $2, $3, $4, 'open', $5)
+    RETURNING ticket_number
+''')
+
+register('tickets.by_user', '''
+    SELECT
+        ticket_number,
+        topic,
+        user_message,
+        admin_response,
+        status,
+        created_at,
+        updated_at
+    FROM support_tickets
+    WHERE user_id = $1
+    ORDER BY created_at DESC
+    LIMIT $2
+''')
+
+register('tickets.summary_by_number', '''
+    SELECT
+        ticket_number,
+        topic,
+        user_message,
+        admin_response,
+        status,
+        created_at,
+        updated_at,
+        user_id
+    FROM support_tickets
+    WHERE ticket_number = $1
+''')
+
+register('tickets.by_number', 'SELECT * FROM support_tickets WHERE ticket_number = $1')
+
+register('tickets.update_status', '''
+    UPDATE support_tickets
+    SET status = $1, admin_id = $2, admin_response = $3, updated_at = NOW()
+    WHERE ticket_number = $4
+''')
+
+register('tickets.open', '''
+    SELECT * FROM support_tickets
+    WHERE status IN ('open', 'in_progress')
+    ORDER BY created_at DESC
+''')
+
+register('tickets.by_admin', '''
+    SELECT * FROM support_tickets
+    WHERE admin_id = $1 AND status IN ('in_progress', 'resolved')
+    ORDER BY taken_at DESC
+''')
+
+register('tickets.assign', '''
+    UPDATE support_tickets
+    SET admin_id = $1,
+        taken_at = $2,
+        status = 'in_progress'
+    WHERE ticket_number = $3 AND status = 'open'
+    RETURNING ticket_number
+''')
+
+register('tickets.reply', '''
+    UPDATE support_tickets
+    SET admin_response = $1,
+        replied_at = $2,
+        admin_id = $3,
+        status = 'in_progress'
+    WHERE ticket_number = $4
+    RETURNING ticket_number
+''')
+
+register('tickets.close', '''
+    UPDATE support_tickets
+    SET status = 'closed',
+        updated_at = NOW()
+    WHERE ticket_number = $1 AND admin_id = $2
+    RETURNING ticket_number
+''')
+
+register('tickets.set_channel_message', '''
+    UPDATE support_tickets
+    SET channel_message_id = $1,
+        channel_thread_id = $2
+    WHERE ticket_number = $3
+    RETURNING ticket_number
+''')
+
+# --- inbox (MESSAGE_QUEUE=postgres) ---
+
+register('inbox.enqueue', '''
+    INSERT INTO inbox (user_id, chat_id, message_id, payload)
+    VALUES ($1, $2, $3, $4::jsonb)
+    ON CONFLICT (chat_id, message_id) DO NOTHING
+''')
+
+register('inbox.notify', 'SELECT pg_notify($1, $2)')
+
+register('inbox.user_depth', "SELECT COUNT(*) FROM inbox WHERE user_id = $1 AND status = 'pending'")
+
+# Кандидаты - первые строки очереди пользователей ($2/$3 - раздел) без строки в работе.
+# Отложенная (retry) первая строка задерживает и следующие сообщения пользователя
+register('inbox.claim_candidates', '''
+    SELECT id, user_id FROM (
+        SELECT DISTINCT ON (user_id) id, user_id, available_at
+        FROM inbox
+        WHERE status = 'pending' AND ($2 = 1 OR MOD(user_id, $2) = $3)
+        ORDER BY user_id, id
+    ) heads
+    WHERE available_at <= NOW()
+      AND NOT EXISTS (
+          SELECT 1 FROM inbox busy
+          WHERE busy.user_id = heads.user_id AND busy.status = 'processing'
+      )
+    ORDER BY id
+    LIMIT $1
+''')
+
+# Второй аргумент блокировки - hashtext(user_id): параметр передается как bigint и
+# приводится к тексту в SQL, asyncpg не принимает int для параметра типа text
+register('inbox.lock_user', 'SELECT pg_try_advisory_lock($1, hashtext($2::bigint::text))')
+
+register('inbox.unlock_user', 'SELECT pg_advisory_unlock($1, hashtext($2::bigint::text))')
+
+# Под блокировкой пользователя: кандидат берется, только если он все еще первый
+register('inbox.claim', '''
+    UPDATE inbox
+    SET status = 'processing', attempts = attempts + 1, claimed_by = $3, claimed_at = NOW()
+    WHERE id = $1 AND status = 'pending' AND NOT EXISTS (
+        SELECT 1 FROM inbox earlier
+        WHERE earlier.user_id = $2 AND earlier.id < $1
+          AND earlier.status IN ('pending', 'processing')
+    )
+    RETURNING id, user_id, payload::text AS payload, attempts
+''')
+
+register('inbox.processing_users', '''
+    SELECT DISTINCT user_id FROM inbox
+    WHERE status = 'processing' AND ($1 = 1 OR MOD(user_id, $1) = $2)
+''')
+
+register('inbox.recover_user', '''
+    UPDATE inbox SET status = 'pending'
+    WHERE user_id = $1 AND status = 'processing'
+''')
+
+register('inbox.complete', '''
+    UPDATE inbox SET status = 'done', processed_at = NOW(), last_error = NULL
+    WHERE id = $1
+''')
+
+register('inbox.retry', '''
+    UPDATE inbox
+    SET status = $2, last_error = $3,
+        available_at = NOW() + make_interval(secs => $4)
+    WHERE id = $1
+''')
+
+register('inbox.abandon', "UPDATE inbox SET status = 'pending' WHERE id = $1 AND status = 'processing'")
+
+register('inbox.load', '''
+    SELECT COUNT(*) FILTER (WHERE status = 'pending') AS waiting,
+           COUNT(*) FILTER (WHERE status = 'processing') AS in_progress
+    FROM inbox WHERE status IN ('pending', 'processing')
+''')
+
+register('inbox.positions', '''
+    SELECT i.chat_id, i.message_id,
+           (SELECT COUNT(*) FROM inbox p WHERE p.status = 'pending' AND p.id <= i.id) AS position
+    FROM inbox i
+    JOIN unnest($1::bigint[], $2::bigint[]) AS m(chat_id, message_id)
+      ON i.chat_id = m.chat_id AND i.message_id = m.message_id
+    WHERE i.status = 'pending'
+''')
+
+register('inbox.cleanup', '''
+    DELETE FROM inbox
+    WHERE status = 'done' AND processed_at < NOW() - make_interval(hours => $1)
+''')
+
+# --- fsm_storage ---
+
+# Состояние, не менявшееся дольше $4 часов, считается брошенным: его данные не переносятся
+register('fsm.set_state', '''
+    INSERT INTO fsm_storage (key, bot_id, state)
+    VALUES ($1, $2, $3)
+    ON CONFLICT (key) DO UPDATE SET
+        state = EXCLUDED.state,
+        data = CASE
+            WHEN fsm_storage.updated_at < NOW() - make_interval(hours => $4)
+            THEN '{}'::jsonb ELSE fsm_storage.data
+        END,
+        updated_at = NOW()
+    RETURNING data::text
+''')
+
+register('fsm.set_data', '''
+    INSERT INTO fsm_storage (key, bot_id, data)
+    VALUES ($1, $2, $3::jsonb)
+    ON CONFLICT (key) DO UPDATE SET
+        data = EXCLUDED.data,
+        state = CASE
+            WHEN fsm_storage.updated_at < NOW() - make_interval(hours => $4)
+            THEN NULL ELSE fsm_storage.state
+        END,
+        updated_at = NOW()
+    RETURNING state
+''')
+
+register('fsm.get', '''
+    SELECT state, data::text AS data FROM fsm_storage
+    WHERE key = $1 AND updated_at >= NOW() - make_interval(hours => $2)
+''')
+
+register('fsm.cleanup', '''
+    DELETE FROM fsm_storage
+    WHERE updated_at < NOW() - make_interval(hours => $1)
+       OR (state IS NULL AND data = '{}'::jsonb)
+''')
+
+# --- processed_updates (вебхук) ---
+
+register('updates.claim', '''
+    INSERT INTO processed_updates (bot_id, update_id, payload)
+    VALUES ($1, $2, $3::jsonb)
+    ON CONFLICT DO NOTHING
+    RETURNING update_id
+''')
+
+register('updates.complete', '''
+    UPDATE processed_updates SET processed_at = NOW(), payload = NULL
+    WHERE bot_id = $1 AND update_id = $2
+''')
+
+register('updates.pending', '''
+    SELECT update_id, payload::text AS payload FROM processed_updates
+    WHERE bot_id = $1 AND processed_at IS NULL AND payload IS NOT NULL
+    ORDER BY update_id
+''')
+
+register('updates.cleanup', '''
+    DELETE FROM processed_updates
+    WHERE bot_id = $1 AND received_at < NOW() - make_interval(hours => $2)
+''')
+
+# --- bot_leader (hot standby) ---
+
+register('leader.lock', 'SELECT pg_try_advisory_lock($1, hashtext($2))')
+
+register('leader.previous', '''
+    SELECT holder, EXTRACT(EPOCH FROM (NOW() - renewed_at)) AS silent_for
+    FROM bot_leader WHERE name = $1
+''')
+
+register('leader.acquire', '''
+    INSERT INTO bot_leader (name, holder, backend_pid, acquired_at, renewed_at, lease_until)
+    VALUES ($1, $2, pg_backend_pid(), NOW(), NOW(), NOW() + make_interval(secs => $3))
+    ON CONFLICT (name) DO UPDATE SET
+        holder = EXCLUDED.holder,
+        backend_pid = EXCLUDED.backend_pid,
+        acquired_at = EXCLUDED.acquired_at,
+        renewed_at = EXCLUDED.renewed_at,
+        lease_until = EXCLUDED.lease_until
+''')
+
+register('leader.renew', '''
+    UPDATE bot_leader SET renewed_at = NOW(), lease_until = NOW() + make_interval(secs => $3)
+    WHERE name = $1 AND holder = $2
+    RETURNING 1
+''')
+
+register('leader.release',
+         'UPDATE bot_leader SET lease_until = NOW(), renewed_at = NOW() WHERE name = $1 AND holder = $2')
+
+register('leader.expired', '''
+    SELECT holder, backend_pid FROM bot_leader
+    WHERE name = $1 AND lease_until < NOW()
+''')
+
+# Сессия зависшего ведущего, которая держит блокировку ($1, hashtext($2))
+register('leader.terminate', '''
+    SELECT pg_terminate_backend(pid) FROM pg_locks
+    WHERE locktype = 'advisory' AND granted
+      AND classid = $1 AND objid = hashtext($2)::oid AND objsubid = 2 AND pid = $3
+''')
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+from .database import Database
+from .queries import queries
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: свертку в один момент делает один процесс
+TOKEN_ROLLUP_LOCK_KEY = 7303
+
+
+class TokenUsageRollup:
+    """
+    Фоновая свертка token_usage в token_usage_daily по (дата, пользователь, модель).
+    Свернутые сырые строки отмечаются rolled_up в том же запросе, что прибавляет их
+    к дневным итогам; отчеты берут свернутое из token_usage_daily, а остальное - из
+    token_usage. Сворачиваются дни, закончившиеся не меньше чем grace_minutes назад.
+    Строки, записанные позже свертки своего дня (буфер LogWriter во время сбоя БД),
+    не теряются: следующий прогон прибавляет их к итогам того же дня.
+    Водяной знак rolled_through - последний свернутый полный день (для статистики)
+    """
+
+    def __init__(self, database: Database, interval: float = 300.0, grace_minutes: int = 10,
+                 batch_days: int = 31):
+        self.db = database
+        self.interval = interval
+        self.grace_minutes = grace_minutes
+        self.batch_days = max(1, batch_days)
+        self._task: Optional[asyncio.Task] = None
+        self._rolled_through: Optional[date] = None
+        self._days_rolled = 0
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="token-rollup")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def catch_up(self) -> int:
+        """Сворачивает все полные дни после водяного знака. Возвращает число дней"""
+        total = 0
+        while True:
+            rolled = await self._roll_batch()
+            total += rolled
+            if rolled < self.batch_days:
+                return total
+
+    async def _roll_batch(self) -> int:
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                if not await queries.fetchval(conn, 'token_rollup.lock', TOKEN_ROLLUP_LOCK_KEY):
+                    # Сворачивает другой процесс
+                    return 0
+
+                # Самый ранний день с несвернутыми строками - в том числе запоздавшие
+                start = await queries.fetchval(conn, 'token_rollup.first_unrolled_date')
+                if start is None:
+                    return 0
+                last_complete = await queries.fetchval(
+                    conn, 'token_rollup.last_complete_date', self.grace_minutes
+                )
+                end = min(last_complete, start + timedelta(days=self.batch_days - 1))
+                if start > end:
+                    self._rolled_through = await queries.fetchval(conn, 'token_rollup.state')
+                    return 0
+
+                await queries.execute(conn, 'token_rollup.roll_range', start, end)
+                await queries.execute(conn, 'token_rollup.set_watermark', end)
+                rolled_through = await queries.fetchval(conn, 'token_rollup.state')
+
+        days = (end - start).days + 1
+        self._rolled_through = rolled_through
+        self._days_rolled += days
+        logger.info(f"✅ Token usage rolled up: {start} .. {end} ({days} days)")
+        return days
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.catch_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Token usage rollup failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'rolled_through': self._rolled_through.isoformat() if self._rolled_through else None,
+            'days_rolled_total': self._days_rolled
+        }
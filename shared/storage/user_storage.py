@@ -1,15 +1,29 @@
 import logging
 from typing import Optional, Dict, Any, List
+import asyncpg
 from .database import Database
 from .content_storage import ContentStorage
 from .referral_storage import ReferralStorage
 from .ticket_storage import TicketStorage
+from .admin_cache import AdminCache
+from .token_rollup import TokenUsageRollup
 
 logger = logging.getLogger(__name__)
 
 class UserStorage:
-    def __init__(self, database_url: str):
-        self.db = Database(database_url)
+    def __init__(self, database_url: str, super_admin_id: int = 0, pool: Optional[asyncpg.Pool] = None,
+                 admin_refresh_interval: float = 300.0, admin_denied_ttl: float = 60.0,
+                 token_rollup_interval: float = 300.0, token_rollup_grace_minutes: int = 10):
+        self.db = Database(database_url, pool=pool)
+        self.super_admin_id = super_admin_id
+        # Права админов проверяются по множеству в памяти, обновляемому по NOTIFY
+        self.admin_cache = AdminCache(
+            self.db, refresh_interval=admin_refresh_interval, denied_ttl=admin_denied_ttl
+        )
+        # Отчеты по токенам читают дневную свертку; досворачивает ее админ-бот
+        self.token_rollup = TokenUsageRollup(
+            self.db, interval=token_rollup_interval, grace_minutes=token_rollup_grace_minutes
+        )
         self.content_storage: Optional[ContentStorage] = None
         self.referral_storage: Optional[ReferralStorage] = None
         self.ticket_storage: Optional[TicketStorage] = None
@@ -20,10 +34,14 @@ class UserStorage:
         self.content_storage = ContentStorage(self.db)
         self.referral_storage = ReferralStorage(self.db)
         self.ticket_storage = TicketStorage(self.db)
+        await self.admin_cache.start()
+        await self.token_rollup.start()
         logger.info("✅ All storages initialized")
     
     async def close(self):
         """Закрывает подключение к базе данных"""
+        await self.token_rollup.stop()
+        await self.admin_cache.stop()
         await self.db.close()
     
     async def save_user_from_message(self, message) -> bool:
@@ -64,8 +82,7 @@ class UserStorage:
     
     async def get_active_users_count(self, days: int = 30) -> int:
         """Получает количество активных пользователей"""
-        users = await self.db.get_active_users(days)
-        return len(users)
+        return await self.db.count_active_users(days)
     
     async def log_message(self, user_id: int, message_text: str, message_type: str, 
                          openai_thread_id: Optional[str] = None, 
@@ -91,24 +108,37 @@ class UserStorage:
     # Методы для работы с админами
     async def add_admin(self, user_id: int, username: str, first_name: str, added_by: int) -> bool:
         """Добавляет пользователя в список админов"""
-        return await self.db.add_admin(user_id, username, first_name, added_by)
+        added = await self.db.add_admin(user_id, username, first_name, added_by)
+        if added:
+            # Триггер на admins разбудит остальные процессы, этот перечитает сразу
+            self.admin_cache.invalidate()
+        return added
     
     async def remove_admin(self, user_id: int) -> bool:
         """Удаляет пользователя из списка админов"""
-        return await self.db.remove_admin(user_id)
+        removed = await self.db.remove_admin(user_id)
+        if removed:
+            self.admin_cache.invalidate()
+        return removed
     
     async def is_admin(self, user_id: int) -> bool:
-        """Проверяет является ли пользователь админом"""
+        """Проверяет является ли пользователь админом (в БД - только пока кэш не загружен)"""
+        cached = self.admin_cache.is_admin(user_id)
+        if cached is not None:
+            return cached
         return await self.db.is_admin(user_id)
     
+    async def has_admin_access(self, user_id: int) -> bool:
+        """Админ или суперадмин"""
+        return user_id == self.super_admin_id or await self.is_admin(user_id)
+    
     async def get_all_admins(self) -> List[Dict[str, Any]]:
         """Получает список всех админов"""
         return await self.db.get_all_admins()
     
     async def is_super_admin(self, user_id: int) -> bool:
         """Проверяет является ли пользователь суперадмином"""
-        from config import config
-        return user_id == config.SUPER_ADMIN_ID
+        return user_id == self.super_admin_id
     
     # Методы для работы с токенами
     async def add_token_usage(self, user_id: int, thread_id: Optional[str], message_id: Optional[str], 
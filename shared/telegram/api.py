@@ -0,0 +1,28 @@
+"""
+Создание экземпляра Bot с настраиваемым адресом Bot API
+"""
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+
+def create_session(api_url: str = "") -> AiohttpSession:
+    """HTTP-сессия к Bot API; одну сессию могут использовать несколько ботов"""
+    if not api_url:
+        return AiohttpSession()
+    return AiohttpSession(api=TelegramAPIServer.from_base(api_url.rstrip('/')))
+
+
+def create_bot(token: str, api_url: str = "", session: Optional[AiohttpSession] = None) -> Bot:
+    """
+    Создает Bot. Если указан api_url (локальный Bot API сервер или
+    тестовая заглушка), все запросы идут на него вместо api.telegram.org.
+    Переданная session (общая для нескольких ботов) используется как есть
+    """
+    if session is not None:
+        return Bot(token=token, session=session)
+    if not api_url:
+        return Bot(token=token)
+    return Bot(token=token, session=create_session(api_url))
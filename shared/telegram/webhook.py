@@ -0,0 +1,259 @@
+"""
+Прием обновлений через вебхук: aiohttp сервер, проверка секрета,
+дедупликация по update_id и ограниченная очередь приема
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from shared.storage.queries import queries
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class UpdateDeduplicator:
+    """
+    Помнит принятые update_id в таблице processed_updates, чтобы повторная
+    доставка того же обновления (ретрай Telegram, рестарт) не обрабатывалась дважды.
+    Последние id дополнительно держатся в памяти.
+
+    Вместе с id сохраняется само обновление, а processed_at ставится только после
+    обработки: Telegram не повторяет обновление, на которое уже получил 200, поэтому
+    то, что не успели обработать до остановки или падения, берется из таблицы при
+    следующем запуске (pending()).
+    """
+
+    def __init__(self, db, bot_id: int, cache_size: int = 10000, retention_hours: int = 48):
+        self.db = db
+        self.bot_id = bot_id
+        self.cache_size = cache_size
+        self.retention_hours = retention_hours
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+
+    async def initialize(self):
+        """Создает таблицу обработанных обновлений"""
+        async with self.db.get_connection() as conn:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS processed_updates (
+                    bot_id BIGINT NOT NULL,
+                    update_id BIGINT NOT NULL,
+                    received_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    PRIMARY KEY (bot_id, update_id)
+                )
+            ''')
+            await conn.execute('''
+                ALTER TABLE processed_updates
+                ADD COLUMN IF NOT EXISTS payload JSONB,
+                ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP WITH TIME ZONE
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_processed_updates_received_at
+                ON processed_updates(received_at)
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_processed_updates_pending
+                ON processed_updates(bot_id, update_id) WHERE processed_at IS NULL
+            ''')
+
+    async def claim(self, update_id: int, payload: Optional[Dict[str, Any]] = None) -> bool:
+        """Сохраняет обновление до обработки. Возвращает True, если оно пришло впервые"""
+        if update_id in self._recent:
+            return False
+
+        try:
+            async with self.db.get_connection() as conn:
+                inserted = await queries.fetchval(
+                    conn, 'updates.claim', self.bot_id, update_id,
+                    json.dumps(payload, ensure_ascii=False) if payload is not None else None
+                )
+        except Exception as e:
+            # Лучше обработать дубль, чем потерять сообщение
+            logger.error(f"❌ Failed to persist update_id={update_id}: {e}")
+            inserted = update_id
+
+        self._remember(update_id)
+        return inserted is not None
+
+    async def complete(self, update_id: int) -> None:
+        """Отмечает обновление обработанным (сохраненная копия больше не нужна)"""
+        try:
+            async with self.db.get_connection() as conn:
+                await queries.execute(conn, 'updates.complete', self.bot_id, update_id)
+        except Exception as e:
+            # Обновление обработано; в худшем случае оно повторится после рестарта
+            logger.error(f"❌ Failed to mark update_id={update_id} processed: {e}")
+
+    async def pending(self) -> List[Dict[str, Any]]:
+        """Принятые, но не обработанные обновления (остались с прошлого запуска)"""
+        try:
+            async with self.db.get_connection() as conn:
+                rows = await queries.fetch(conn, 'updates.pending', self.bot_id)
+        except Exception as e:
+            logger.error(f"❌ Failed to load pending updates: {e}")
+            return []
+        for row in rows:
+            self._remember(row['update_id'])
+        return [json.loads(row['payload']) for row in rows]
+
+    async def cleanup(self) -> None:
+        """Удаляет старые записи"""
+        try:
+            async with self.db.get_connection() as conn:
+                await queries.execute(conn, 'updates.cleanup', self.bot_id, self.retention_hours)
+        except Exception as e:
+            logger.error(f"❌ Failed to clean processed updates: {e}")
+
+    def _remember(self, update_id: int):
+        self._recent[update_id] = None
+        while len(self._recent) > self.cache_size:
+            self._recent.popitem(last=False)
+
+
+class WebhookServer:
+    """
+    aiohttp сервер вебхука. Ответ 200 отдается только после того, как обновление
+    записано и поставлено в очередь приема; если очередь полна - отвечаем 503,
+    и Telegram доставит обновление повторно. Обновления, которые остались в очереди
+    при остановке или падении, обрабатываются при следующем запуске.
+    """
+
+    def __init__(self, bot: Bot, dispatcher: Dispatcher, deduplicator: UpdateDeduplicator,
+                 base_url: str, path: str, secret_token: str,
+                 host: str = "0.0.0.0", port: int = 8080,
+                 allowed_updates: Optional[List[str]] = None,
+                 intake_size: int = 1000, consumers: int = 4):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.deduplicator = deduplicator
+        self.url = base_url.rstrip('/') + path
+        self.path = path
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.allowed_updates = allowed_updates
+        self.consumers = max(1, consumers)
+
+        self._intake: asyncio.Queue = asyncio.Queue(maxsize=intake_size)
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopped = asyncio.Event()
+
+    def create_app(self) -> web.Application:
+        """Создает aiohttp приложение (отдельно - чтобы его можно было поднять в тестах)"""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get('/healthz', self._handle_health)
+        return app
+
+    async def start(self):
+        """Поднимает сервер, запускает обработчики очереди и регистрирует вебхук"""
+        self._tasks = [
+            asyncio.create_task(self._consume(), name=f"webhook-intake-{index}")
+            for index in range(self.consumers)
+        ]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop(), name="webhook-dedup-cleanup"))
+
+        # Принятые прошлым запуском, но не обработанные обновления - в очередь раньше новых
+        pending = await self.deduplicator.pending()
+        if pending:
+            logger.info(f"♻️ Replaying {len(pending)} updates left from the previous run")
+        for data in pending:
+            await self._intake.put(data)
+
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        # Накопившиеся обновления НЕ сбрасываем - они придут после регистрации
+        await self.bot.set_webhook(
+            url=self.url,
+            secret_token=self.secret_token,
+            allowed_updates=self.allowed_updates,
+            drop_pending_updates=False
+        )
+        logger.info(f"✅ Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def serve_forever(self):
+        """Ждет остановки сервера"""
+        await self._stopped.wait()
+
+    async def stop(self, timeout: float = 10.0):
+        """Прекращает прием и дообрабатывает очередь (вебхук в Telegram не удаляется)"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        try:
+            await asyncio.wait_for(self._intake.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"⚠️ Webhook intake not drained, {self._intake.qsize()} updates left for the next start"
+            )
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._stopped.set()
+        logger.info("✅ Webhook server stopped")
+
+    @property
+    def intake_depth(self) -> int:
+        return self._intake.qsize()
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'intake': self._intake.qsize()})
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if request.headers.get(SECRET_HEADER) != self.secret_token:
+            logger.warning(f"⚠️ Webhook request with invalid secret from {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            data = await request.json()
+            update_id = int(data['update_id'])
+        except Exception:
+            return web.Response(status=400)
+
+        if self._intake.full():
+            logger.warning(f"⚠️ Webhook intake full, asking Telegram to retry update_id={update_id}")
+            return web.Response(status=503)
+
+        if not await self.deduplicator.claim(update_id, data):
+            logger.info(f"♻️ Duplicate update skipped: update_id={update_id}")
+            return web.Response()
+
+        await self._intake.put(data)
+        return web.Response()
+
+    async def _consume(self):
+        while True:
+            data = await self._intake.get()
+            try:
+                # Отмена во время остановки оставляет обновление необработанным - оно повторится
+                await self._process(data)
+                await self.deduplicator.complete(data['update_id'])
+            finally:
+                self._intake.task_done()
+
+    async def _process(self, data: Dict[str, Any]):
+        """Обработка обновления. Ошибка обработчика не повторяется - обновление считается обработанным"""
+        try:
+            update = Update.model_validate(data, context={"bot": self.bot})
+            await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"❌ Failed to process update_id={data.get('update_id')}: {e}", exc_info=True)
+
+    async def _cleanup_loop(self):
+        while True:
+            await self.deduplicator.cleanup()
+            await asyncio.sleep(3600)
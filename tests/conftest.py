@@ -0,0 +1,12 @@
+"""
+Тесты хранилищ против настоящего PostgreSQL. Без TEST_DATABASE_URL они пропускаются.
+Код user_bot импортируется как в рабочем процессе: пакет app из каталога user_bot,
+общие модули - из корня репозитория
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'user_bot')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,46 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+USER_IDS = [9_000_000_000_101, 9_000_000_000_102]
+
+
+def test_flush_updates_users_in_batches():
+    async def check():
+        from app.storage.activity_aggregator import ActivityAggregator
+        from app.storage.database import Database
+
+        db = Database(DATABASE_URL, pool=await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=2))
+        try:
+            await db.connect()
+            await db.pool.execute('DELETE FROM users WHERE user_id = ANY($1::bigint[])', USER_IDS)
+            await db.pool.execute('''
+                INSERT INTO users (user_id, last_activity, message_count)
+                SELECT unnest($1::bigint[]), NOW() - INTERVAL '1 day', 1
+            ''', USER_IDS)
+
+            now = datetime.now(timezone.utc)
+            aggregator = ActivityAggregator(db, batch_size=1)
+            aggregator.record(USER_IDS[0], at=now)
+            aggregator.record(USER_IDS[0], at=now - timedelta(minutes=5))
+            aggregator.record(USER_IDS[1], messages=3, at=now)
+
+            assert await aggregator.flush() == 2
+            rows = await db.pool.fetch('''
+                SELECT user_id, last_activity, message_count FROM users
+                WHERE user_id = ANY($1::bigint[]) ORDER BY user_id
+            ''', USER_IDS)
+            assert [(row['user_id'], row['message_count']) for row in rows] == [(USER_IDS[0], 3), (USER_IDS[1], 4)]
+            assert all(row['last_activity'] == now for row in rows)
+        finally:
+            await db.pool.execute('DELETE FROM users WHERE user_id = ANY($1::bigint[])', USER_IDS)
+            await db.pool.close()
+
+    asyncio.run(check())
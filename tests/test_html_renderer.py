@@ -0,0 +1,48 @@
+import re
+
+import pytest
+
+from app.bot.html_renderer import StreamingHtmlRenderer, markdown_to_html
+
+EMPTY_TAG_RE = re.compile(r'<(\w+)[^>]*></\1>')
+
+
+def _stream(text: str, chunk: int = 37, max_block_chars: int = 3000):
+    """Отдает ответ рендереру кусками и возвращает все промежуточные и финальные блоки"""
+    renderer = StreamingHtmlRenderer(max_block_chars=max_block_chars)
+    drafts = []
+    for start in range(0, len(text), chunk):
+        renderer.feed(text[start:start + chunk])
+        drafts.extend(html for _, html in renderer.blocks())
+    return drafts, [html for _, html in renderer.blocks(final=True)]
+
+
+def test_arithmetic_is_not_emphasis():
+    assert markdown_to_html('2 * 3 * 4') == '2 * 3 * 4'
+    assert markdown_to_html('* item\n* item') == '* item\n* item'
+    assert markdown_to_html('a *b* **c** snake_case') == 'a <i>b</i> <b>c</b> snake_case'
+
+
+def test_draft_has_no_empty_tags():
+    for text in ('Hello *', 'Hello **', '# ', '```python\n', 'text `'):
+        drafts, _ = _stream(text, chunk=1)
+        assert not any(EMPTY_TAG_RE.search(html) for html in drafts), text
+
+
+@pytest.mark.parametrize('text', [
+    'word' * 3000,
+    'lorem ipsum ' * 800,
+    '<&>' * 3000,
+    '```python\n' + '\n'.join(f'x = {i} < {i + 1} & "{i}"' for i in range(800)) + '\n```',
+])
+def test_blocks_fit_limit(text):
+    drafts, final = _stream(text)
+    assert max(len(html) for html in drafts + final) <= 3000
+
+
+def test_long_code_block_is_reopened():
+    code = '\n'.join(f'line_{i} = {i}' for i in range(600))
+    _, final = _stream(f'```python\n{code}\n```\nAfter')
+    assert len(final) > 2
+    assert all(html.startswith('<pre><code class="language-python">') for html in final[:-1])
+    assert final[-1] == 'After'
@@ -0,0 +1,146 @@
+import asyncio
+import os
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+# Большой id проверяет, что ключ блокировки строится из bigint
+USER_ID = 9_000_000_000_001
+CHAT_ID = USER_ID
+OTHER_USER_ID = 9_000_000_000_002
+
+
+async def _with_inbox(check, **options):
+    from app.storage.database import Database
+    from app.storage.inbox_storage import InboxStorage
+
+    db = Database(DATABASE_URL)
+    db.pool = await asyncpg.create_pool(DATABASE_URL, min_size=2, max_size=4)
+    inbox = InboxStorage(db, **options)
+    try:
+        await inbox.initialize()
+        await db.pool.execute('DELETE FROM inbox WHERE user_id = ANY($1::bigint[])', [USER_ID, OTHER_USER_ID])
+        await check(inbox)
+    finally:
+        await db.pool.execute('DELETE FROM inbox WHERE user_id = ANY($1::bigint[])', [USER_ID, OTHER_USER_ID])
+        await db.pool.close()
+
+
+def test_claim_locks_user_until_complete():
+    async def check(inbox):
+        assert await inbox.enqueue(USER_ID, CHAT_ID, 1, {'text': 'first'}) == 1
+        assert await inbox.enqueue(USER_ID, CHAT_ID, 2, {'text': 'second'}) == 2
+
+        claim = await inbox.claim('worker-1')
+        assert claim is not None
+        assert claim.user_id == USER_ID
+        assert claim.payload == {'text': 'first'}
+
+        # Пока первое сообщение в работе, второе того же пользователя не выдается
+        assert await inbox.claim('worker-2') is None
+
+        assert await inbox.complete(claim)
+        claim = await inbox.claim('worker-2')
+        assert claim is not None
+        assert claim.payload == {'text': 'second'}
+        assert await inbox.complete(claim)
+
+        assert await inbox.claim('worker-1') is None
+
+    asyncio.run(_with_inbox(check))
+
+
+def test_retry_releases_user_lock():
+    async def check(inbox):
+        await inbox.enqueue(USER_ID, CHAT_ID, 1, {'text': 'first'})
+
+        claim = await inbox.claim('worker-1')
+        assert claim is not None
+        assert await inbox.retry(claim, 'boom', delay=0.0)
+
+        claim = await inbox.claim('worker-2')
+        assert claim is not None
+        assert claim.attempts == 2
+        await inbox.abandon(claim)
+
+    asyncio.run(_with_inbox(check))
+
+
+def test_positions_follow_pending_rows():
+    async def check(inbox):
+        for message_id in (1, 2, 3):
+            await inbox.enqueue(USER_ID, CHAT_ID, message_id, {'text': str(message_id)})
+
+        keys = [(CHAT_ID, 1), (CHAT_ID, 3), (CHAT_ID, 404)]
+        positions = await inbox.positions(keys)
+        assert set(positions) == {(CHAT_ID, 1), (CHAT_ID, 3)}
+        assert positions[(CHAT_ID, 3)] - positions[(CHAT_ID, 1)] == 2
+
+        # Обработанное сообщение выходит из очереди, следующие сдвигаются
+        claim = await inbox.claim('worker-1')
+        assert await inbox.complete(claim)
+        after = await inbox.positions(keys)
+        assert set(after) == {(CHAT_ID, 3)}
+        assert after[(CHAT_ID, 3)] == positions[(CHAT_ID, 3)] - 1
+
+    asyncio.run(_with_inbox(check))
+
+
+def test_busy_user_does_not_hide_other_users():
+    async def check(inbox):
+        # Очередь занятого пользователя длиннее окна кандидатов
+        for message_id in range(1, 5):
+            await inbox.enqueue(USER_ID, CHAT_ID, message_id, {'text': str(message_id)})
+        await inbox.enqueue(OTHER_USER_ID, OTHER_USER_ID, 1, {'text': 'other'})
+
+        busy = await inbox.claim('worker-1')
+        assert busy.user_id == USER_ID
+
+        other = await inbox.claim('worker-2')
+        assert other is not None
+        assert other.user_id == OTHER_USER_ID
+        assert await inbox.complete(other)
+        assert await inbox.complete(busy)
+
+    asyncio.run(_with_inbox(check, claim_batch=2))
+
+
+def test_recover_returns_rows_of_dead_workers():
+    async def check(inbox):
+        await inbox.enqueue(USER_ID, CHAT_ID, 1, {'text': 'first'})
+        claim = await inbox.claim('worker-1')
+
+        # Пока блокировка держится, строка в работе
+        assert await inbox.recover() == 0
+        assert await inbox.claim('worker-2') is None
+
+        # Соединение воркера умерло вместе с блокировкой, строка осталась processing
+        await claim.conn.close()
+        await inbox.db.pool.release(claim.conn)
+        assert await inbox.recover() == 1
+
+        claim = await inbox.claim('worker-2')
+        assert claim is not None
+        assert claim.attempts == 2
+        assert await inbox.complete(claim)
+
+    asyncio.run(_with_inbox(check))
+
+
+def test_load_and_user_depth():
+    async def check(inbox):
+        waiting, in_progress = await inbox.load()
+        for message_id in (1, 2, 3):
+            await inbox.enqueue(USER_ID, CHAT_ID, message_id, {'text': str(message_id)})
+        assert await inbox.user_depth(USER_ID) == 3
+
+        claim = await inbox.claim('worker-1')
+        assert await inbox.user_depth(USER_ID) == 2
+        assert await inbox.load() == (waiting + 2, in_progress + 1)
+        assert await inbox.complete(claim)
+
+    asyncio.run(_with_inbox(check))
@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+USER_ID = 9_000_000_000_201
+# Сдвиг +14 часов: дата сессии почти всегда отличается от даты процесса в UTC
+SESSION_TIMEZONE = 'Pacific/Kiritimati'
+
+
+def test_token_usage_date_uses_session_timezone():
+    async def check():
+        from app.storage.database import Database
+        from app.storage.log_writer import LogWriter
+
+        pool = await asyncpg.create_pool(
+            DATABASE_URL, min_size=1, max_size=2, server_settings={'timezone': SESSION_TIMEZONE}
+        )
+        db = Database(DATABASE_URL, pool=pool)
+        try:
+            await db.connect()
+            await db.pool.execute('DELETE FROM users WHERE user_id = $1', USER_ID)
+            await db.pool.execute('INSERT INTO users (user_id) VALUES ($1)', USER_ID)
+
+            writer = LogWriter(db)
+            assert await writer.write('token_usage', (USER_ID, 'thread', 'msg', 'model', 1, 2, 3))
+            created_at = writer._buffers['token_usage'][0][-1]
+
+            assert await writer.flush() == 1
+            row = await db.pool.fetchrow('''
+                SELECT created_at, created_date, created_at::date AS session_date, total_tokens
+                FROM token_usage WHERE user_id = $1
+            ''', USER_ID)
+            assert row['created_at'] == created_at
+            # Дата - от created_at, в часовом поясе сессии (как CURRENT_DATE и свертка)
+            assert row['created_date'] == row['session_date']
+            assert row['total_tokens'] == 3
+        finally:
+            # Строки token_usage удаляются каскадно
+            await db.pool.execute('DELETE FROM users WHERE user_id = $1', USER_ID)
+            await db.pool.close()
+
+    asyncio.run(check())
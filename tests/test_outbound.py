@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+from app.helpers.outbound import OutboundScheduler
+
+
+class FakeBot:
+    """Записывает вызовы; первая правка сообщения flood_message_id получает 429"""
+
+    def __init__(self, flood_message_id=None):
+        self.calls = []
+        self.flood_message_id = flood_message_id
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(('send', chat_id, text))
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        if message_id == self.flood_message_id:
+            self.flood_message_id = None
+            method = EditMessageText(text=text, chat_id=chat_id, message_id=message_id)
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.2)
+        self.calls.append(('edit', chat_id, text))
+
+    async def send_chat_action(self, chat_id, action):
+        self.calls.append(('action', chat_id, action))
+
+
+def _scheduler(bot) -> OutboundScheduler:
+    return OutboundScheduler(bot, global_rate=1000, chat_interval=0, edit_interval=0)
+
+
+def test_send_does_not_overtake_deferred_edit():
+    async def check():
+        bot = FakeBot(flood_message_id=10)
+        outbound = _scheduler(bot)
+        await outbound.start()
+        edit = outbound.edit_text(1, 10, "page 1")
+        send = outbound.send_message(1, "page 2")
+        other = outbound.send_message(2, "other chat")
+        await asyncio.gather(edit, send, other)
+        await outbound.stop()
+
+        chat_calls = [call for call in bot.calls if call[1] == 1]
+        assert chat_calls == [('edit', 1, "page 1"), ('send', 1, "page 2")]
+        # Другой чат не ждет отложенную правку
+        assert bot.calls[0] == ('send', 2, "other chat")
+
+    asyncio.run(check())
+
+
+def test_send_waits_for_throttled_edit():
+    async def check():
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000, chat_interval=0, edit_interval=0.3)
+        await outbound.start()
+        await outbound.edit_text(1, 10, "draft")
+        # Следующая правка ждет интервал правок - отправка за ней не должна ее обогнать
+        final = outbound.edit_text(1, 10, "final")
+        send = outbound.send_message(1, "next page")
+        await asyncio.gather(final, send)
+        await outbound.stop()
+
+        assert bot.calls == [('edit', 1, "draft"), ('edit', 1, "final"), ('send', 1, "next page")]
+
+    asyncio.run(check())
+
+
+def test_edits_coalesce_in_place():
+    async def check():
+        bot = FakeBot()
+        outbound = _scheduler(bot)
+        outbound.edit_text(1, 10, "draft 1")
+        outbound.send_message(1, "next")
+        outbound.edit_text(1, 10, "draft 2")
+        await outbound.start()
+        await outbound.stop()
+
+        assert bot.calls == [('edit', 1, "draft 2"), ('send', 1, "next")]
+        assert outbound.stats()['coalesced_total'] == 1
+
+    asyncio.run(check())
+
+
+def test_idle_chat_intervals_are_swept():
+    async def check():
+        bot = FakeBot()
+        outbound = OutboundScheduler(bot, global_rate=1000, chat_interval=0.05, edit_interval=0)
+        await outbound.start()
+        await asyncio.gather(*(outbound.send_message(chat_id, "hi") for chat_id in range(1, 4)))
+        assert len(outbound._chat_next) == 3
+
+        outbound.send_message(4, "queued")
+        outbound._sweep(time.monotonic() + 1)
+        # Остается только чат, у которого есть операция
+        assert set(outbound._chat_next) <= {4}
+        await outbound.stop()
+
+    asyncio.run(check())
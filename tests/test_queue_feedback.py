@@ -0,0 +1,64 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from app.bot.queue_feedback import QueueFeedback, StageLatency
+
+
+class FakeOutbound:
+    def __init__(self):
+        self.edits = []
+        self._next_id = 100
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self._next_id += 1
+        return SimpleNamespace(message_id=self._next_id)
+
+    def edit_text(self, chat_id, message_id, text, **kwargs):
+        self.edits.append((chat_id, message_id, text))
+
+
+def test_positions_come_from_the_queue():
+    async def check():
+        outbound = FakeOutbound()
+        requested = []
+
+        async def positions(messages):
+            requested.append(messages)
+            # Сообщение 2 уже ушло из очереди
+            return {(1, 1): 7}
+
+        feedback = QueueFeedback(outbound, StageLatency(defaults={'llm': 30.0}), parallelism=2,
+                                 positions=positions)
+        first = await feedback.announce(1, 1, position=1)
+        second = await feedback.announce(1, 2, position=2)
+
+        await feedback._update_positions()
+
+        assert requested == [[(1, 1), (1, 2)]]
+        assert [(chat_id, message_id) for chat_id, message_id, _ in outbound.edits] == [(1, first)]
+        assert "7-й" in outbound.edits[0][2]
+        assert feedback.stats()['announced_waiting'] == 1
+        assert second not in [message_id for _, message_id in feedback._waiting]
+
+    asyncio.run(check())
+
+
+def test_failed_lookup_keeps_placeholders():
+    async def check():
+        outbound = FakeOutbound()
+
+        async def positions(messages):
+            return None
+
+        feedback = QueueFeedback(outbound, StageLatency(), parallelism=1, positions=positions)
+        await feedback.announce(1, 1, position=1)
+        await feedback._update_positions()
+
+        assert outbound.edits == []
+        assert feedback.stats()['announced_waiting'] == 1
+
+    asyncio.run(check())
@@ -0,0 +1,61 @@
+import asyncio
+import itertools
+
+import pytest
+
+pytest.importorskip("aiogram")
+
+from app.bot.stream_display import PAGE_LIMIT, StreamingAnswer
+
+
+class FakeOutbound:
+    """Планировщик без Telegram: запоминает последний текст каждого сообщения"""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.texts = {}
+
+    def edit_interval(self) -> float:
+        return 0
+
+    def edit_text(self, chat_id, message_id, text, **kwargs):
+        self.texts[message_id] = text
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def send_message(self, chat_id, text, **kwargs):
+        message_id = next(self._ids)
+        self.texts[message_id] = text
+
+        class Message:
+            pass
+
+        message = Message()
+        message.message_id = message_id
+        return message
+
+    def forget_message(self, chat_id, message_id):
+        pass
+
+
+async def _stream(text: str, chunk: int):
+    outbound = FakeOutbound()
+    answer = StreamingAnswer(outbound, chat_id=1)
+    await answer.start()
+    for start in range(0, len(text), chunk):
+        await answer.feed(text[start:start + chunk])
+    return await answer.finish(), outbound.texts
+
+
+@pytest.mark.parametrize('text', [
+    'word' * 3000,
+    '```python\n' + '\n'.join(f'x = {i} < {i + 1}' for i in range(1500)) + '\n```',
+    '<&> ' * 3000,
+])
+@pytest.mark.parametrize('chunk', [5, 200])
+def test_pages_fit_telegram_limit(text, chunk):
+    finished, texts = asyncio.run(_stream(text, chunk))
+    assert finished
+    assert len(texts) > 1
+    assert max(len(page) for page in texts.values()) <= PAGE_LIMIT
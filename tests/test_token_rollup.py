@@ -0,0 +1,67 @@
+import asyncio
+import os
+from datetime import timedelta
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+USER_ID = 9_000_000_000_301
+
+
+async def _insert_usage(db, usage_date, total_tokens):
+    await db.pool.execute('''
+        INSERT INTO token_usage (user_id, model, total_tokens, created_date)
+        VALUES ($1, 'model', $2, $3)
+    ''', USER_ID, total_tokens, usage_date)
+
+
+def test_late_rows_of_rolled_day_are_counted():
+    async def check():
+        from shared.storage.database import Database
+        from shared.storage.queries import queries
+        from shared.storage.token_rollup import TokenUsageRollup
+
+        db = Database(DATABASE_URL, pool=await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=2))
+        try:
+            await db.connect()
+            await db.pool.execute('DELETE FROM users WHERE user_id = $1', USER_ID)
+            await db.pool.execute('DELETE FROM token_usage_daily WHERE user_id = $1', USER_ID)
+            await db.pool.execute('INSERT INTO users (user_id) VALUES ($1)', USER_ID)
+
+            today = await db.pool.fetchval('SELECT CURRENT_DATE')
+            day = today - timedelta(days=3)
+            rollup = TokenUsageRollup(db, grace_minutes=0)
+
+            await _insert_usage(db, day, 10)
+            await rollup.catch_up()
+            # Строка дня, который уже свернут (например, пачка LogWriter после сбоя БД)
+            await _insert_usage(db, day, 5)
+            await _insert_usage(db, today, 1)
+
+            async with db.get_connection() as conn:
+                report = await queries.fetchrow(conn, 'token_usage.user_total', USER_ID, 30)
+            assert report['total_tokens'] == 16
+            assert report['request_count'] == 3
+
+            await rollup.catch_up()
+            daily = await db.pool.fetchrow(
+                'SELECT total_tokens, request_count FROM token_usage_daily WHERE user_id = $1 AND usage_date = $2',
+                USER_ID, day
+            )
+            assert (daily['total_tokens'], daily['request_count']) == (15, 2)
+            assert rollup.stats()['rolled_through'] == (today - timedelta(days=1)).isoformat()
+
+            async with db.get_connection() as conn:
+                report = await queries.fetchrow(conn, 'token_usage.user_total', USER_ID, 30)
+            assert report['total_tokens'] == 16
+            assert report['request_count'] == 3
+        finally:
+            await db.pool.execute('DELETE FROM token_usage_daily WHERE user_id = $1', USER_ID)
+            await db.pool.execute('DELETE FROM users WHERE user_id = $1', USER_ID)
+            await db.pool.close()
+
+    asyncio.run(check())
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("aiogram")
+pytest.importorskip("openai")
+
+from app.helpers.voice_pipeline import VoicePipeline
+from app.openai_client.transcriber import StubTranscriber, Transcriber
+
+
+class FakeBot:
+    """Вместо скачивания из Telegram пишет в буфер содержимое, заданное в file_id"""
+
+    async def download(self, voice, destination):
+        if voice.file_id == 'broken':
+            raise RuntimeError("download failed")
+        destination.write(voice.file_id.encode())
+
+
+def _voice_message(file_id: str, user_id: int = 1):
+    voice = SimpleNamespace(file_id=file_id, mime_type='audio/ogg', duration=1)
+    return SimpleNamespace(voice=voice, from_user=SimpleNamespace(id=user_id))
+
+
+def test_transcriber_is_abstract():
+    with pytest.raises(TypeError):
+        Transcriber()
+
+
+def test_stub_transcriber_is_deterministic():
+    stub = StubTranscriber()
+    first = asyncio.run(stub.transcribe(b'audio'))
+    assert first == asyncio.run(stub.transcribe(b'audio'))
+    assert first != asyncio.run(stub.transcribe(b'other audio'))
+
+
+def test_failed_reply_does_not_stop_workers():
+    async def check():
+        transcripts = []
+
+        async def on_transcript(message, text):
+            transcripts.append(text)
+
+        async def on_failure(message, error):
+            # Пользователь заблокировал бота
+            raise RuntimeError("bot was blocked by the user")
+
+        pipeline = VoicePipeline(
+            FakeBot(), StubTranscriber(), on_transcript, on_failure=on_failure,
+            download_concurrency=1, transcribe_concurrency=1
+        )
+        await pipeline.start()
+        # Сбоев больше, чем воркеров
+        for _ in range(5):
+            assert pipeline.submit(_voice_message('broken'))
+        assert pipeline.submit(_voice_message('hello'))
+        await pipeline.stop(timeout=5)
+
+        assert transcripts == [await StubTranscriber().transcribe(b'hello')]
+        assert pipeline.stats()['failed_total'] == 5
+        assert pipeline.stats()['processed_total'] == 1
+
+    asyncio.run(check())
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+aiohttp = pytest.importorskip("aiohttp")
+pytest.importorskip("aiogram")
+
+from shared.storage.database import Database
+from shared.telegram.webhook import SECRET_HEADER, UpdateDeduplicator, WebhookServer
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+BOT_ID = 900000001
+SECRET = "secret"
+
+
+class FakeBot:
+    async def set_webhook(self, **kwargs):
+        return True
+
+
+class RecordingDispatcher:
+    """Запоминает update_id; пока hold не установлен, обработка висит"""
+
+    def __init__(self, hold: bool = False):
+        self.seen = []
+        self.released = asyncio.Event()
+        if not hold:
+            self.released.set()
+
+    async def feed_update(self, bot, update):
+        await self.released.wait()
+        self.seen.append(update.update_id)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _server(db, dispatcher) -> WebhookServer:
+    deduplicator = UpdateDeduplicator(db, BOT_ID)
+    await deduplicator.initialize()
+    server = WebhookServer(
+        FakeBot(), dispatcher, deduplicator, 'http://127.0.0.1', '/webhook', SECRET,
+        host='127.0.0.1', port=_free_port(), consumers=1
+    )
+    await server.start()
+    return server
+
+
+async def _post(session, server, update_id: int) -> int:
+    url = f"http://127.0.0.1:{server.port}/webhook"
+    async with session.post(url, json={'update_id': update_id}, headers={SECRET_HEADER: SECRET}) as response:
+        return response.status
+
+
+def test_unprocessed_updates_survive_stop():
+    async def check():
+        db = Database(DATABASE_URL)
+        db.pool = await asyncpg.create_pool(DATABASE_URL, min_size=1, max_size=4)
+        await UpdateDeduplicator(db, BOT_ID).initialize()
+        await db.pool.execute('DELETE FROM processed_updates WHERE bot_id = $1', BOT_ID)
+        try:
+            async with aiohttp.ClientSession() as session:
+                # Обработчик висит: одно обновление в работе, второе в очереди
+                stuck = RecordingDispatcher(hold=True)
+                server = await _server(db, stuck)
+                assert await _post(session, server, 1) == 200
+                assert await _post(session, server, 2) == 200
+                await server.stop(timeout=0.1)
+                assert stuck.seen == []
+
+                # Следующий запуск дообрабатывает оба и не принимает их повторно
+                dispatcher = RecordingDispatcher()
+                server = await _server(db, dispatcher)
+                assert await _post(session, server, 2) == 200
+                assert await _post(session, server, 3) == 200
+                await server.stop(timeout=5)
+                assert dispatcher.seen == [1, 2, 3]
+                assert await server.deduplicator.pending() == []
+        finally:
+            await db.pool.execute('DELETE FROM processed_updates WHERE bot_id = $1', BOT_ID)
+            await db.pool.close()
+
+    asyncio.run(check())
@@ -0,0 +1,158 @@
+"""
+Антифлуд: ограничение частоты сообщений и нажатий на пользователя (token bucket)
+"""
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from app.helpers.metrics import metrics
+from app.helpers.outbound import OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+SLOW_DOWN_TEXT = "⏳ Слишком много сообщений подряд. Подождите {seconds} сек. и отправьте снова."
+
+
+class Limit(NamedTuple):
+    """Не больше burst событий за period секунд (с равномерным восстановлением)"""
+    burst: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.burst / self.period
+
+
+def parse_limit(value: str) -> Limit:
+    """"5/60" -> Limit(5, 60.0)"""
+    burst, _, period = value.partition('/')
+    return Limit(int(burst), float(period or 60))
+
+
+def parse_command_limits(value: str) -> Dict[str, Limit]:
+    """"more=5/60,start=3/60" -> {"more": Limit(5, 60), "start": Limit(3, 60)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        command, _, limit = item.partition('=')
+        limits[command.strip().lstrip('/').lower()] = parse_limit(limit.strip())
+    return limits
+
+
+class TokenBucketLimiter:
+    """
+    Корзины токенов по ключу. Состояние корзины - кортеж (токены, время),
+    простаивающие (полные) корзины удаляются, чтобы память не росла с числом пользователей
+    """
+
+    def __init__(self, idle_ttl: float = 600.0, sweep_every: int = 10000):
+        self.idle_ttl = idle_ttl
+        self.sweep_every = sweep_every
+        self._buckets: Dict[Tuple[int, str], Tuple[float, float]] = {}
+        self._calls = 0
+
+    def allow(self, key: Tuple[int, str], limit: Limit,
+              now: Optional[float] = None) -> Tuple[bool, float]:
+        """Списывает токен. Возвращает (разрешено, через сколько секунд появится токен)"""
+        now = now if now is not None else time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(limit.burst), now))
+        tokens = min(float(limit.burst), tokens + (now - updated) * limit.rate)
+
+        self._calls += 1
+        if self._calls % self.sweep_every == 0:
+            self.sweep(now)
+
+        if tokens >= 1.0:
+            self._buckets[key] = (tokens - 1.0, now)
+            return True, 0.0
+
+        self._buckets[key] = (tokens, now)
+        return False, (1.0 - tokens) / limit.rate
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Удаляет корзины, которые не трогали дольше idle_ttl"""
+        now = now if now is not None else time.monotonic()
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated >= self.idle_ttl]
+        for key in stale:
+            del self._buckets[key]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AntiFloodMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для сообщений и callback: лишние события отбрасываются
+    до фильтров и очереди, пользователь сразу получает просьбу подождать
+    (не чаще одного раза за время ожидания)
+    """
+
+    def __init__(self, outbound: OutboundScheduler, text_limit: Limit, command_limit: Limit,
+                 command_limits: Optional[Dict[str, Limit]] = None,
+                 exempt_ids: Iterable[int] = (),
+                 limiter: Optional[TokenBucketLimiter] = None):
+        self.outbound = outbound
+        self.text_limit = text_limit
+        self.command_limit = command_limit
+        self.command_limits = command_limits or {}
+        self.exempt_ids: Set[int] = set(exempt_ids)
+        self.limiter = limiter or TokenBucketLimiter()
+        self._warned_until: Dict[int, float] = {}
+
+    def set_exempt(self, user_ids: Iterable[int]):
+        """Заменяет список пользователей без ограничений (админы)"""
+        self.exempt_ids = set(user_ids)
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get('event_from_user')
+        if user is None or user.id in self.exempt_ids:
+            return await handler(event, data)
+
+        bucket, limit = self._classify(event)
+        allowed, retry_after = self.limiter.allow((user.id, bucket), limit)
+        if allowed:
+            return await handler(event, data)
+
+        metrics.incr('antiflood_dropped_total', bucket=bucket)
+        logger.info(f"🚦 Flood from user_id={user.id} ({bucket}), dropped; retry in {retry_after:.1f}s")
+        await self._warn(event, user.id, retry_after)
+        return None
+
+    def _classify(self, event: TelegramObject) -> Tuple[str, Limit]:
+        if isinstance(event, CallbackQuery):
+            return 'callback', self.command_limit
+
+        text = event.text if isinstance(event, Message) else None
+        if text and text.startswith('/'):
+            command = text.split()[0][1:].split('@')[0].lower()
+            if command in self.command_limits:
+                return f"/{command}", self.command_limits[command]
+            return 'command', self.command_limit
+
+        return 'text', self.text_limit
+
+    async def _warn(self, event: TelegramObject, user_id: int, retry_after: float):
+        seconds = max(1, round(retry_after))
+        text = SLOW_DOWN_TEXT.format(seconds=seconds)
+
+        if isinstance(event, CallbackQuery):
+            # На callback нужно ответить в любом случае, иначе кнопка "крутится"
+            try:
+                await event.answer(text)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to answer flood callback: {e}")
+            return
+
+        now = time.monotonic()
+        if self._warned_until.get(user_id, 0) > now:
+            return
+        self._warned_until[user_id] = now + retry_after
+        if len(self._warned_until) > 10000:
+            self._warned_until = {uid: until for uid, until in self._warned_until.items() if until > now}
+
+        if isinstance(event, Message):
+            self.outbound.send_message(event.chat.id, text)
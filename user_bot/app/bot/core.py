@@ -1,157 +1,303 @@
 import logging
 import asyncio
-from aiogram import Bot, Dispatcher
+import json
+import sys
+import os
+import time
+import asyncpg
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.enums import ParseMode
-from typing import Optional, Dict, Set
-from asyncio import Queue, Lock
+from typing import Optional
 from datetime import datetime
 
+# Добавляем путь к shared модулям
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../..'))
+
 from config import config
+from shared.telegram.api import create_bot
+from shared.telegram.webhook import UpdateDeduplicator, WebhookServer
+from shared.storage.fsm_storage import PostgresFSMStorage
+from shared.storage.queries import queries
 from app.openai_client.assistant import OpenAIClient
+from app.openai_client.transcriber import create_transcriber
+from app.storage.content_cache import ContentCache
+from app.storage.database import Database
 from app.storage.user_storage import UserStorage
-from app.bot.keyboards import create_more_keyboard, create_support_topics_keyboard, create_my_tickets_keyboard
+from app.bot.keyboards import create_my_tickets_keyboard
+from app.bot.html_renderer import markdown_to_html
+from app.bot.stream_display import StreamingAnswer, split_plain_text
+from app.bot.antiflood import AntiFloodMiddleware, parse_limit, parse_command_limits
+from app.bot.priorities import PriorityMiddleware
+from app.bot.queue_feedback import QueueFeedback, StageLatency
+from app.helpers.mailbox import MailboxRegistry
+from app.helpers.worker_pool import ShardedWorkerPool
+from app.helpers.inbox_pool import InboxWorkerPool
+from app.helpers.outbound import OutboundScheduler
+from app.helpers.typing_ticker import TypingTicker
+from app.helpers.metrics import metrics
+from app.helpers.leader_election import LeaderElection
+from app.helpers.side_effects import SideEffectQueue
+from app.helpers.voice_pipeline import VoicePipeline
+from app.helpers.priority_scheduler import PriorityScheduler, parse_class_values, INTERACTIVE, BUTTON, LLM
 
 # Создаем отдельные логгеры
 logger = logging.getLogger(__name__)
 startup_logger = logging.getLogger('startup')
 
+VOICE_TOO_LONG_TEXT = "🎙 Голосовое слишком длинное. Пожалуйста, уложитесь в {minutes} мин. или напишите текстом."
+VOICE_BUSY_TEXT = "🎙 Сейчас много голосовых сообщений. Пожалуйста, отправьте его чуть позже или напишите текстом."
+VOICE_EMPTY_TEXT = "🎙 Не удалось разобрать слова в голосовом. Попробуйте еще раз или напишите текстом."
+VOICE_FAILED_TEXT = "⚠️ Не удалось распознать голосовое сообщение. Попробуйте еще раз или напишите текстом."
+ENQUEUE_FAILED_TEXT = "⚠️ Не удалось принять сообщение. Попробуйте отправить его еще раз."
+
 # 🔥 СОСТОЯНИЯ ДЛЯ СОЗДАНИЯ ТИКЕТА
 class SupportStates(StatesGroup):
     waiting_for_topic = State()
     waiting_for_message = State()
 
 class TelegramBot:
-    def __init__(self):
-        self.bot = Bot(token=config.TELEGRAM_TOKEN)
-        self.dp = Dispatcher()
-        self.user_storage = UserStorage(config.database_url)
+    def __init__(self, token: Optional[str] = None, pool: Optional[asyncpg.Pool] = None,
+                 session: Optional[AiohttpSession] = None,
+                 fsm_storage: Optional[PostgresFSMStorage] = None,
+                 admin_bot: Optional[Bot] = None,
+                 content_cache: Optional[ContentCache] = None):
+        """
+        Без аргументов бот создает свои ресурсы. Хост нескольких ботов (host/main.py)
+        передает общие: пул БД, HTTP-сессию, FSM-хранилище с кэшем, кэш контента
+        (create_content_cache) и бот админов
+        """
+        self.bot = create_bot(token or config.TELEGRAM_TOKEN, config.TELEGRAM_API_URL, session=session)
+        self._owns_session = session is None
+        self.user_storage = UserStorage(config.database_url, pool=pool, content_cache=content_cache)
+        # Состояния диалога поддержки храним в БД: не теряются при рестарте и общие для процессов
+        self.fsm_storage: Optional[PostgresFSMStorage] = fsm_storage
+        if self.fsm_storage is None and config.FSM_STORAGE == "postgres":
+            self.fsm_storage = PostgresFSMStorage(
+                self.user_storage.db,
+                cache_ttl=config.FSM_CACHE_TTL,
+                state_ttl_hours=config.FSM_STATE_TTL_HOURS
+            )
+        self.dp = Dispatcher(storage=self.fsm_storage or MemoryStorage())
+        self.webhook_server: Optional[WebhookServer] = None
         self.openai_client: Optional[OpenAIClient] = None
+        self.voice: Optional[VoicePipeline] = None
+        
+        # Бот админов для уведомлений о тикетах (в общем процессе - экземпляр AdminBot)
+        self.admin_bot: Optional[Bot] = admin_bot
+        self._owns_admin_bot = False
+        if self.admin_bot is None and config.ADMIN_BOT_TOKEN:
+            self.admin_bot = create_bot(config.ADMIN_BOT_TOKEN, config.TELEGRAM_API_URL, session=session)
+            self._owns_admin_bot = session is None
+        
+        # 🔥 ВСЕ ИСХОДЯЩИЕ ЗАПРОСЫ К TELEGRAM ЧЕРЕЗ ОДИН ПЛАНИРОВЩИК
+        self.outbound = OutboundScheduler(
+            self.bot,
+            global_rate=config.OUTBOUND_GLOBAL_RATE,
+            chat_interval=config.OUTBOUND_CHAT_INTERVAL,
+            edit_interval=config.STREAM_EDIT_INTERVAL,
+            max_edit_interval=config.STREAM_EDIT_MAX_INTERVAL
+        )
+        # Один таймер статуса "печатает..." на все чаты
+        self.typing = TypingTicker(self.outbound)
+        # Фоновые действия после ответа пользователю (рефералы, создание треда)
+        self.side_effects = SideEffectQueue(
+            workers=config.SIDE_EFFECT_WORKERS,
+            max_attempts=config.SIDE_EFFECT_MAX_ATTEMPTS
+        )
+        
+        self.durable_queue = config.MESSAGE_QUEUE == "postgres"
+        # Роль процесса: all / ingest (только прием) / worker (только обработка своего раздела)
+        self.role = config.BOT_ROLE
+        
+        # 🕐 ПОЗИЦИЯ В ОЧЕРЕДИ, ETA И ОТКАЗ ПРИ ПЕРЕГРУЗКЕ
+        self.latency = StageLatency(defaults={'llm': config.EXPECTED_ANSWER_SECONDS})
+        self.processing_parallelism = config.MAX_WORKERS * (config.WORKER_COUNT if self.durable_queue else 1)
+        self.queue_feedback = QueueFeedback(
+            self.outbound,
+            self.latency,
+            parallelism=self.processing_parallelism,
+            positions=self._queue_positions,
+            shed_backlog=config.SHED_BACKLOG,
+            user_queue_limit=config.SHED_USER_QUEUE,
+            update_interval=config.QUEUE_FEEDBACK_INTERVAL,
+            track_updates=self.role != "ingest"
+        )
+        
+        # ⚖️ ПРИОРИТЕТЫ: команды и поддержка не ждут длинных LLM-ответов
+        self.scheduler = PriorityScheduler(config.PRIORITY_CAPACITY, weights={}, max_wait=config.PRIORITY_MAX_WAIT)
+        self.reload_priorities()
+        priority_middleware = PriorityMiddleware(self.scheduler, self._priority_class)
+        self.dp.message.middleware(priority_middleware)
+        self.dp.callback_query.middleware(priority_middleware)
+        
+        # 🚦 АНТИФЛУД ДО ФИЛЬТРОВ И ОЧЕРЕДИ
+        self.antiflood: Optional[AntiFloodMiddleware] = None
+        if config.ANTIFLOOD_ENABLED:
+            self.antiflood = AntiFloodMiddleware(
+                self.outbound,
+                text_limit=parse_limit(config.ANTIFLOOD_TEXT_LIMIT),
+                command_limit=parse_limit(config.ANTIFLOOD_COMMAND_LIMIT),
+                command_limits=parse_command_limits(config.ANTIFLOOD_COMMAND_LIMITS),
+                exempt_ids=self._antiflood_exempt_ids()
+            )
+            self.dp.message.outer_middleware(self.antiflood)
+            self.dp.callback_query.outer_middleware(self.antiflood)
         
         # 🔥 СИСТЕМА ОЧЕРЕДИ ДЛЯ КАЖДОГО ПОЛЬЗОВАТЕЛЯ
-        self.user_queues: Dict[int, Queue] = {}
-        self.user_locks: Dict[int, Lock] = {}
-        self.processing_users: Set[int] = set()
+        self.mailboxes = MailboxRegistry(idle_ttl=config.MAILBOX_IDLE_TTL)
+        if self.durable_queue:
+            # Очередь в таблице inbox: переживает падение процесса
+            self.user_storage.inbox.max_attempts = config.INBOX_MAX_ATTEMPTS
+            if self.role == "worker":
+                self.user_storage.inbox.set_partition(config.WORKER_INDEX, config.WORKER_COUNT)
+            self.worker_pool = InboxWorkerPool(
+                self.user_storage.inbox,
+                self._process_inbox_message,
+                workers=config.MAX_WORKERS,
+                poll_interval=config.INBOX_POLL_INTERVAL
+            )
+        else:
+            # Фиксированный пул воркеров: не больше MAX_WORKERS ответов одновременно
+            self.worker_pool = ShardedWorkerPool(
+                self.mailboxes,
+                self._process_queued_message,
+                workers=config.MAX_WORKERS
+            )
+        
+        self._stopping = False
+        self._closed = False
+        self._stopped = asyncio.Event()
+        
+        # 👑 ГОРЯЧИЙ РЕЗЕРВ: обновления принимает только ведущий экземпляр,
+        # резервный держит пул БД и соединения OpenAI прогретыми и ждет аренду
+        self.leader: Optional[LeaderElection] = None
+        self._warm_task: Optional[asyncio.Task] = None
+        # (ожидают, в работе) в inbox - кэш для приема сообщений в режиме postgres
+        self._inbox_load = (0, 0)
+        self._inbox_load_task: Optional[asyncio.Task] = None
+        if config.STANDBY_ENABLED and self.role != "worker":
+            self.leader = LeaderElection(
+                self.user_storage.db,
+                name=f"user_bot:{self.bot.id}:{self.role}",
+                lease_seconds=config.LEADER_LEASE_SECONDS,
+                heartbeat_interval=config.LEADER_HEARTBEAT_INTERVAL,
+                on_lost=self.stop_intake
+            )
         
         self._register_handlers()
         logger.info("✅ TelegramBot initialized")
     
-    def _get_user_queue(self, user_id: int) -> Queue:
-        """Получает или создает очередь для пользователя"""
-        if user_id not in self.user_queues:
-            self.user_queues[user_id] = Queue()
-            self.user_locks[user_id] = Lock()
-        return self.user_queues[user_id]
-    
-    def _get_user_lock(self, user_id: int) -> Lock:
-        """Получает или создает lock для пользователя"""
-        if user_id not in self.user_locks:
-            self.user_queues[user_id] = Queue()
-            self.user_locks[user_id] = Lock()
-        return self.user_locks[user_id]
+    @staticmethod
+    def create_content_cache(pool: asyncpg.Pool) -> Optional[ContentCache]:
+        """
+        Кэш bot_content для нескольких ботов одного процесса (запускает и останавливает
+        владелец - хост). None - кэш выключен (CONTENT_CACHE_ENABLED)
+        """
+        if not config.CONTENT_CACHE_ENABLED:
+            return None
+        return ContentCache(Database(config.database_url, pool=pool),
+                            refresh_interval=config.CONTENT_CACHE_REFRESH_INTERVAL)
     
-    async def _process_user_messages(self, user_id: int):
-        """Обрабатывает сообщения пользователя в порядке FIFO"""
-        queue = self._get_user_queue(user_id)
-        lock = self._get_user_lock(user_id)
+    async def _process_queued_message(self, user_id: int, message_data: dict):
+        """Обрабатывает сообщение, взятое воркером из очереди пользователя"""
+        message = message_data['message']
+        user_message = message_data['text']
+        placeholder_id = message_data.get('placeholder_id')
         
-        async with lock:
-            if user_id in self.processing_users:
-                return  # Уже обрабатывается другим процессом
-            
-            self.processing_users.add(user_id)
+        logger.info(f"🎯 Processing message from user_id={user_id} (queue position: {self.mailboxes.depth(user_id) + 1})")
         
-        try:
-            while not queue.empty():
-                # 🔥 Берем сообщение из очереди (FIFO)
-                message_data = await queue.get()
-                message = message_data['message']
-                user_message = message_data['text']
-                
-                logger.info(f"🎯 Processing message from user_id={user_id} (queue position: {queue.qsize() + 1})")
-                
-                await self._process_single_message(message, user_id, user_message)
-                queue.task_done()
-                
-        finally:
-            self.processing_users.discard(user_id)
+        if message_data.get('enqueued_at'):
+            self.latency.record('queue', time.time() - message_data['enqueued_at'])
+        if placeholder_id:
+            self.queue_feedback.started(message.chat.id, placeholder_id)
+        
+        async with self.scheduler.slot(LLM):
+            started = time.monotonic()
+            await self._process_single_message(message, user_id, user_message, placeholder_id)
+            self.latency.record('llm', time.monotonic() - started)
+    
+    async def _process_inbox_message(self, user_id: int, payload: dict):
+        """Обрабатывает сообщение, взятое воркером из таблицы inbox"""
+        await self._process_queued_message(user_id, self._decode_message_data(payload))
     
-    async def _process_single_message(self, message: Message, user_id: int, user_message: str):
+    async def _enqueue_message(self, user_id: int, message_data: dict) -> int:
+        """Ставит сообщение в очередь пользователя. Возвращает размер очереди"""
+        if self.durable_queue:
+            message = message_data['message']
+            return await self.worker_pool.submit(
+                user_id, message.chat.id, message.message_id,
+                self._encode_message_data(message_data)
+            )
+        return self.worker_pool.submit(user_id, message_data)
+    
+    def _encode_message_data(self, message_data: dict) -> dict:
+        """Сообщение очереди в виде JSON-совместимого словаря"""
+        data = {key: value for key, value in message_data.items() if key != 'message'}
+        data['message'] = message_data['message'].model_dump(mode='json', exclude_none=True)
+        return data
+    
+    def _decode_message_data(self, data: dict) -> dict:
+        """Восстанавливает сообщение очереди (объект Message привязывается к боту)"""
+        message_data = dict(data)
+        message_data['message'] = Message.model_validate(data['message'], context={"bot": self.bot})
+        return message_data
+    
+    async def _process_single_message(self, message: Message, user_id: int, user_message: str,
+                                      placeholder_id: Optional[int] = None):
         """Обрабатывает одно сообщение пользователя"""
         # Сохраняем пользователя и обновляем активность
         await self.user_storage.save_user_from_message(message)
         await self.user_storage.update_activity(user_id)
         
         # 🔥 ЗАПУСКАЕМ СТАТУС ПЕЧАТИ СРАЗУ
-        typing_task = asyncio.create_task(
-            self._send_typing_periodically(message.chat.id)
-        )
+        self.typing.register(message.chat.id)
         
+        answer = None
         try:
-            collected_text = ""
-            bot_message = None
-            update_interval = 7
-            last_update_time = asyncio.get_event_loop().time()
-            chunk_counter = 0
-            
             # 🔥 ОТПРАВЛЯЕМ ПЕРВОЕ СООБЩЕНИЕ СРАЗУ
-            bot_message = await message.reply("⏳ *Формирую ответ...*", parse_mode=ParseMode.MARKDOWN)
+            answer = StreamingAnswer(
+                self.outbound, message.chat.id,
+                reply_to_message_id=message.message_id,
+                placeholder_id=placeholder_id
+            )
+            await answer.start()
             
-            # Обрабатываем потоковый ответ
+            # Обрабатываем потоковый ответ (интервал правок подбирает планировщик)
             async for text_chunk in self.openai_client.process_message_streaming(user_id, user_message):
-                if not text_chunk:
-                    continue
-                
-                collected_text += text_chunk
-                chunk_counter += 1
-                current_time = asyncio.get_event_loop().time()
-                
-                if current_time - last_update_time >= update_interval:
-                    try:
-                        display_text = f"{collected_text}\n\n⏳ *Формирую ответ...*"
-                        await bot_message.edit_text(
-                            display_text,
-                            parse_mode=ParseMode.MARKDOWN
-                        )
-                        chunk_counter = 0
-                        last_update_time = current_time
-                    except Exception as e:
-                        logger.warning(f"⚠️ Edit failed for user_id={user_id}: {e}")
+                await answer.feed(text_chunk)
             
             # Финальное обновление
-            if bot_message and collected_text:
-                try:
-                    await bot_message.edit_text(
-                        collected_text,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as e:
-                    logger.warning(f"⚠️ Final edit failed for user_id={user_id}: {e}")
-                    await message.reply(collected_text)
+            await answer.finish()
             
             logger.info(f"✅ Stream processing completed for user_id={user_id}")
             
+        except asyncio.CancelledError:
+            # Остановка бота по дедлайну: показанная часть фиксируется, сообщение будет переиграно
+            if answer is not None:
+                answer.interrupt()
+            raise
+            
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке сообщения: {str(e)}"
             logger.error(f"{error_msg} for user_id={user_id}")
             
             try:
                 fallback_response = await self.openai_client.process_message_fast(user_id, user_message)
-                await message.reply(fallback_response, parse_mode=ParseMode.MARKDOWN)
+                for part in split_plain_text(fallback_response):
+                    await message.reply(markdown_to_html(part), parse_mode=ParseMode.HTML)
             except Exception as fallback_error:
                 logger.error(f"❌ Fallback also failed: {fallback_error}")
                 await message.reply("⚠️ Произошла ошибка при обработке вашего сообщения. Попробуйте еще раз.")
         
         finally:
             # 🔥 ГАРАНТИРОВАННО ОСТАНАВЛИВАЕМ СТАТУС ПЕЧАТИ
-            typing_task.cancel()
-            try:
-                await typing_task
-            except asyncio.CancelledError:
-                pass
+            self.typing.unregister(message.chat.id)
 
     async def _message_handler(self, message: Message):
         """Обработчик сообщений с системой очереди FIFO"""
@@ -168,18 +314,172 @@ class TelegramBot:
             return
         
         logger.info(f"📨 Message received from user_id={user_id}: {user_message}")
+        await self._accept_text(message, user_message)
+    
+    async def _voice_handler(self, message: Message):
+        """Голосовое сообщение: распознается фоном, текст попадает в обычную очередь"""
+        user_id = message.from_user.id
+        if not self.voice:
+            return
+        
+        if message.voice.duration and message.voice.duration > config.VOICE_MAX_DURATION:
+            await message.reply(VOICE_TOO_LONG_TEXT.format(minutes=config.VOICE_MAX_DURATION // 60))
+            return
+        
+        waiting, _ = self._queue_load()
+        user_depth = await self._user_depth(user_id)
+        shed_text = self.queue_feedback.shed_text(waiting, user_depth)
+        if shed_text:
+            self.outbound.send_message(message.chat.id, shed_text, reply_to_message_id=message.message_id)
+            return
         
-        # 🔥 ДОБАВЛЯЕМ СООБЩЕНИЕ В ОЧЕРЕДЬ ПОЛЬЗОВАТЕЛЯ
-        queue = self._get_user_queue(user_id)
-        await queue.put({
+        if not self.voice.submit(message):
+            logger.warning(f"🚫 Voice from user_id={user_id} rejected: voice queue is full")
+            await message.reply(VOICE_BUSY_TEXT)
+            return
+        
+        logger.info(f"🎙 Voice received from user_id={user_id} ({message.voice.duration}s), "
+                    f"voice queue: {self.voice.pending}")
+        # Распознавание займет несколько секунд - показываем, что бот работает
+        self.outbound.chat_action(message.chat.id)
+    
+    async def _on_voice_transcript(self, message: Message, text: str):
+        """Распознанный текст голосового - как обычное текстовое сообщение"""
+        if not text:
+            await message.reply(VOICE_EMPTY_TEXT)
+            return
+        await self._accept_text(message, text)
+    
+    async def _on_voice_failure(self, message: Message, error: Exception):
+        await message.reply(VOICE_FAILED_TEXT)
+    
+    async def _accept_text(self, message: Message, user_message: str):
+        """Ставит текст пользователя (набранный или распознанный) в его очередь"""
+        user_id = message.from_user.id
+        
+        # 🕐 ПРИ ПЕРЕГРУЗКЕ ВЕЖЛИВО ОТКАЗЫВАЕМ, ИНАЧЕ СООБЩАЕМ ПОЗИЦИЮ И ETA
+        waiting, in_progress = self._queue_load()
+        user_depth = await self._user_depth(user_id)
+        shed_text = self.queue_feedback.shed_text(waiting, user_depth)
+        if shed_text:
+            logger.warning(f"🚫 Message from user_id={user_id} shed (waiting={waiting}, user queue={user_depth})")
+            self.outbound.send_message(message.chat.id, shed_text, reply_to_message_id=message.message_id)
+            return
+        
+        message_data = {
             'message': message,
-            'text': user_message
-        })
+            'text': user_message,
+            'enqueued_at': time.time()
+        }
+        if waiting + in_progress >= self.processing_parallelism:
+            placeholder_id = await self.queue_feedback.announce(message.chat.id, message.message_id, waiting + 1)
+            if placeholder_id:
+                message_data['placeholder_id'] = placeholder_id
         
-        logger.info(f"📥 Message added to queue for user_id={user_id} (queue size: {queue.qsize()})")
+        # 🔥 ДОБАВЛЯЕМ СООБЩЕНИЕ В ОЧЕРЕДЬ ПОЛЬЗОВАТЕЛЯ (обработает воркер его шарда)
+        try:
+            queue_size = await self._enqueue_message(user_id, message_data)
+        except Exception as e:
+            logger.error(f"❌ Failed to enqueue message from user_id={user_id}: {e}")
+            placeholder_id = message_data.get('placeholder_id')
+            if placeholder_id:
+                # Сообщение с позицией больше не обновляем - оно становится сообщением об ошибке
+                self.queue_feedback.started(message.chat.id, placeholder_id)
+                self.outbound.edit_text(message.chat.id, placeholder_id, ENQUEUE_FAILED_TEXT)
+            else:
+                await message.reply(ENQUEUE_FAILED_TEXT)
+            return
+        
+        if self.durable_queue:
+            # До следующего обновления счетчиков учитываем свои сообщения
+            waiting, in_progress = self._inbox_load
+            self._inbox_load = (waiting + 1, in_progress)
+        logger.info(f"📥 Message added to queue for user_id={user_id} (queue size: {queue_size})")
+    
+    async def _queue_positions(self, messages: list) -> Optional[dict]:
+        """Места сообщений (chat_id, message_id) в очереди для обновления позиции ожидающим"""
+        if self.durable_queue:
+            return await self.user_storage.inbox.positions(messages)
         
-        # 🔥 ЗАПУСКАЕМ ОБРАБОТКУ ОЧЕРЕДИ
-        asyncio.create_task(self._process_user_messages(user_id))
+        # Ящики обрабатываются параллельно, общий порядок - по времени постановки
+        queued = sorted(
+            (data['enqueued_at'], data['message'].chat.id, data['message'].message_id)
+            for _, data in self.mailboxes.queued_items()
+        )
+        wanted = set(messages)
+        return {
+            (chat_id, message_id): index + 1
+            for index, (_, chat_id, message_id) in enumerate(queued)
+            if (chat_id, message_id) in wanted
+        }
+    
+    def _queue_load(self) -> tuple:
+        """(сколько сообщений ждет, сколько обрабатывается) для оценки ожидания"""
+        if self.durable_queue:
+            # Счетчики inbox обновляет _inbox_load_loop, а не каждое входящее сообщение
+            return self._inbox_load
+        return self.mailboxes.queued_total, self.worker_pool.stats()['busy_workers']
+    
+    async def _user_depth(self, user_id: int) -> int:
+        """Сколько сообщений пользователя ждет в очереди"""
+        if self.durable_queue:
+            return await self.user_storage.inbox.user_depth(user_id)
+        return self.mailboxes.depth(user_id)
+    
+    async def _inbox_load_loop(self):
+        """Обновляет счетчики inbox раз в QUEUE_FEEDBACK_INTERVAL секунд (общие для всех процессов)"""
+        while True:
+            load = await self.user_storage.inbox.load()
+            if load is not None:
+                self._inbox_load = load
+            await asyncio.sleep(config.QUEUE_FEEDBACK_INTERVAL)
+    
+    def get_queue_stats(self) -> dict:
+        """Статистика очередей и пула воркеров"""
+        stats = self.worker_pool.stats()
+        stats['priorities'] = self.scheduler.stats()
+        stats['queue_feedback'] = self.queue_feedback.stats()
+        stats['side_effects'] = self.side_effects.stats()
+        stats['log_writer'] = self.user_storage.log_writer.stats()
+        stats['queries'] = queries.stats()
+        if self.user_storage.content_cache:
+            stats['content_cache'] = self.user_storage.content_cache.stats()
+        if self.voice:
+            stats['voice'] = self.voice.stats()
+        if self.leader:
+            stats['leader'] = self.leader.is_leader
+        stats['metrics'] = metrics.snapshot()
+        return stats
+    
+    def _priority_class(self, event, data: dict) -> Optional[str]:
+        """Класс приоритета для выбранного обработчика (None - слот не нужен)"""
+        handler = data.get('handler')
+        callback = getattr(handler, 'callback', None)
+        if callback in (self._message_handler, self._voice_handler):
+            # Только ставит сообщение в очередь; слот LLM возьмет воркер
+            return None
+        if isinstance(event, CallbackQuery) and (event.data or '').startswith('more_button_'):
+            return BUTTON
+        return INTERACTIVE
+    
+    def reload_priorities(self):
+        """Применяет настройки приоритетов из окружения (вызывается и по SIGHUP)"""
+        limits = {LLM: config.MAX_WORKERS}
+        limits.update(parse_class_values(os.getenv("PRIORITY_LIMITS", config.PRIORITY_LIMITS), int))
+        self.scheduler.configure(
+            capacity=int(os.getenv("PRIORITY_CAPACITY", config.PRIORITY_CAPACITY)),
+            weights=parse_class_values(os.getenv("PRIORITY_WEIGHTS", config.PRIORITY_WEIGHTS)),
+            limits=limits,
+            max_wait=float(os.getenv("PRIORITY_MAX_WAIT", config.PRIORITY_MAX_WAIT))
+        )
+    
+    def _antiflood_exempt_ids(self, admin_ids=()) -> set:
+        """Пользователи без ограничений частоты: супер-админ, админы и ANTIFLOOD_EXEMPT_IDS"""
+        exempt = {int(uid) for uid in config.ANTIFLOOD_EXEMPT_IDS.split(',') if uid.strip()}
+        exempt.update(admin_ids)
+        if config.SUPER_ADMIN_ID:
+            exempt.add(config.SUPER_ADMIN_ID)
+        return exempt
     
     async def _more_handler(self, message: Message):
         """Обработчик команды /more - показывает кнопки с темами"""
@@ -195,8 +495,8 @@ class TelegramBot:
                 )
                 return
             
-            # Создаем клавиатуру с кнопками
-            keyboard = create_more_keyboard(buttons)
+            # Клавиатура собрана заранее в кэше контента
+            keyboard = await self.user_storage.get_more_keyboard()
             
             await message.answer(
                 "Это не просто кнопки.\n"
@@ -258,45 +558,24 @@ class TelegramBot:
             await callback.answer(f"⏳ Загружаю: {button_info['button_text']}")
             
             # Запускаем статус печати
-            typing_task = asyncio.create_task(
-                self._send_typing_periodically(callback.message.chat.id)
-            )
+            typing_chat_id = callback.message.chat.id
+            self.typing.register(typing_chat_id)
             
             # Отправляем индикатор обработки как НОВОЕ сообщение
-            processing_msg = await callback.message.answer("⏳ Формирую ответ...")
-            
-            collected_text = ""
-            update_interval = 5
-            last_update_time = asyncio.get_event_loop().time()
+            answer = StreamingAnswer(
+                self.outbound, callback.message.chat.id, progress_text="🔄 <i>Формирую текст...</i>"
+            )
+            await answer.start()
             
             prompt = button_info['content_text']
             await self.user_storage.log_message(user_id, f"Button: {button_info['button_text']}", "user")
             
             # Обрабатываем потоковый ответ
             async for text_chunk in self.openai_client.process_message_streaming(user_id, prompt):
-                if not text_chunk:
-                    continue
-                
-                collected_text += text_chunk
-                current_time = asyncio.get_event_loop().time()
-                
-                if current_time - last_update_time >= update_interval:
-                    try:
-                        await processing_msg.edit_text(
-                            f"{collected_text}\n\n🔄 Формирую текст...",
-                            parse_mode=ParseMode.MARKDOWN
-                        )
-                        last_update_time = current_time
-                    except Exception as e:
-                        logger.warning(f"⚠️ Edit failed for button {button_info['button_text']}: {e}")
+                await answer.feed(text_chunk)
             
             # Финальное сообщение
-            if collected_text:
-                try:
-                    await processing_msg.edit_text(collected_text, parse_mode=ParseMode.MARKDOWN)
-                except Exception as e:
-                    logger.warning(f"⚠️ Final edit failed: {e}")
-                    await callback.message.answer(collected_text, parse_mode=ParseMode.MARKDOWN)
+            await answer.finish()
             
             logger.info(f"✅ Button processed: {button_info['button_text']} for user_id={user_id}")
             
@@ -306,12 +585,8 @@ class TelegramBot:
         
         finally:
             # Гарантированно останавливаем статус печати
-            if 'typing_task' in locals():
-                typing_task.cancel()
-                try:
-                    await typing_task
-                except asyncio.CancelledError:
-                    pass
+            if 'typing_chat_id' in locals():
+                self.typing.unregister(typing_chat_id)
 
     async def _handle_support_topic(self, callback: CallbackQuery, state: FSMContext):
         """Обработчик выбора темы поддержки"""
@@ -321,13 +596,7 @@ class TelegramBot:
             topic_id = int(callback.data.replace('support_topic_', ''))
             logger.info(f"🎯 Topic selected: {topic_id} from user_id={user_id}")
             
-            # Получаем все темы чтобы найти выбранную
-            topics = await self.user_storage.get_support_topics()
-            selected_topic = None
-            for topic in topics:
-                if topic['id'] == topic_id:
-                    selected_topic = topic
-                    break
+            selected_topic = await self.user_storage.get_support_topic(topic_id)
             
             if not selected_topic:
                 logger.error(f"❌ Topic not found: {topic_id}")
@@ -362,8 +631,7 @@ class TelegramBot:
         
         try:
             await state.set_state(SupportStates.waiting_for_topic)
-            topics = await self.user_storage.get_support_topics()
-            keyboard = create_support_topics_keyboard(topics)
+            keyboard = await self.user_storage.get_support_topics_keyboard()
             
             await callback.message.edit_text(
                 "📞 **Создание нового обращения**\n\n"
@@ -400,9 +668,9 @@ class TelegramBot:
         try:
             logger.info(f"🔄 Support command started for user_id={user_id}")
             
-            # Получаем темы поддержки из базы
+            # Темы поддержки (из кэша контента)
             topics = await self.user_storage.get_support_topics()
-            logger.info(f"📋 Retrieved {len(topics)} support topics from database")
+            logger.info(f"📋 Retrieved {len(topics)} support topics")
             
             if not topics:
                 logger.warning("❌ No support topics found in database")
@@ -411,9 +679,7 @@ class TelegramBot:
                 )
                 return
             
-            # Создаем клавиатуру с темами
-            keyboard = create_support_topics_keyboard(topics)
-            logger.info("✅ Support keyboard created successfully")
+            keyboard = await self.user_storage.get_support_topics_keyboard()
             
             await message.answer(
                 "📞 **Служба поддержки**\n\n"
@@ -501,78 +767,53 @@ class TelegramBot:
 
 
     async def _notify_admins_about_ticket(self, ticket_number: str, user_id: int, topic: str, message_text: str, user):
-        """Отправляет уведомление в админскую группу о новом тикете"""
+        """Отправляет уведомление в админскую группу о новом тикете (от имени бота админов)"""
         try:
-            import aiohttp
-            import os
-            
-            admin_bot_token = os.getenv('ADMIN_BOT_TOKEN')
-            admin_channel_id = os.getenv('ADMIN_CHANNEL_ID')
-            admin_thread_id = int(os.getenv('ADMIN_CHANNEL_THREAD_ID', '0'))
-            
-            if not admin_bot_token:
+            if not self.admin_bot:
                 logger.warning("⚠️ ADMIN_BOT_TOKEN not found, skipping notification")
                 return
             
+            admin_thread_id = config.ADMIN_CHANNEL_THREAD_ID
+            
             # Формируем имя пользователя
             user_name = user.first_name or ""
             if user.last_name:
                 user_name += f" {user.last_name}"
             username_str = f"@{user.username}" if user.username else "нет username"
             
-            # Получаем username админского бота
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"https://api.telegram.org/bot{admin_bot_token}/getMe") as resp:
-                    if resp.status == 200:
-                        data = await resp.json()
-                        bot_username = data['result']['username']
-                        
-                        # Формируем deep link БЕЗ дефиса
-                        deep_link = f"https://t.me/{bot_username}?start=ticket_{ticket_number}"
-                        
-                        # Формируем сообщение для группы
-                        notification_text = (
-                            f"🆕 **НОВЫЙ ТИКЕТ ПОДДЕРЖКИ**\n\n"
-                            f"🎫 **Номер:** `{ticket_number}`\n"
-                            f"📋 **Тема:** {topic}\n"
-                            f"👤 **Пользователь:** {user_name} ({username_str})\n"
-                            f"🆔 **User ID:** `{user_id}`\n"
-                            f"⏰ **Создан:** {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
-                            f"💬 **Проблема:**\n{message_text[:300]}\n\n"
-                            f"[🔗 Взять в работу]({deep_link})"
-                        )
-                        
-                        # Отправляем в группу с указанием топика
-                        post_data = {
-                            'chat_id': admin_channel_id,
-                            'text': notification_text,
-                            'parse_mode': 'Markdown',
-                            'disable_web_page_preview': True
-                        }
-                        
-                        # Добавляем топик если указан
-                        if admin_thread_id > 0:
-                            post_data['message_thread_id'] = admin_thread_id
-                        
-                        async with session.post(
-                            f"https://api.telegram.org/bot{admin_bot_token}/sendMessage",
-                            json=post_data
-                        ) as send_resp:
-                            if send_resp.status == 200:
-                                result = await send_resp.json()
-                                message_id = result['result']['message_id']
-                                
-                                # Сохраняем message_id в базе
-                                await self.user_storage.update_ticket_channel_message(
-                                    ticket_number, message_id, admin_thread_id
-                                )
-                                
-                                logger.info(f"✅ Notification sent to admin group for ticket {ticket_number}")
-                            else:
-                                error = await send_resp.text()
-                                logger.error(f"❌ Failed to send notification: {error}")
-                    else:
-                        logger.error(f"❌ Failed to get admin bot info: {resp.status}")
+            # Username админского бота (aiogram кэширует getMe)
+            admin_bot_info = await self.admin_bot.me()
+            
+            # Формируем deep link БЕЗ дефиса
+            deep_link = f"https://t.me/{admin_bot_info.username}?start=ticket_{ticket_number}"
+            
+            # Формируем сообщение для группы
+            notification_text = (
+                f"🆕 **НОВЫЙ ТИКЕТ ПОДДЕРЖКИ**\n\n"
+                f"🎫 **Номер:** `{ticket_number}`\n"
+                f"📋 **Тема:** {topic}\n"
+                f"👤 **Пользователь:** {user_name} ({username_str})\n"
+                f"🆔 **User ID:** `{user_id}`\n"
+                f"⏰ **Создан:** {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
+                f"💬 **Проблема:**\n{message_text[:300]}\n\n"
+                f"[🔗 Взять в работу]({deep_link})"
+            )
+            
+            # Отправляем в группу с указанием топика (если указан)
+            sent = await self.admin_bot.send_message(
+                config.ADMIN_CHANNEL_ID,
+                notification_text,
+                parse_mode=ParseMode.MARKDOWN,
+                disable_web_page_preview=True,
+                message_thread_id=admin_thread_id if admin_thread_id > 0 else None
+            )
+            
+            # Сохраняем message_id в базе
+            await self.user_storage.update_ticket_channel_message(
+                ticket_number, sent.message_id, admin_thread_id
+            )
+            
+            logger.info(f"✅ Notification sent to admin group for ticket {ticket_number}")
                         
         except Exception as e:
             logger.error(f"❌ Error notifying admins: {e}", exc_info=True)
@@ -656,95 +897,245 @@ class TelegramBot:
         logger.info(f"🔗 Affiliate link generated for user_id={user_id}")
    
     async def _start_handler(self, message: Message):
-        """Обработчик команды /start"""
+        """
+        Обработчик команды /start. Приветствие отправляется сразу, сохранение
+        пользователя, учет реферала, уведомление реферера и создание треда
+        выполняются фоном (очередь побочных действий с повторами)
+        """
         user = message.from_user
         user_info = f"id={user.id}, username={user.username}, first_name={user.first_name}"
         
         logger.info(f"🎯 Start command from {user_info}")
         startup_logger.info(f"👤 USER STARTED BOT: {user_info}")
         
-        # Сохраняем пользователя в базу
-        await self.user_storage.save_user_from_message(message)
+        # Приветственное сообщение (HTML для поддержки blockquote)
+        welcome_msg = (
+            "Привет 👋\n"
+            "Бог любит тебя и я тоже!\n\n"
+            "Я не буду учить тебя жить и раздавать советы, со мной все просто и по-человечески комфортно 🤝\n\n"
+            "💬 Здесь тебе не нужно подбирать правильные слова. Просто напиши, что с тобой сейчас происходит, что беспокоит, своими словами, как есть…\n\n"
+            "📖 Я подберу слова из Священного Писания и помогу увидеть, как через них Бог отвечает именно в твою ситуацию.🙏\n\n"
+            "👉 Также можешь воспользоваться готовыми кнопками запросов в меню, там я собрал самые частые вопросы\n\n📖\n"
+            "<blockquote>Мф. 11:28\n«Придите ко Мне все труждающиеся и обременённые, и Я успокою вас».</blockquote>"
+        )
+        await message.answer(welcome_msg, parse_mode=ParseMode.HTML)
         
-        # 🔥 ПРОВЕРЯЕМ РЕФЕРАЛЬНУЮ ССЫЛКУ (исправленная версия)
+        # 🔥 ПРОВЕРЯЕМ РЕФЕРАЛЬНУЮ ССЫЛКУ
         args = None
         if message.text and len(message.text.split()) > 1:
             args = message.text.split()[1]  # Берем аргументы после /start
         
         referrer_id = None
-        
         if args and args.startswith('ref_'):
             try:
                 referrer_id = int(args[4:])  # Извлекаем ID из "ref_123456"
-                
-                # Проверяем существует ли реферер
-                referrer_data = await self.user_storage.get_user_stats(referrer_id)
-                if referrer_data:
-                    # Добавляем реферальную связь
-                    success = await self.user_storage.add_referral(referrer_id, user.id, args)
-                    if success:
-                        logger.info(f"✅ Referral added: {user.id} -> {referrer_id}")
-                        
-                        # Уведомляем реферера
-                        try:
-                            await self.bot.send_message(
-                                referrer_id,
-                                f"<b>✨ Твоя ссылка — стала мостом к Свету.</b>\n\n<b>{user.first_name or 'Пользователь'}</b> только что зашёл в бота по твоей рекомендации.\n\nИ, возможно, именно сегодня он получил то слово, которое поддержало, исцелило, дало направление или просто согрело сердце.\n\n📖\n<blockquote>«Блаженны миротворцы, ибо они будут наречены сынами Божиими»\n(Матфея 5:9)</blockquote>",
-                                parse_mode=ParseMode.HTML
-                            )
-                            logger.info(f"✅ Referral notification sent to {referrer_id}")
-                        except Exception as e:
-                            logger.error(f"❌ Failed to send referral notification to {referrer_id}: {e}")
-            except (ValueError, IndexError) as e:
+            except ValueError as e:
                 logger.warning(f"⚠️ Invalid referral args: {args}, error: {e}")
         
-        # Получаем или создаем тред для пользователя
-        try:
+        async def save_user():
+            # Пользователь должен быть в БД раньше реферальной связи
+            if not await self.user_storage.save_user_from_message(message):
+                raise RuntimeError(f"user {user.id} not saved")
+            await self.user_storage.update_activity(user.id)
+        
+        async def record_referral():
+            if referrer_id is None or referrer_id == user.id:
+                return
+            # Проверяем существует ли реферер
+            if not await self.user_storage.get_user_stats(referrer_id):
+                return
+            added = await self.user_storage.add_referral(referrer_id, user.id, args)
+            if added is None:
+                raise RuntimeError(f"referral {user.id} -> {referrer_id} not saved")
+            if added:
+                logger.info(f"✅ Referral added: {user.id} -> {referrer_id}")
+                # Отдельным заданием: повтор уведомления не повторяет запись реферала
+                self.side_effects.submit(
+                    f"referral_notify:{referrer_id}",
+                    lambda: self._notify_referrer(referrer_id, user.first_name)
+                )
+        
+        async def provision_thread():
             thread_id = await self.openai_client.get_or_create_thread(user.id)
-            
-            # Приветственное сообщение
-            welcome_msg = (
-                "Привет 👋\n"
-                "Бог любит тебя и я тоже!\n\n"
-                "Я не буду учить тебя жить и раздавать советы, со мной все просто и по-человечески комфортно 🤝\n\n"
-                "💬 Здесь тебе не нужно подбирать правильные слова. Просто напиши, что с тобой сейчас происходит, что беспокоит, своими словами, как есть…\n\n"
-                "📖 Я подберу слова из Священного Писания и помогу увидеть, как через них Бог отвечает именно в твою ситуацию.🙏\n\n"
-                "👉 Также можешь воспользоваться готовыми кнопками запросов в меню, там я собрал самые частые вопросы\n\n📖\n"
-                "<blockquote>Мф. 11:28\n«Придите ко Мне все труждающиеся и обременённые, и Я успокою вас».</blockquote>"
-            )
-            
-            # 🔥 ВАЖНО: меняем на HTML для поддержки blockquote
-            await message.answer(welcome_msg, parse_mode=ParseMode.HTML)
             logger.info(f"✅ Thread ready for user_id={user.id}: {thread_id}")
-            
-        except Exception as e:
-            logger.error(f"❌ Failed to setup thread for user {user_info}: {e}")
-            await message.answer(
-                "⚠️ Произошла ошибка при запуске. Попробуйте позже."
-            )
+        
+        self.side_effects.submit(f"start:{user.id}", save_user, record_referral, provision_thread)
+    
+    async def _notify_referrer(self, referrer_id: int, first_name: Optional[str]):
+        """Уведомляет реферера о новом пользователе по его ссылке"""
+        await self.outbound.send_message(
+            referrer_id,
+            f"<b>✨ Твоя ссылка — стала мостом к Свету.</b>\n\n<b>{first_name or 'Пользователь'}</b> только что зашёл в бота по твоей рекомендации.\n\nИ, возможно, именно сегодня он получил то слово, которое поддержало, исцелило, дало направление или просто согрело сердце.\n\n📖\n<blockquote>«Блаженны миротворцы, ибо они будут наречены сынами Божиими»\n(Матфея 5:9)</blockquote>",
+            parse_mode=ParseMode.HTML
+        )
+        logger.info(f"✅ Referral notification sent to {referrer_id}")
 
     async def initialize(self):
         """Инициализирует зависимости бота"""
         try:
             # Инициализируем хранилище
             await self.user_storage.initialize()
+            if self.fsm_storage:
+                await self.fsm_storage.initialize()
+            if self.leader:
+                await self.leader.initialize()
+            
+            # Админы не ограничиваются антифлудом
+            if self.antiflood:
+                admins = await self.user_storage.get_all_admins()
+                self.antiflood.set_exempt(self._antiflood_exempt_ids(admin['user_id'] for admin in admins))
             
             # Создаем OpenAI клиент после инициализации хранилища
             self.openai_client = OpenAIClient(self.user_storage)
             
+            # 🎙 Голосовые: распознавание через тот же HTTP-клиент OpenAI (или локальная заглушка)
+            if config.VOICE_ENABLED:
+                self.voice = VoicePipeline(
+                    self.bot,
+                    create_transcriber(
+                        config.VOICE_BACKEND,
+                        client=self.openai_client.client,
+                        model=config.VOICE_MODEL,
+                        language=config.VOICE_LANGUAGE
+                    ),
+                    on_transcript=self._on_voice_transcript,
+                    on_failure=self._on_voice_failure,
+                    download_concurrency=config.VOICE_DOWNLOAD_CONCURRENCY,
+                    transcribe_concurrency=config.VOICE_TRANSCRIBE_CONCURRENCY,
+                    queue_size=config.VOICE_QUEUE_SIZE
+                )
+                await self.voice.start()
+            
+            # Запускаем планировщик исходящих запросов и воркеры очереди сообщений
+            await self.outbound.start()
+            await self.typing.start()
+            await self.side_effects.start()
+            await self.queue_feedback.start()
+            if self.durable_queue and self.role != "worker":
+                self._inbox_load_task = asyncio.create_task(self._inbox_load_loop(), name="inbox-load")
+            if self.role != "ingest":
+                await self.worker_pool.start()
+            
+            # Возвращаем в очередь сообщения, не обработанные до прошлой остановки
+            await self._replay_pending_messages()
+            
             logger.info("✅ Bot dependencies initialized successfully")
         except Exception as e:
             logger.error(f"❌ Failed to initialize bot dependencies: {e}")
             raise
     
+    async def stop_intake(self):
+        """Прекращает прием новых обновлений (polling или вебхук)"""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._stopped.set()
+        logger.info("🛑 Stopping update intake...")
+        
+        if self.webhook_server:
+            await self.webhook_server.stop()
+            self.webhook_server = None
+            return
+        
+        try:
+            await self.dp.stop_polling()
+        except RuntimeError:
+            # Polling еще не запущен - start() увидит флаг и не запустит его
+            pass
+    
     async def close(self):
-        """Корректно закрывает ресурсы бота"""
+        """
+        Корректная остановка: прием -> дообработка текущих ответов (не дольше
+        SHUTDOWN_DEADLINE) -> сохранение очереди для переигровки -> закрытие пула БД
+        """
+        if self._closed:
+            return
+        self._closed = True
+        
+        await self.stop_intake()
+        await self._stop_warm_up()
+        # Распознанные до дедлайна голосовые еще попадут в очередь и будут сохранены
+        if self.voice:
+            await self.voice.stop(timeout=config.SHUTDOWN_DEADLINE / 2)
+        
+        leftovers = await self.worker_pool.drain(config.SHUTDOWN_DEADLINE)
+        await self._persist_pending_messages(leftovers)
+        
+        await self.queue_feedback.stop()
+        if self._inbox_load_task:
+            self._inbox_load_task.cancel()
+            await asyncio.gather(self._inbox_load_task, return_exceptions=True)
+            self._inbox_load_task = None
+        await self.side_effects.stop()
+        await self.typing.stop()
+        await self.outbound.stop()
+        if self.leader:
+            await self.leader.resign()
+        if self.fsm_storage:
+            await self.fsm_storage.close()
+        if self._owns_admin_bot:
+            await self.admin_bot.session.close()
         await self.user_storage.close()
         logger.info("✅ Bot resources closed")
     
+    async def _persist_pending_messages(self, leftovers: list):
+        """Сохраняет необработанные сообщения в pending_messages"""
+        if not leftovers:
+            return
+        
+        rows = []
+        for user_id, message_data, interrupted in leftovers:
+            try:
+                payload = json.dumps(self._encode_message_data(message_data), ensure_ascii=False)
+                rows.append((user_id, payload, interrupted))
+            except Exception as e:
+                logger.error(f"❌ Failed to serialize pending message for user_id={user_id}: {e}")
+        
+        if await self.user_storage.save_pending_messages(self.bot.id, rows):
+            logger.info(f"💾 Saved {len(rows)} pending messages for replay")
+    
+    async def _replay_pending_messages(self):
+        """Ставит в очередь сообщения, сохраненные при прошлой остановке"""
+        rows = await self.user_storage.pop_pending_messages(self.bot.id)
+        for row in rows:
+            try:
+                message_data = self._decode_message_data(json.loads(row['payload']))
+                message_data['enqueued_at'] = time.time()
+                await self._enqueue_message(row['user_id'], message_data)
+                if row['interrupted']:
+                    logger.info(f"♻️ Resuming answer interrupted by restart for user_id={row['user_id']}")
+            except Exception as e:
+                logger.error(f"❌ Failed to replay pending message {row['id']}: {e}")
+        
+        if rows:
+            logger.info(f"♻️ Replayed {len(rows)} pending messages")
+    
+    async def _wait_for_leadership(self) -> bool:
+        """Резервный экземпляр: ждет аренду ведущего, прогревая соединения"""
+        self._warm_task = asyncio.create_task(self._warm_up_loop(), name="standby-warm-up")
+        try:
+            return await self.leader.wait_for_leadership(self._stopped)
+        finally:
+            await self._stop_warm_up()
+    
+    async def _warm_up_loop(self):
+        while True:
+            await asyncio.sleep(config.STANDBY_WARM_UP_INTERVAL)
+            await self.openai_client.warm_up()
+            # Заодно освежаем кэш админов и проверяем пул БД
+            if self.antiflood:
+                admins = await self.user_storage.get_all_admins()
+                self.antiflood.set_exempt(self._antiflood_exempt_ids(admin['user_id'] for admin in admins))
+    
+    async def _stop_warm_up(self):
+        if self._warm_task:
+            self._warm_task.cancel()
+            await asyncio.gather(self._warm_task, return_exceptions=True)
+            self._warm_task = None
+    
     async def delete_webhook(self):
-        """Удаляем вебхук перед запуском поллинга"""
-        await self.bot.delete_webhook(drop_pending_updates=True)
+        """Удаляем вебхук перед запуском поллинга (накопившиеся обновления сохраняются)"""
+        await self.bot.delete_webhook(drop_pending_updates=False)
 
     def _register_handlers(self):
         """Регистрируем обработчики сообщений"""
@@ -757,6 +1148,8 @@ class TelegramBot:
         
         # 🔥 ВАЖНО: Сначала обработчики состояний, потом обычные сообщения
         self.dp.message.register(self._support_message_handler, StateFilter(SupportStates.waiting_for_message))
+        if config.VOICE_ENABLED:
+            self.dp.message.register(self._voice_handler, F.voice)
         self.dp.message.register(self._message_handler)  # Обычные сообщения - ПОСЛЕДНИМ
         
         # 🔥 УНИВЕРСАЛЬНЫЙ ОБРАБОТЧИК CALLBACK
@@ -764,40 +1157,74 @@ class TelegramBot:
         
         logger.info("✅ All handlers registered including universal callback handler")
 
-    async def _send_typing_periodically(self, chat_id: int):
-        """Периодически отправляет статус 'печатает...' в чат"""
-        try:
-            while True:
-                await self.bot.send_chat_action(chat_id, action="typing")
-                await asyncio.sleep(4.5)  # 🔥 Уменьшил интервал для более плавного отображения
-        except asyncio.CancelledError:
-            # 🔥 ПРИ ОТМЕНЕ СРАЗУ ВЫХОДИМ
-            return
-        except Exception as e:
-            logger.error(f"❌ Failed to send typing action: {e}")   
-    
     async def start(self):
-        """Запуск бота с исправлением проблемы кнопок"""
+        """Запуск бота в режиме polling или webhook (UPDATES_MODE)"""
+        # Явно указываем нужные типы обновлений
+        allowed_updates = ["message", "callback_query", "my_chat_member"]
+        
+        if self._stopping:
+            return
+        
+        if self.role == "worker":
+            # Обновления принимает ingest-процесс, здесь работают только воркеры inbox
+            logger.info(f"🔄 Worker process {config.WORKER_INDEX + 1}/{config.WORKER_COUNT} processing inbox...")
+            await self._stopped.wait()
+            return
+        
+        if self.leader and not await self._wait_for_leadership():
+            return
+        
+        if config.UPDATES_MODE == "webhook":
+            await self._start_webhook(allowed_updates)
+            return
+        
         logger.info("🔄 Starting bot polling with allowed_updates fix...")
         
         try:
-            # Важно: сбрасываем вебхук и настройки
-            await self.bot.delete_webhook(drop_pending_updates=True)
+            # Сбрасываем вебхук, но не накопившиеся обновления: сообщения, пришедшие
+            # во время рестарта или переключения на резервный процесс, обрабатываются
+            await self.delete_webhook()
             logger.info("✅ Webhook reset successfully")
             
-            # Даем время на обработку
-            await asyncio.sleep(2)
-            
-            # Явно указываем нужные типы обновлений
-            allowed_updates = ["message", "callback_query", "my_chat_member"]
-            
             await self.dp.start_polling(
                 self.bot,
                 allowed_updates=allowed_updates,
-                skip_updates=True,
-                timeout=60
+                skip_updates=False,
+                timeout=60,
+                # Сигналы обрабатывает main.py: остановка должна пройти через close()
+                handle_signals=False,
+                # Общую с другими ботами сессию закрывает хост
+                close_bot_session=self._owns_session
             )
             
         except Exception as e:
             logger.error(f"❌ Failed to start bot: {e}")
-            raise
\ No newline at end of file
+            raise
+    
+    async def _start_webhook(self, allowed_updates: list):
+        """Прием обновлений через вебхук без потери накопившихся сообщений"""
+        logger.info("🔄 Starting bot in webhook mode...")
+        
+        try:
+            deduplicator = UpdateDeduplicator(self.user_storage.db, self.bot.id)
+            await deduplicator.initialize()
+            
+            self.webhook_server = WebhookServer(
+                self.bot,
+                self.dp,
+                deduplicator,
+                base_url=config.WEBHOOK_BASE_URL,
+                path=config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET,
+                host=config.WEBHOOK_HOST,
+                port=config.WEBHOOK_PORT,
+                allowed_updates=allowed_updates,
+                intake_size=config.WEBHOOK_INTAKE_SIZE,
+                consumers=config.MAX_WORKERS
+            )
+            await self.webhook_server.start()
+            await self.webhook_server.serve_forever()
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to start webhook: {e}")
+            raise
@@ -0,0 +1,413 @@
+"""
+Инкрементальный рендер Markdown-ответа ассистента в HTML, который принимает Telegram
+"""
+import re
+from html import escape
+from typing import List, Optional, Tuple
+
+_LINK_RE = re.compile(r'\[([^\[\]\n]+)\]\(([^()\s]+)\)')
+_HEADING_RE = re.compile(r'^#{1,6}\s+(.*)$')
+_FENCE = '```'
+_QUOTE_TAGS = ('<blockquote>', '</blockquote>')
+_EMPTY_TAG_RE = re.compile(r'<(b|i|s|code)></\1>')
+
+# Верхняя оценка того, на сколько символ удлиняется в HTML: экранирование (&amp;, &lt;,
+# &quot; в ссылках) или тег, в который превращается маркер разметки (включая закрывающий
+# тег, который дописывается к незавершенному хвосту)
+_HTML_EXTRA = {'&': 5, '<': 3, '>': 3, '"': 5, "'": 5, '`': 12, '*': 7, '_': 7, '~': 7, '[': 11}
+# Запас на обертку блока: <pre><code class="language-...">, <blockquote>, заголовок
+_BLOCK_OVERHEAD = 64
+
+# Маркеры разметки в порядке проверки (длинные раньше коротких)
+_MARKERS = (
+    ('**', 'b'),
+    ('__', 'b'),
+    ('~~', 's'),
+    ('*', 'i'),
+    ('_', 'i'),
+)
+
+
+def _html_weight(text: str) -> int:
+    """Оценка сверху длины HTML, в который отрендерится text"""
+    return len(text) + sum(text.count(char) * extra for char, extra in _HTML_EXTRA.items())
+
+
+def _tokenize(text: str, tail: bool) -> List[Tuple]:
+    """
+    Разбивает текст блока на токены:
+    ('text', s), ('mark', tag, literal, can_open, can_close), ('code', s), ('link', text, url)
+    """
+    tokens: List[Tuple] = []
+    buffer: List[str] = []
+    i = 0
+    length = len(text)
+
+    def flush():
+        if buffer:
+            tokens.append(('text', ''.join(buffer)))
+            buffer.clear()
+
+    while i < length:
+        char = text[i]
+
+        if char == '`':
+            end = text.find('`', i + 1)
+            if end != -1:
+                flush()
+                tokens.append(('code', text[i + 1:end]))
+                i = end + 1
+                continue
+            if tail:
+                # Код еще дописывается - показываем его как код до конца текста
+                flush()
+                tokens.append(('code', text[i + 1:]))
+                break
+            buffer.append(char)
+            i += 1
+            continue
+
+        if char == '[':
+            match = _LINK_RE.match(text, i)
+            if match:
+                flush()
+                tokens.append(('link', match.group(1), match.group(2)))
+                i = match.end()
+                continue
+
+        if char == '<':
+            quote_tag = next((tag for tag in _QUOTE_TAGS if text.startswith(tag, i)), None)
+            if quote_tag:
+                flush()
+                tokens.append(('mark', 'blockquote', quote_tag, True, True))
+                i += len(quote_tag)
+                continue
+
+        marker = next((m for m in _MARKERS if text.startswith(m[0], i)), None)
+        if marker:
+            literal, tag = marker
+            prev_char = text[i - 1] if i > 0 else ' '
+            next_char = text[i + len(literal)] if i + len(literal) < length else ' '
+            # Открывающий маркер прилегает к следующему символу, закрывающий - к предыдущему:
+            # "2 * 3 * 4" и маркеры списка - не разметка
+            can_open = not next_char.isspace()
+            can_close = not prev_char.isspace()
+            # Подчеркивания внутри слов (snake_case) - тоже не разметка
+            if literal[0] == '_' and prev_char.isalnum() and next_char.isalnum():
+                can_open = can_close = False
+            if not can_open and not can_close:
+                buffer.append(literal)
+                i += len(literal)
+                continue
+            flush()
+            tokens.append(('mark', tag, literal, can_open, can_close))
+            i += len(literal)
+            continue
+
+        buffer.append(char)
+        i += 1
+
+    flush()
+    return tokens
+
+
+def _render_inline(text: str, tail: bool = False) -> str:
+    """
+    Рендерит строчную разметку. Парные маркеры становятся тегами, непарные -
+    обычным текстом. Для незавершенного хвоста (tail) открытые теги закрываются в конце.
+    """
+    tokens = _tokenize(text, tail)
+
+    # Сопоставляем открывающие и закрывающие маркеры через стек
+    paired = [False] * len(tokens)
+    stack: List[int] = []
+    for index, token in enumerate(tokens):
+        if token[0] != 'mark':
+            continue
+        _, tag, literal, can_open, can_close = token
+        opener = None
+        if can_close:
+            opener = next((pos for pos in reversed(stack) if tokens[pos][1] == tag), None)
+        is_closing_quote = literal == '</blockquote>'
+        if opener is not None and (tag != 'blockquote' or is_closing_quote):
+            while stack and stack[-1] != opener:
+                stack.pop()
+            stack.pop()
+            paired[opener] = True
+            paired[index] = True
+        elif can_open and (tag != 'blockquote' or not is_closing_quote):
+            stack.append(index)
+
+    dangling = set(stack) if tail else set()
+
+    parts: List[str] = []
+    open_tags: List[str] = []
+    for index, token in enumerate(tokens):
+        kind = token[0]
+        if kind == 'text':
+            parts.append(escape(token[1], quote=False))
+        elif kind == 'code':
+            parts.append(f"<code>{escape(token[1], quote=False)}</code>")
+        elif kind == 'link':
+            parts.append(f'<a href="{escape(token[2])}">{escape(token[1], quote=False)}</a>')
+        elif paired[index]:
+            tag = token[1]
+            if open_tags and open_tags[-1] == tag:
+                open_tags.pop()
+                parts.append(f"</{tag}>")
+            else:
+                open_tags.append(tag)
+                parts.append(f"<{tag}>")
+        elif index in dangling:
+            open_tags.append(token[1])
+            parts.append(f"<{token[1]}>")
+        else:
+            parts.append(escape(token[2], quote=False))
+
+    for tag in reversed(open_tags):
+        parts.append(f"</{tag}>")
+
+    # Пустые теги (маркер в самом конце черновика, "****") Telegram показывать нечего
+    html = ''.join(parts)
+    while True:
+        cleaned = _EMPTY_TAG_RE.sub('', html)
+        if cleaned == html:
+            return html
+        html = cleaned
+
+
+def _render_block(block: str, tail: bool = False) -> str:
+    """Рендерит один блок (абзац, цитату, заголовок или блок кода)"""
+    if block.startswith(_FENCE):
+        first_line, _, body = block.partition('\n')
+        language = first_line[len(_FENCE):].strip()
+        if body.rstrip().endswith(_FENCE):
+            body = body.rstrip()[:-len(_FENCE)]
+        body = escape(body.rstrip('\n'), quote=False)
+        if not body:
+            # Только что открытый блок кода в черновике
+            return ''
+        if language:
+            return f'<pre><code class="language-{escape(language)}">{body}</code></pre>'
+        return f"<pre>{body}</pre>"
+
+    lines = block.split('\n')
+
+    if all(line.startswith('>') for line in lines):
+        quoted = _render_inline('\n'.join(line[1:].lstrip() for line in lines), tail)
+        return f"<blockquote>{quoted}</blockquote>" if quoted else ''
+
+    heading = _HEADING_RE.match(block) if len(lines) == 1 else None
+    if heading:
+        title = _render_inline(heading.group(1), tail)
+        return f"<b>{title}</b>" if title else ''
+
+    return _render_inline(block, tail)
+
+
+def _cut_point(text: str, start: int, end: int, budget: int, soft: bool) -> Tuple[int, int, str]:
+    """
+    Где разрезать слишком длинную строку text[start:end], чтобы первая часть уложилась
+    в budget (по оценке HTML): по последнему пробелу (soft), иначе жестко - как split_plain_text.
+    Возвращает (конец части, начало следующей, разделитель между ними)
+    """
+    weight = 0
+    limit = start
+    while limit < end:
+        weight += 1 + _HTML_EXTRA.get(text[limit], 0)
+        if weight > budget:
+            break
+        limit += 1
+    limit = max(limit, start + 1)
+    if soft and limit < end:
+        cut = text.rfind(' ', start + 1, limit + 1)
+        if cut > start:
+            return cut, cut + 1, ' '
+    return limit, limit, ''
+
+
+class _BlockSplitter:
+    """
+    Делит текст на завершенные блоки. Блок завершается пустой строкой вне кода, а также
+    принудительно, если его HTML может не уложиться в max_block_chars: перед очередной
+    строкой, внутри слишком длинной строки (по пробелу или жестко) и внутри блока кода -
+    такой блок закрывается, а следующий продолжает код с той же строкой ```
+    """
+
+    def __init__(self, text: str, max_block_chars: int, fence: Optional[str] = None):
+        self.text = text
+        self.budget = max(max_block_chars - _BLOCK_OVERHEAD, 16)
+        self.blocks: List[Tuple[int, str, str]] = []
+        # Строка открытия кода, внутри которого находится текущая позиция
+        self.fence = fence
+        self._reset(0)
+
+    def _reset(self, start: int):
+        self.start = start
+        # Строка открытия кода, внутри которого начинается текущий блок
+        self.start_fence = self.fence
+        self.prefix = f"{self.fence}\n" if self.fence else ''
+        self.weight = _html_weight(self.prefix)
+        # В блоке есть что-то, кроме строки открытия кода
+        self.has_body = False
+        # Блок кода закрыт: следующая непустая строка начинает новый блок
+        self.fence_closed = False
+
+    def _close(self, end: int, sep: str, next_start: int):
+        self.blocks.append((self.start, self.prefix + self.text[self.start:end], sep))
+        self._reset(next_start)
+
+    def _split_line(self, line_start: int, end: int) -> int:
+        """Отрезает от строки части, пока остаток не уложится в бюджет. Возвращает начало остатка"""
+        while self.weight + _html_weight(self.text[line_start:end]) > self.budget:
+            cut, line_start, sep = _cut_point(
+                self.text, line_start, end, self.budget - self.weight, soft=self.fence is None
+            )
+            self._close(cut, sep, line_start)
+        return line_start
+
+    def split(self) -> Tuple[List[Tuple[int, str, str]], int, Optional[str]]:
+        """
+        Возвращает тройки (начало блока в тексте, текст блока для рендера, разделитель после
+        него), начало незавершенного хвоста и строку открытия кода, внутри которого он начинается
+        """
+        text = self.text
+        pos = 0
+        while True:
+            newline = text.find('\n', pos)
+            if newline == -1:
+                break
+            line = text[pos:newline]
+            is_fence_line = line.lstrip().startswith(_FENCE)
+
+            if self.fence is None and not line.strip():
+                # Пустая строка вне кода завершает блок
+                if pos > self.start:
+                    self._close(pos - 1, '\n\n', newline + 1)
+                else:
+                    self.start = newline + 1
+                pos = newline + 1
+                continue
+
+            line_weight = _html_weight(line) + 1
+            closing_fence = is_fence_line and self.fence is not None
+            if pos > self.start and (
+                self.fence_closed
+                or (is_fence_line and self.fence is None)
+                or (self.has_body and not closing_fence and self.weight + line_weight > self.budget)
+            ):
+                self._close(pos - 1, '\n', pos)
+
+            if is_fence_line:
+                self.fence = None if closing_fence else line.strip()
+                self.fence_closed = closing_fence
+                self.weight += line_weight
+            else:
+                rest = self._split_line(pos, newline)
+                self.weight += _html_weight(text[rest:newline]) + 1
+            self.has_body = self.has_body or not is_fence_line or closing_fence
+            pos = newline + 1
+
+        # Хвост - недописанная строка; слишком длинный режется так же
+        if pos < len(text) and text[pos:].strip():
+            if pos > self.start and (
+                self.fence_closed
+                or (self.has_body and self.weight + _html_weight(text[pos:]) > self.budget)
+            ):
+                self._close(pos - 1, '\n', pos)
+            self._split_line(pos, len(text))
+
+        return self.blocks, self.start, self.start_fence
+
+
+class StreamingHtmlRenderer:
+    """
+    Копит ответ модели по кускам и отдает Telegram-безопасный HTML.
+    Завершенные блоки рендерятся один раз и кешируются, при каждом
+    обновлении перерисовывается только последний (незавершенный) блок.
+    """
+
+    def __init__(self, max_block_chars: int = 3000):
+        self.max_block_chars = max_block_chars
+        self._source: List[str] = []
+        self._text = ''
+        self._committed_pos = 0
+        # Строка открытия кода, если хвост продолжает разрезанный блок кода
+        self._fence: Optional[str] = None
+        self._committed: List[Tuple[str, str]] = []
+        self._offsets: List[int] = []
+        self._next_sep = ''
+        self._cache: Optional[Tuple[bool, List[Tuple[str, str]]]] = None
+
+    def feed(self, chunk: str):
+        """Добавляет очередной кусок ответа"""
+        if chunk:
+            self._source.append(chunk)
+            self._cache = None
+
+    @property
+    def text(self) -> str:
+        """Исходный текст ответа"""
+        if self._source:
+            self._text += ''.join(self._source)
+            self._source.clear()
+        return self._text
+
+    @property
+    def committed_count(self) -> int:
+        """Сколько блоков уже завершено (они больше не меняются)"""
+        return len(self._committed)
+
+    def blocks(self, final: bool = False) -> List[Tuple[str, str]]:
+        """
+        Отрендеренные блоки ответа в виде пар (разделитель перед блоком, html).
+        Последний блок - незавершенный хвост, если он есть. HTML каждого блока,
+        включая хвост, не длиннее max_block_chars
+        """
+        if self._cache and self._cache[0] == final:
+            return self._cache[1]
+
+        text = self.text
+        base = self._committed_pos
+        blocks, tail_start, self._fence = _BlockSplitter(
+            text[base:], self.max_block_chars, self._fence
+        ).split()
+        for block_start, block, sep_after in blocks:
+            self._offsets.append(base + block_start)
+            self._committed.append((self._next_sep, _render_block(block)))
+            self._next_sep = sep_after
+        self._committed_pos = base + tail_start
+        tail = text[self._committed_pos:].strip('\n')
+
+        result = list(self._committed)
+        if tail:
+            prefix = f"{self._fence}\n" if self._fence else ''
+            result.append((self._next_sep, _render_block(prefix + tail, tail=not final)))
+
+        self._cache = (final, result)
+        return result
+
+    def source_offset(self, index: int) -> int:
+        """Позиция в исходном тексте, с которой начинается блок index"""
+        if index < len(self._offsets):
+            return self._offsets[index]
+        return self._committed_pos
+
+    def render(self, final: bool = False) -> str:
+        """HTML всего ответа. В черновом режиме открытые сущности хвоста закрываются"""
+        return join_blocks(self.blocks(final))
+
+
+def join_blocks(blocks: List[Tuple[str, str]]) -> str:
+    """Склеивает блоки с их разделителями (разделитель первого блока отбрасывается)"""
+    return ''.join(
+        html if index == 0 else sep + html
+        for index, (sep, html) in enumerate(blocks)
+    )
+
+
+def markdown_to_html(text: str) -> str:
+    """Рендерит готовый ответ целиком"""
+    renderer = StreamingHtmlRenderer()
+    renderer.feed(text)
+    return renderer.render(final=True)
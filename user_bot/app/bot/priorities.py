@@ -0,0 +1,32 @@
+"""
+Middleware, которое выполняет обработчики под слотом планировщика приоритетов
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.helpers.priority_scheduler import PriorityScheduler
+
+Classifier = Callable[[TelegramObject, Dict[str, Any]], Optional[str]]
+
+
+class PriorityMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware (после фильтров, когда обработчик уже выбран):
+    classify возвращает класс приоритета или None, если обработчик
+    не нуждается в слоте (например, только ставит сообщение в очередь)
+    """
+
+    def __init__(self, scheduler: PriorityScheduler, classify: Classifier):
+        self.scheduler = scheduler
+        self.classify = classify
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        priority = self.classify(event, data)
+        if priority is None:
+            return await handler(event, data)
+
+        async with self.scheduler.slot(priority):
+            return await handler(event, data)
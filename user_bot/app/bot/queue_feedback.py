@@ -0,0 +1,164 @@
+"""
+Обратная связь по очереди: позиция и ожидаемое время ответа, вежливый отказ при перегрузке
+"""
+import asyncio
+import logging
+import math
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.enums import ParseMode
+
+from app.helpers.metrics import metrics
+from app.helpers.outbound import OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+QUEUED_TEXT = (
+    "🕐 <i>Вы в очереди: {position}-й. Ответ примерно через {eta}.</i>\n"
+    "<i>Сообщение уже принято, отправлять его повторно не нужно.</i>"
+)
+SHED_TEXT = (
+    "😔 Сейчас очень много вопросов, и быстро ответить я не успею.\n"
+    "Пожалуйста, отправьте сообщение еще раз через {eta}."
+)
+USER_QUEUE_TEXT = (
+    "⏳ Ваши предыдущие сообщения еще в очереди ({depth}). "
+    "Дождитесь ответа на них, пожалуйста."
+)
+
+
+def format_eta(seconds: float) -> str:
+    """Человекочитаемое время ожидания"""
+    if seconds < 60:
+        return "меньше минуты"
+    return f"~{math.ceil(seconds / 60)} мин."
+
+
+class StageLatency:
+    """Скользящие средние (EWMA) длительности этапов обработки: queue - ожидание, llm - ответ"""
+
+    def __init__(self, alpha: float = 0.2, defaults: Optional[Dict[str, float]] = None):
+        self.alpha = alpha
+        self._means: Dict[str, float] = dict(defaults or {})
+
+    def record(self, stage: str, seconds: float):
+        previous = self._means.get(stage)
+        self._means[stage] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+        metrics.observe('stage_seconds', seconds, stage=stage)
+
+    def mean(self, stage: str) -> float:
+        return self._means.get(stage, 0.0)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {stage: round(value, 2) for stage, value in self._means.items()}
+
+
+class QueueFeedback:
+    """
+    Оценивает ожидание по глубине очереди и средней длительности ответа.
+    Ожидающим отправляет сообщение с позицией и ETA и периодически обновляет
+    его через планировщик правок; когда ответ начинается, это же сообщение
+    становится сообщением ответа. Выше shed_backlog новые сообщения не принимаются.
+
+    Текущую позицию дает positions: по (chat_id, message_id) сообщений пользователя
+    возвращает их места в очереди (None - узнать не удалось); сообщения, которых
+    в очереди уже нет, больше не обновляются
+    """
+
+    def __init__(self, outbound: OutboundScheduler, latency: StageLatency, parallelism: int,
+                 positions: Callable[[List[Tuple[int, int]]], Awaitable[Optional[Dict[Tuple[int, int], int]]]],
+                 shed_backlog: int = 200, user_queue_limit: int = 3,
+                 update_interval: float = 15.0, track_updates: bool = True):
+        self.outbound = outbound
+        self.latency = latency
+        self.parallelism = max(1, parallelism)
+        self.positions = positions
+        self.shed_backlog = shed_backlog
+        self.user_queue_limit = user_queue_limit
+        self.update_interval = update_interval
+        # В ingest-процессе ответ начинает другой процесс - обновлять позицию здесь нельзя
+        self.track_updates = track_updates
+        # (chat_id, id сообщения с позицией) -> id сообщения пользователя в очереди
+        self._waiting: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def eta(self, position: int) -> float:
+        """Ожидаемое время до начала ответа + сам ответ для позиции position"""
+        rounds = math.ceil(position / self.parallelism)
+        return rounds * self.latency.mean('llm')
+
+    def shed_text(self, waiting: int, user_depth: int) -> Optional[str]:
+        """Текст отказа, если сообщение не стоит ставить в очередь, иначе None"""
+        if self.user_queue_limit and user_depth >= self.user_queue_limit:
+            metrics.incr('shed_total', reason='user_queue')
+            return USER_QUEUE_TEXT.format(depth=user_depth)
+        if self.shed_backlog and waiting >= self.shed_backlog:
+            metrics.incr('shed_total', reason='backlog')
+            return SHED_TEXT.format(eta=format_eta(self.eta(waiting)))
+        return None
+
+    async def announce(self, chat_id: int, reply_to_message_id: int, position: int) -> Optional[int]:
+        """Отправляет сообщение с позицией в очереди. Возвращает его id"""
+        try:
+            placeholder = await self.outbound.send_message(
+                chat_id,
+                self._text(position),
+                parse_mode=ParseMode.HTML,
+                reply_to_message_id=reply_to_message_id
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to send queue position to chat {chat_id}: {e}")
+            return None
+
+        if self.track_updates:
+            self._waiting[(chat_id, placeholder.message_id)] = reply_to_message_id
+        return placeholder.message_id
+
+    def started(self, chat_id: int, placeholder_id: int):
+        """Ответ начался (или сообщение не попало в очередь) - позицию больше не обновляем"""
+        self._waiting.pop((chat_id, placeholder_id), None)
+
+    async def start(self):
+        if self._task is None and self.track_updates:
+            self._task = asyncio.create_task(self._update_loop(), name="queue-feedback")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _text(self, position: int) -> str:
+        return QUEUED_TEXT.format(position=position, eta=format_eta(self.eta(position)))
+
+    async def _update_loop(self):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            if self._waiting:
+                await self._update_positions()
+
+    async def _update_positions(self):
+        waiting = list(self._waiting.items())
+        try:
+            positions = await self.positions([(chat_id, message_id) for (chat_id, _), message_id in waiting])
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to get queue positions: {e}")
+            return
+        if positions is None:
+            return
+
+        # Неизменившийся текст планировщик не отправляет, частые правки он сам разрежает
+        for (chat_id, placeholder_id), message_id in waiting:
+            position = positions.get((chat_id, message_id))
+            if position is None:
+                # Сообщения уже нет в очереди - ответ начался или оно не было принято
+                self._waiting.pop((chat_id, placeholder_id), None)
+                continue
+            self.outbound.edit_text(chat_id, placeholder_id, self._text(position), parse_mode=ParseMode.HTML)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'announced_waiting': len(self._waiting),
+            'latency': self.latency.snapshot()
+        }
@@ -0,0 +1,188 @@
+"""
+Отображение стримингового ответа: сообщение-заглушка, промежуточные правки, финальный текст
+"""
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from aiogram.enums import ParseMode
+
+from app.bot.html_renderer import StreamingHtmlRenderer, join_blocks
+from app.helpers.outbound import OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_TEXT = "⏳ <i>Формирую ответ...</i>"
+INTERRUPTED_TEXT = "⏸ <i>Бот перезапускается, ответ придет после перезапуска.</i>"
+
+# Лимит Telegram - 4096 символов текста; HTML длиннее видимого текста, поэтому считаем по нему с запасом
+PAGE_LIMIT = 4000
+# Блок ответа не длиннее PAGE_BLOCK_LIMIT символов HTML, так что страница всегда режется по границе блока
+PAGE_BLOCK_LIMIT = 3000
+
+
+def split_plain_text(text: str, limit: int = PAGE_LIMIT) -> List[str]:
+    """Делит обычный текст на части не длиннее limit по абзацам, строкам или пробелам"""
+    parts = []
+    while len(text) > limit:
+        cut = -1
+        for separator in ('\n\n', '\n', ' '):
+            cut = text.rfind(separator, 0, limit)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+class StreamingAnswer:
+    """
+    Показывает ответ модели по мере генерации. Текст рендерится в HTML
+    (открытые сущности черновика закрываются), правки отправляются через
+    планировщик с интервалом, который он подбирает под нагрузку.
+
+    Если ответ не помещается в одно сообщение, текущая страница фиксируется
+    по границе блока и ответ продолжается в новом сообщении; правки касаются
+    только последней страницы. Рендерер сам режет длинные абзацы, строки и блоки
+    кода так, чтобы HTML любого блока (и хвоста) вместе с пометкой о генерации
+    помещался на страницу, поэтому граница для разреза есть всегда.
+    """
+
+    def __init__(self, outbound: OutboundScheduler, chat_id: int,
+                 reply_to_message_id: Optional[int] = None,
+                 progress_text: str = PROGRESS_TEXT,
+                 page_limit: int = PAGE_LIMIT,
+                 placeholder_id: Optional[int] = None):
+        self.outbound = outbound
+        self.chat_id = chat_id
+        self.reply_to_message_id = reply_to_message_id
+        self.progress_text = progress_text
+        self.page_limit = page_limit
+        # Уже отправленное сообщение (например, с позицией в очереди), которое станет первой страницей
+        self.placeholder_id = placeholder_id
+        # Место под пометку "формирую ответ" в черновых правках
+        self._reserve = len(progress_text) + 2
+        self.renderer = StreamingHtmlRenderer(
+            max_block_chars=min(PAGE_BLOCK_LIMIT, page_limit - self._reserve)
+        )
+        self.message_ids: List[int] = []
+        self._page_start = 0
+        self._last_update_time = 0.0
+        self._has_text = False
+
+    @property
+    def text(self) -> str:
+        """Исходный (markdown) текст ответа"""
+        return self.renderer.text
+
+    @property
+    def message_id(self) -> Optional[int]:
+        """Сообщение текущей (последней) страницы"""
+        return self.message_ids[-1] if self.message_ids else None
+
+    async def start(self):
+        """Отправляет сообщение-заглушку (или превращает в нее уже отправленное)"""
+        if self.placeholder_id:
+            self.message_ids.append(self.placeholder_id)
+            self.outbound.edit_text(self.chat_id, self.placeholder_id, self.progress_text, parse_mode=ParseMode.HTML)
+        else:
+            await self._open_page(reply=True)
+        self._last_update_time = asyncio.get_event_loop().time()
+
+    async def feed(self, chunk: str):
+        """Добавляет кусок ответа и, если пора, ставит правку последней страницы в очередь"""
+        if not chunk:
+            return
+        self.renderer.feed(chunk)
+        self._has_text = True
+
+        current_time = asyncio.get_event_loop().time()
+        if current_time - self._last_update_time < self.outbound.edit_interval():
+            return
+
+        blocks = self.renderer.blocks()
+        await self._roll_pages(blocks, reserve=self._reserve)
+        text = f"{join_blocks(blocks[self._page_start:])}\n\n{self.progress_text}"
+        if len(text) <= self.page_limit:
+            # Правку длиннее лимита Telegram все равно отклонит - ждем следующей
+            self.outbound.edit_text(self.chat_id, self.message_id, text, parse_mode=ParseMode.HTML)
+        self._last_update_time = current_time
+
+    async def finish(self) -> bool:
+        """Финальная правка. При отказе Telegram отправляет остаток ответа обычным текстом"""
+        if not self._has_text or self.message_id is None:
+            return False
+
+        blocks = self.renderer.blocks(final=True)
+        await self._roll_pages(blocks, reserve=0)
+        message_id = self.message_id
+
+        try:
+            page_html = join_blocks(blocks[self._page_start:])
+            if len(page_html) > self.page_limit:
+                raise ValueError(f"last page is {len(page_html)} chars")
+            await self.outbound.edit_text(self.chat_id, message_id, page_html, parse_mode=ParseMode.HTML)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Final edit failed for chat {self.chat_id}: {e}")
+            # Предыдущие страницы уже зафиксированы, досылаем только последнюю
+            text = self.text[self.renderer.source_offset(self._page_start):]
+            for part in split_plain_text(text, self.page_limit):
+                await self.outbound.send_message(self.chat_id, part)
+            return False
+        finally:
+            for page_message_id in self.message_ids:
+                self.outbound.forget_message(self.chat_id, page_message_id)
+
+    def interrupt(self, note: str = INTERRUPTED_TEXT):
+        """
+        Фиксирует уже показанную часть ответа с пометкой о прерывании.
+        Не ждет отправки - вызывается при отмене задачи во время остановки бота
+        """
+        if self.message_id is None:
+            return
+
+        body = join_blocks(self.renderer.blocks(final=True)[self._page_start:]) if self._has_text else ''
+        text = f"{body}\n\n{note}" if body else note
+        if len(text) > self.page_limit:
+            text = note
+
+        self.outbound.edit_text(self.chat_id, self.message_id, text, parse_mode=ParseMode.HTML)
+        for page_message_id in self.message_ids:
+            self.outbound.forget_message(self.chat_id, page_message_id)
+
+    async def _open_page(self, reply: bool = False):
+        kwargs = {'parse_mode': ParseMode.HTML}
+        if reply and self.reply_to_message_id:
+            kwargs['reply_to_message_id'] = self.reply_to_message_id
+        message = await self.outbound.send_message(self.chat_id, self.progress_text, **kwargs)
+        self.message_ids.append(message.message_id)
+
+    async def _roll_pages(self, blocks: List[Tuple[str, str]], reserve: int):
+        """Пока текущая страница не влезает, фиксирует ее по границе завершенного блока"""
+        limit = self.page_limit - reserve
+
+        while len(join_blocks(blocks[self._page_start:])) > limit:
+            committed = self.renderer.committed_count
+            if committed <= self._page_start:
+                # Хвост длиннее страницы: рендерер так не режет, но если это случилось,
+                # правки пропускаются до следующего завершенного блока
+                logger.warning(f"⚠️ Answer tail does not fit a page for chat {self.chat_id}")
+                return
+
+            end = self._page_start + 1
+            while end < committed and len(join_blocks(blocks[self._page_start:end + 1])) <= limit:
+                end += 1
+            if end == len(blocks):
+                return
+
+            page_html = join_blocks(blocks[self._page_start:end])
+            self.outbound.edit_text(self.chat_id, self.message_id, page_html, parse_mode=ParseMode.HTML)
+            logger.info(f"📄 Answer page {len(self.message_ids)} closed for chat {self.chat_id}")
+
+            self._page_start = end
+            await self._open_page()
@@ -0,0 +1,156 @@
+"""
+Пул воркеров поверх надежной очереди inbox в PostgreSQL
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.storage.inbox_storage import InboxStorage
+
+logger = logging.getLogger(__name__)
+
+PayloadHandler = Callable[[int, Dict[str, Any]], Awaitable[None]]
+
+
+class InboxWorkerPool:
+    """
+    Воркеры забирают сообщения из таблицы inbox (блокировка пользователя в PostgreSQL),
+    поэтому их можно запускать в нескольких процессах на один токен бота.
+    Новые сообщения будят воркеры через LISTEN/NOTIFY, на случай потери
+    уведомления очередь дополнительно опрашивается раз в poll_interval.
+
+    Занятый воркер держит соединение пула до конца ответа, плюс одно соединение
+    занимает LISTEN: пулу нужно не меньше workers + 1 соединений сверх обычной нагрузки.
+    """
+
+    def __init__(self, inbox: InboxStorage, handler: PayloadHandler, workers: int = 5,
+                 poll_interval: float = 2.0, retry_delay: float = 30.0, recover_interval: float = 60.0):
+        self.inbox = inbox
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.recover_interval = recover_interval
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._busy: List[Optional[int]] = [None] * self.workers
+        self._accepting = True
+        self._processed = 0
+        self._failed = 0
+
+    async def start(self):
+        """Подписывается на уведомления и запускает воркеры"""
+        if self._tasks:
+            return
+        pool_size = self.inbox.db.pool.get_max_size()
+        if pool_size <= self.workers + 1:
+            logger.warning(
+                f"⚠️ DB pool max size {pool_size} leaves no room next to {self.workers} inbox workers "
+                f"(each holds a connection for the whole answer)"
+            )
+        await self.inbox.listen(self._wakeup.set)
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"inbox-worker-{index}")
+            for index in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop(), name="inbox-cleanup"))
+        self._tasks.append(asyncio.create_task(self._recover_loop(), name="inbox-recover"))
+        logger.info(f"✅ Inbox worker pool started with {self.workers} workers ({self.worker_prefix})")
+
+    async def stop(self):
+        """Останавливает воркеры; прерванные сообщения остаются в очереди"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.inbox.unlisten()
+        logger.info("✅ Inbox worker pool stopped")
+
+    async def drain(self, timeout: float) -> list:
+        """
+        Перестает брать новые сообщения и ждет текущие не дольше timeout.
+        Сохранять ничего не нужно - необработанное остается в inbox, поэтому список пуст
+        """
+        self._accepting = False
+        self._wakeup.set()
+        deadline = time.monotonic() + timeout
+
+        while any(user_id is not None for user_id in self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        interrupted = sum(1 for user_id in self._busy if user_id is not None)
+        if interrupted:
+            logger.warning(f"⚠️ {interrupted} answers interrupted by shutdown deadline, left in inbox")
+
+        await self.stop()
+        return []
+
+    async def submit(self, user_id: int, chat_id: int, message_id: int,
+                     payload: Dict[str, Any]) -> int:
+        """Записывает сообщение в inbox. Возвращает число ожидающих сообщений пользователя"""
+        return await self.inbox.enqueue(user_id, chat_id, message_id, payload)
+
+    async def _worker(self, index: int):
+        """Цикл одного воркера"""
+        worker_id = f"{self.worker_prefix}:{index}"
+
+        while self._accepting:
+            self._wakeup.clear()
+            try:
+                claim = await self.inbox.claim(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Inbox worker {index} failed to claim message: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if claim is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._busy[index] = claim.user_id
+            try:
+                await self.handler(claim.user_id, claim.payload)
+            except asyncio.CancelledError:
+                await self.inbox.abandon(claim)
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"❌ Inbox worker {index} failed to process message {claim.id}: {e}")
+                await self.inbox.retry(claim, str(e), self.retry_delay)
+            else:
+                await self.inbox.complete(claim)
+            finally:
+                self._busy[index] = None
+                self._processed += 1
+
+    async def _recover_loop(self):
+        """Возвращает в очередь строки упавших процессов (и этого процесса до рестарта)"""
+        while True:
+            if await self.inbox.recover():
+                self._wakeup.set()
+            await asyncio.sleep(self.recover_interval)
+
+    async def _cleanup_loop(self):
+        while True:
+            await self.inbox.cleanup()
+            await asyncio.sleep(3600)
+
+    def stats(self) -> Dict[str, Any]:
+        """Загрузка воркеров этого процесса"""
+        return {
+            'workers': self.workers,
+            'busy_workers': sum(1 for user_id in self._busy if user_id is not None),
+            'processed_total': self._processed,
+            'failed_total': self._failed,
+            'worker_prefix': self.worker_prefix
+        }
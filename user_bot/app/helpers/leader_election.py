@@ -0,0 +1,164 @@
+"""
+Выбор ведущего экземпляра бота (hot standby): advisory-блокировка PostgreSQL + аренда
+"""
+import asyncio
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, Optional
+
+from app.helpers.metrics import metrics
+from shared.storage.queries import queries
+
+logger = logging.getLogger(__name__)
+
+# Пространство ключей advisory-блокировок выбора ведущего
+LEADER_LOCK_NAMESPACE = 7302
+
+
+class LeaderElection:
+    """
+    Ведущим становится экземпляр, взявший сессионную advisory-блокировку по имени.
+    Блокировка снимается сама, если процесс упал. Чтобы пережить и зависание
+    (процесс жив, соединение открыто, но не работает), ведущий продлевает аренду
+    в таблице bot_leader; если аренда истекла, ведомый завершает сессию зависшего
+    ведущего (pg_terminate_backend) и забирает блокировку.
+
+    Ведущий, у которого не получилось продлить аренду, сразу слагает полномочия
+    через on_lost - чтобы два экземпляра не опрашивали Telegram одновременно.
+    """
+
+    def __init__(self, db, name: str, lease_seconds: float = 15.0, heartbeat_interval: float = 3.0,
+                 on_lost: Optional[Callable[[], Awaitable[None]]] = None):
+        self.db = db
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.on_lost = on_lost
+        self.holder = f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self._conn = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    async def initialize(self):
+        """Создает таблицу аренды"""
+        async with self.db.get_connection() as conn:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS bot_leader (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    backend_pid INTEGER NOT NULL,
+                    acquired_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    renewed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    lease_until TIMESTAMP WITH TIME ZONE NOT NULL
+                )
+            ''')
+
+    async def wait_for_leadership(self, stop_event: asyncio.Event) -> bool:
+        """
+        Ждет, пока экземпляр станет ведущим. Возвращает False, если раньше
+        пришла остановка (stop_event)
+        """
+        logged_follower = False
+        while not stop_event.is_set():
+            try:
+                if await self._try_acquire():
+                    return True
+            except Exception as e:
+                logger.error(f"❌ Leader election attempt failed: {e}")
+                await self._drop_connection()
+
+            if not logged_follower:
+                logger.info(f"💤 Standby: {self.holder} is a follower for '{self.name}'")
+                logged_follower = True
+
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+        return False
+
+    async def resign(self):
+        """Слагает полномочия (при остановке): блокировка и аренда освобождаются сразу"""
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+
+        if self._conn is not None and self.is_leader:
+            try:
+                await queries.execute(self._conn, 'leader.release', self.name, self.holder)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to release leader lease: {e}")
+        self.is_leader = False
+        await self._drop_connection()
+
+    async def _try_acquire(self) -> bool:
+        if self._conn is None:
+            self._conn = await self.db.pool.acquire()
+
+        if not await queries.fetchval(self._conn, 'leader.lock', LEADER_LOCK_NAMESPACE, self.name):
+            await self._take_over_if_expired()
+            return False
+
+        # Блокировка наша. Время переключения - от последнего продления аренды
+        # прежним ведущим (последний признак жизни) до этого момента
+        previous = await queries.fetchrow(self._conn, 'leader.previous', self.name)
+        await queries.execute(self._conn, 'leader.acquire', self.name, self.holder, float(self.lease_seconds))
+
+        self.is_leader = True
+        if previous and previous['holder'] != self.holder:
+            failover = max(0.0, float(previous['silent_for'] or 0))
+            metrics.observe('leader_failover_seconds', failover)
+            logger.warning(f"👑 {self.holder} took over '{self.name}' from {previous['holder']} "
+                           f"after {failover:.1f}s without a leader")
+        else:
+            logger.info(f"👑 {self.holder} is the leader for '{self.name}'")
+        metrics.incr('leader_elected_total')
+
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop(), name="leader-heartbeat")
+        return True
+
+    async def _take_over_if_expired(self):
+        """Если аренда ведущего истекла - ведущий завис, завершаем его сессию"""
+        row = await queries.fetchrow(self._conn, 'leader.expired', self.name)
+        if row is None:
+            return
+
+        terminated = await queries.fetchval(
+            self._conn, 'leader.terminate', LEADER_LOCK_NAMESPACE, self.name, row['backend_pid']
+        )
+        if terminated:
+            logger.warning(f"⚠️ Leader {row['holder']} stopped renewing its lease, session terminated")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                renewed = await asyncio.wait_for(
+                    queries.fetchval(self._conn, 'leader.renew', self.name, self.holder, float(self.lease_seconds)),
+                    timeout=self.lease_seconds / 2
+                )
+            except Exception as e:
+                logger.error(f"❌ Leader lease renewal failed: {e}")
+                renewed = None
+
+            if not renewed:
+                logger.error(f"❌ {self.holder} lost leadership for '{self.name}'")
+                metrics.incr('leader_lost_total')
+                self.is_leader = False
+                self._heartbeat_task = None
+                await self._drop_connection()
+                if self.on_lost:
+                    await self.on_lost()
+                return
+
+    async def _drop_connection(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        try:
+            # Сброс соединения при возврате в пул снимает и advisory-блокировки
+            await self.db.pool.release(conn)
+        except Exception:
+            conn.terminate()
@@ -0,0 +1,168 @@
+"""
+Компактный реестр почтовых ящиков пользователей (очередь сообщений на пользователя)
+"""
+import logging
+import sys
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """Почтовый ящик одного пользователя"""
+
+    __slots__ = ('user_id', 'items', 'active', 'last_used')
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.items: deque = deque()
+        self.active = False
+        self.last_used = time.monotonic()
+
+
+class MailboxRegistry:
+    """
+    Реестр ящиков с вытеснением простаивающих.
+
+    Все операции синхронные: между проверкой и сменой состояния нет await,
+    поэтому передача ящика обработчику в asyncio не имеет гонок.
+    """
+
+    def __init__(self, idle_ttl: float = 600.0, sweep_interval: float = 60.0):
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self._boxes: Dict[int, Mailbox] = {}
+        self._last_sweep = time.monotonic()
+        self._evicted_total = 0
+        self._queued = 0
+
+    def put(self, user_id: int, item: Any) -> bool:
+        """
+        Кладет сообщение в ящик пользователя.
+        Возвращает True, если вызывающий должен запустить обработчик ящика.
+        """
+        now = time.monotonic()
+        box = self._boxes.get(user_id)
+        if box is None:
+            box = Mailbox(user_id)
+            self._boxes[user_id] = box
+
+        box.items.append(item)
+        box.last_used = now
+        self._queued += 1
+
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+        if box.active:
+            return False
+
+        box.active = True
+        return True
+
+    def take(self, user_id: int) -> Optional[Any]:
+        """
+        Забирает следующее сообщение. Если ящик пуст - снимает флаг обработки
+        в том же шаге и возвращает None.
+        """
+        box = self._boxes.get(user_id)
+        if box is None:
+            return None
+
+        box.last_used = time.monotonic()
+        if box.items:
+            self._queued -= 1
+            return box.items.popleft()
+
+        box.active = False
+        return None
+
+    def release(self, user_id: int) -> bool:
+        """
+        Завершает обработку очередного сообщения.
+        Возвращает True, если в ящике есть еще сообщения (ящик остается активным),
+        иначе снимает флаг обработки.
+        """
+        box = self._boxes.get(user_id)
+        if box is None:
+            return False
+
+        box.last_used = time.monotonic()
+        if box.items:
+            return True
+
+        box.active = False
+        return False
+
+    def depth(self, user_id: int) -> int:
+        """Количество сообщений, ожидающих в ящике пользователя"""
+        box = self._boxes.get(user_id)
+        return len(box.items) if box else 0
+
+    @property
+    def queued_total(self) -> int:
+        """Сколько сообщений ждет во всех ящиках (без обхода реестра)"""
+        return self._queued
+
+    def is_active(self, user_id: int) -> bool:
+        """Обрабатывается ли сейчас ящик пользователя"""
+        box = self._boxes.get(user_id)
+        return bool(box and box.active)
+
+    def queued_items(self) -> List[Tuple[int, Any]]:
+        """Ожидающие сообщения всех ящиков (без извлечения)"""
+        return [
+            (user_id, item)
+            for user_id, box in self._boxes.items()
+            for item in box.items
+        ]
+
+    def drain(self) -> List[Tuple[int, Any]]:
+        """Забирает все ожидающие сообщения (при остановке) и очищает реестр"""
+        items = [
+            (user_id, item)
+            for user_id, box in self._boxes.items()
+            for item in box.items
+        ]
+        self._boxes.clear()
+        self._queued = 0
+        return items
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Удаляет пустые неактивные ящики, простаивающие дольше idle_ttl"""
+        now = now if now is not None else time.monotonic()
+        self._last_sweep = now
+
+        expired = [
+            user_id for user_id, box in self._boxes.items()
+            if not box.active and not box.items and now - box.last_used >= self.idle_ttl
+        ]
+        for user_id in expired:
+            del self._boxes[user_id]
+
+        if expired:
+            self._evicted_total += len(expired)
+            logger.info(f"🧹 Evicted {len(expired)} idle mailboxes, {len(self._boxes)} left")
+
+        return len(expired)
+
+    def stats(self) -> Dict[str, int]:
+        """Размер реестра и примерный объем занимаемой памяти"""
+        queued = 0
+        active = 0
+        memory = sys.getsizeof(self._boxes)
+
+        for box in self._boxes.values():
+            queued += len(box.items)
+            active += box.active
+            memory += sys.getsizeof(box) + sys.getsizeof(box.items)
+
+        return {
+            'mailboxes': len(self._boxes),
+            'active': active,
+            'queued': queued,
+            'evicted_total': self._evicted_total,
+            'memory_bytes': memory
+        }
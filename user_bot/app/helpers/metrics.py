@@ -0,0 +1,69 @@
+"""
+Простые метрики процесса: счетчики и сводки по значениям (без внешних зависимостей)
+"""
+from typing import Any, Dict, Tuple
+
+LabelKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+
+class _Summary:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class Metrics:
+    """Счетчики и сводки с метками. Снимок отдается в статистику бота"""
+
+    def __init__(self):
+        self._counters: Dict[LabelKey, float] = {}
+        self._summaries: Dict[LabelKey, _Summary] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+        return name, tuple(sorted(labels.items()))
+
+    def incr(self, name: str, value: float = 1, **labels):
+        """Увеличивает счетчик"""
+        key = self._key(name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавляет наблюдение (например, длительность) в сводку"""
+        key = self._key(name, labels)
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = self._summaries[key] = _Summary()
+        summary.count += 1
+        summary.total += value
+        summary.max = max(summary.max, value)
+
+    def counter(self, name: str, **labels) -> float:
+        """Текущее значение счетчика"""
+        return self._counters.get(self._key(name, labels), 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Все метрики в виде словаря {"имя{метка=значение}": значение}"""
+        result: Dict[str, Any] = {}
+        for (name, labels), value in self._counters.items():
+            result[self._format(name, labels)] = value
+        for (name, labels), summary in self._summaries.items():
+            result[self._format(name, labels)] = {
+                'count': summary.count,
+                'avg': round(summary.total / summary.count, 3) if summary.count else 0,
+                'max': round(summary.max, 3)
+            }
+        return result
+
+    @staticmethod
+    def _format(name: str, labels: Tuple[Tuple[str, Any], ...]) -> str:
+        if not labels:
+            return name
+        return name + '{' + ','.join(f"{key}={value}" for key, value in labels) + '}'
+
+
+# Общий экземпляр процесса
+metrics = Metrics()
@@ -0,0 +1,382 @@
+"""
+Центральный планировщик исходящих запросов к Telegram (send / edit / chat action)
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+OpKey = Tuple[Any, ...]
+
+# Как часто (сек.) удалять истекшие интервалы чатов
+CHAT_SWEEP_INTERVAL = 60.0
+
+
+class _Op:
+    """Одна исходящая операция"""
+
+    __slots__ = ('key', 'kind', 'chat_id', 'message_id', 'text', 'kwargs', 'futures', 'attempts', 'not_before')
+
+    def __init__(self, kind: str, chat_id: int, message_id: Optional[int] = None,
+                 text: Optional[str] = None, kwargs: Optional[Dict[str, Any]] = None):
+        self.key: OpKey = ()
+        self.kind = kind
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.kwargs = kwargs or {}
+        self.futures: List[asyncio.Future] = []
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class OutboundScheduler:
+    """
+    Все исходящие вызовы идут через одну очередь:
+    - глобальный лимит (запросов в секунду на бота) и лимит на чат;
+    - не больше одного запроса на чат одновременно, порядок внутри чата сохраняется:
+      у каждого чата своя FIFO-очередь и отправляется только ее голова, даже если она
+      отложена (интервал правок, 429);
+    - правки одного сообщения склеиваются до последнего текста (на месте первой из них),
+      правки без изменений не отправляются;
+    - на 429 операция откладывается на retry_after и остается в голове очереди чата до успешной отправки.
+
+    Чаты, которым есть что отправить, лежат в куче по времени готовности головы,
+    поэтому выбор следующей операции не перебирает всю очередь.
+    """
+
+    def __init__(self, bot: Bot, global_rate: float = 25.0, chat_interval: float = 1.0,
+                 edit_interval: float = 2.0, max_edit_interval: float = 10.0,
+                 concurrency: int = 8, max_attempts: int = 5):
+        self.bot = bot
+        self.global_interval = 1.0 / max(global_rate, 0.1)
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.base_edit_interval = edit_interval
+        self.max_edit_interval = max_edit_interval
+        self.max_attempts = max_attempts
+
+        # Ожидающие операции по ключу (для склейки) и очереди чатов в порядке постановки
+        self._pending: Dict[OpKey, _Op] = {}
+        self._chats: Dict[int, "deque[_Op]"] = {}
+        # Куча (время готовности головы, seq, chat_id); актуальна запись с seq из _scheduled
+        self._ready: List[Tuple[float, int, int]] = []
+        self._scheduled: Dict[int, int] = {}
+        self._seq = itertools.count()
+        # Когда чату снова можно писать; прошедшие записи чатов без очереди удаляет _sweep
+        self._chat_next: Dict[int, float] = {}
+        self._last_sweep = time.monotonic()
+        self._last_edit_at: Dict[Tuple[int, int], float] = {}
+        self._last_text: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+        self._inflight_chats: set = set()
+        self._global_next = 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+
+        self._sent = 0
+        self._coalesced = 0
+        self._skipped = 0
+        self._retried = 0
+        self._failed = 0
+
+    # ==================== ЖИЗНЕННЫЙ ЦИКЛ ====================
+
+    async def start(self):
+        """Запускает цикл отправки"""
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self._run(), name="outbound-scheduler")
+            logger.info("✅ Outbound scheduler started")
+
+    async def stop(self, timeout: float = 5.0):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает цикл"""
+        if self._task is None:
+            return
+
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._inflight_chats) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        # wait_for может проглотить отмену, если событие сработало одновременно с ней,
+        # поэтому цикл дополнительно проверяет флаг
+        self._running = False
+        self._wakeup.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        for op in self._pending.values():
+            self._resolve(op, error=RuntimeError("Outbound scheduler stopped"))
+        self._pending.clear()
+        self._chats.clear()
+        self._ready.clear()
+        self._scheduled.clear()
+        logger.info("✅ Outbound scheduler stopped")
+
+    # ==================== ПУБЛИЧНЫЙ API ====================
+
+    def send_message(self, chat_id: int, text: str, **kwargs) -> asyncio.Future:
+        """Ставит отправку сообщения в очередь. Future вернет отправленный Message"""
+        op = _Op('send', chat_id, text=text, kwargs=kwargs)
+        return self._enqueue(('send', next(self._seq)), op)
+
+    def edit_text(self, chat_id: int, message_id: int, text: str, **kwargs) -> asyncio.Future:
+        """
+        Ставит правку сообщения в очередь. Если правка этого сообщения уже ждет
+        отправки, она заменяется новым текстом, а оба Future завершатся вместе.
+        """
+        key = ('edit', chat_id, message_id)
+        if self._last_text.get((chat_id, message_id)) == text and key not in self._pending:
+            self._skipped += 1
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            return future
+
+        op = _Op('edit', chat_id, message_id=message_id, text=text, kwargs=kwargs)
+        return self._enqueue(key, op)
+
+    def chat_action(self, chat_id: int, action: str = "typing") -> asyncio.Future:
+        """Ставит отправку статуса (печатает...) в очередь"""
+        op = _Op('action', chat_id, text=action)
+        return self._enqueue(('action', chat_id), op)
+
+    def edit_interval(self) -> float:
+        """Рекомендуемый интервал между правками стримингового ответа с учетом нагрузки"""
+        backlog = len(self._pending) + len(self._inflight_chats)
+        load = backlog / max(self.global_rate, 1.0)
+        return min(self.max_edit_interval, self.base_edit_interval * (1.0 + load))
+
+    def forget_message(self, chat_id: int, message_id: int):
+        """Забывает историю правок сообщения (после финальной правки)"""
+        self._last_text.pop((chat_id, message_id), None)
+        self._last_edit_at.pop((chat_id, message_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние очереди исходящих запросов"""
+        return {
+            'pending': len(self._pending),
+            'inflight': len(self._inflight_chats),
+            'edit_interval': round(self.edit_interval(), 2),
+            'sent_total': self._sent,
+            'coalesced_total': self._coalesced,
+            'skipped_total': self._skipped,
+            'retried_total': self._retried,
+            'failed_total': self._failed
+        }
+
+    # ==================== ВНУТРЕННЕЕ ====================
+
+    def _enqueue(self, key: OpKey, op: _Op) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        existing = self._pending.get(key)
+
+        if existing is not None:
+            # Склеиваем: позиция в очереди сохраняется, текст берется последний
+            existing.text = op.text
+            existing.kwargs = op.kwargs
+            existing.futures.append(future)
+            self._coalesced += 1
+        else:
+            op.key = key
+            op.futures.append(future)
+            self._pending[key] = op
+            queue = self._chats.setdefault(op.chat_id, deque())
+            queue.append(op)
+            if len(queue) == 1:
+                self._schedule(op.chat_id)
+
+        self._wakeup.set()
+        return future
+
+    def _ready_at(self, op: _Op) -> float:
+        ready = max(op.not_before, self._chat_next.get(op.chat_id, 0.0))
+        if op.kind == 'edit':
+            last = self._last_edit_at.get((op.chat_id, op.message_id))
+            if last is not None:
+                ready = max(ready, last + self.edit_interval())
+        return ready
+
+    def _schedule(self, chat_id: int, ready: Optional[float] = None):
+        """Ставит чат в кучу по времени готовности головы его очереди"""
+        queue = self._chats.get(chat_id)
+        if not queue or chat_id in self._inflight_chats:
+            return
+        seq = next(self._seq)
+        self._scheduled[chat_id] = seq
+        heapq.heappush(self._ready, (self._ready_at(queue[0]) if ready is None else ready, seq, chat_id))
+
+    def _next_chat(self, now: float) -> Tuple[Optional[int], float]:
+        """Находит чат с готовой головой очереди. Иначе возвращает время ожидания"""
+        if now < self._global_next:
+            return None, self._global_next - now
+
+        while self._ready:
+            ready, seq, chat_id = self._ready[0]
+            if self._scheduled.get(chat_id) != seq:
+                # Устаревшая запись
+                heapq.heappop(self._ready)
+                continue
+            if ready > now:
+                return None, ready - now
+            heapq.heappop(self._ready)
+            # Интервал правок зависит от нагрузки - уточняем перед отправкой
+            actual = self._ready_at(self._chats[chat_id][0])
+            if actual > now:
+                self._schedule(chat_id, actual)
+                continue
+            del self._scheduled[chat_id]
+            return chat_id, 0.0
+
+        return None, 60.0
+
+    async def _run(self):
+        while self._running:
+            now = time.monotonic()
+            chat_id, delay = self._next_chat(now)
+
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._semaphore.acquire()
+            queue = self._chats[chat_id]
+            op = queue.popleft()
+            if not queue:
+                del self._chats[chat_id]
+            del self._pending[op.key]
+            self._inflight_chats.add(chat_id)
+            self._global_next = max(now, self._global_next) + self.global_interval
+            asyncio.create_task(self._execute(op.key, op))
+
+    async def _execute(self, key: OpKey, op: _Op):
+        try:
+            if op.kind == 'edit' and self._last_text.get((op.chat_id, op.message_id)) == op.text:
+                self._skipped += 1
+                self._resolve(op, result=None)
+                return
+
+            op.attempts += 1
+            result = await self._call(op)
+            self._after_success(op)
+            self._resolve(op, result=result)
+
+        except TelegramRetryAfter as e:
+            self._retried += 1
+            retry_at = time.monotonic() + e.retry_after
+            self._chat_next[op.chat_id] = max(self._chat_next.get(op.chat_id, 0.0), retry_at)
+            logger.warning(f"⚠️ Flood control for chat {op.chat_id}: retry after {e.retry_after}s")
+            op.not_before = retry_at
+            self._requeue(key, op)
+
+        except TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                self._after_success(op)
+                self._resolve(op, result=None)
+            else:
+                self._failed += 1
+                logger.warning(f"⚠️ Telegram rejected {op.kind} for chat {op.chat_id}: {e}")
+                self._resolve(op, error=e)
+
+        except TelegramNetworkError as e:
+            if op.attempts < self.max_attempts:
+                self._retried += 1
+                op.not_before = time.monotonic() + min(2 ** op.attempts, 30)
+                self._requeue(key, op)
+            else:
+                self._failed += 1
+                logger.error(f"❌ Giving up {op.kind} for chat {op.chat_id} after {op.attempts} attempts: {e}")
+                self._resolve(op, error=e)
+
+        except Exception as e:
+            self._failed += 1
+            logger.error(f"❌ Outbound {op.kind} failed for chat {op.chat_id}: {e}")
+            self._resolve(op, error=e)
+
+        finally:
+            self._inflight_chats.discard(op.chat_id)
+            self._schedule(op.chat_id)
+            self._semaphore.release()
+            self._wakeup.set()
+
+    async def _call(self, op: _Op):
+        if op.kind == 'send':
+            return await self.bot.send_message(op.chat_id, op.text, **op.kwargs)
+        if op.kind == 'edit':
+            return await self.bot.edit_message_text(
+                text=op.text, chat_id=op.chat_id, message_id=op.message_id, **op.kwargs
+            )
+        return await self.bot.send_chat_action(op.chat_id, action=op.text)
+
+    def _after_success(self, op: _Op):
+        now = time.monotonic()
+        self._sent += 1
+        if op.kind == 'action':
+            return
+
+        self._chat_next[op.chat_id] = now + self.chat_interval
+        if now - self._last_sweep >= CHAT_SWEEP_INTERVAL:
+            self._sweep(now)
+        if op.kind == 'edit':
+            message_key = (op.chat_id, op.message_id)
+            self._last_edit_at[message_key] = now
+            self._last_text[message_key] = op.text
+            self._last_text.move_to_end(message_key)
+            while len(self._last_text) > 10000:
+                old_key, _ = self._last_text.popitem(last=False)
+                self._last_edit_at.pop(old_key, None)
+
+    def _requeue(self, key: OpKey, op: _Op):
+        """
+        Возвращает операцию в голову очереди ее чата. Если за это время пришла новая
+        правка того же сообщения - отправится ее текст, но на прежнем месте
+        """
+        queue = self._chats.setdefault(op.chat_id, deque())
+        newer = self._pending.get(key)
+        if newer is not None:
+            queue.remove(newer)
+            op.text = newer.text
+            op.kwargs = newer.kwargs
+            op.futures.extend(newer.futures)
+
+        self._pending[key] = op
+        queue.appendleft(op)
+
+    def _sweep(self, now: float):
+        """Забывает интервалы чатов, которые уже истекли и у которых нет операций"""
+        self._last_sweep = now
+        expired = [
+            chat_id for chat_id, ready in self._chat_next.items()
+            if ready <= now and chat_id not in self._chats and chat_id not in self._inflight_chats
+        ]
+        for chat_id in expired:
+            del self._chat_next[chat_id]
+
+    def _resolve(self, op: _Op, result: Any = None, error: Optional[BaseException] = None):
+        for future in op.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        # Никто не обязан ждать результат - не даем asyncio ругаться на потерянные исключения
+        for future in op.futures:
+            if future.done() and not future.cancelled():
+                future.exception()
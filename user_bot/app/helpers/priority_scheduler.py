@@ -0,0 +1,176 @@
+"""
+Планировщик приоритетов: общая емкость (БД, OpenAI) делится между классами
+запросов по весам, длинные LLM-ответы не вытесняют быстрые команды
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from app.helpers.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BUTTON = 'button'
+LLM = 'llm'
+
+
+def parse_class_values(value: str, cast=float) -> Dict[str, Any]:
+    """"interactive=8,button=4,llm=1" -> {"interactive": 8.0, ...}"""
+    result = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, number = item.partition('=')
+        result[name.strip()] = cast(number.strip())
+    return result
+
+
+class _PriorityClass:
+    __slots__ = ('name', 'weight', 'max_running', 'running', 'waiters', 'vtime', 'granted')
+
+    def __init__(self, name: str, weight: float, max_running: int):
+        self.name = name
+        self.weight = weight
+        self.max_running = max_running
+        self.running = 0
+        self.waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        self.vtime = 0.0
+        self.granted = 0
+
+
+class PriorityScheduler:
+    """
+    Слоты выдаются по взвешенной честной очереди (WFQ): из классов с ожидающими
+    выбирается класс с наименьшим виртуальным временем, каждая выдача сдвигает
+    его на 1/weight. max_running класса оставляет запас слотов другим классам.
+    Если запрос ждет дольше max_wait, его класс обслуживается вне очереди.
+    Параметры можно менять на ходу через configure()
+    """
+
+    def __init__(self, capacity: int, weights: Dict[str, float],
+                 limits: Optional[Dict[str, int]] = None, max_wait: float = 20.0):
+        self.capacity = max(1, capacity)
+        self.max_wait = max_wait
+        self._running = 0
+        self._vclock = 0.0
+        self._classes: Dict[str, _PriorityClass] = {}
+        self.configure(weights=weights, limits=limits or {})
+
+    def configure(self, capacity: Optional[int] = None, weights: Optional[Dict[str, float]] = None,
+                  limits: Optional[Dict[str, int]] = None, max_wait: Optional[float] = None):
+        """Меняет параметры без перезапуска; новые классы создаются автоматически"""
+        if capacity is not None:
+            self.capacity = max(1, capacity)
+        if max_wait is not None:
+            self.max_wait = max_wait
+
+        for name, weight in (weights or {}).items():
+            cls = self._get_class(name)
+            cls.weight = max(0.01, weight)
+        for name, limit in (limits or {}).items():
+            self._get_class(name).max_running = max(1, limit)
+
+        classes = ', '.join(
+            f"{cls.name}(w={cls.weight:g}, max={cls.max_running})" for cls in self._classes.values()
+        )
+        logger.info(f"⚖️ Priority scheduler: capacity={self.capacity}, {classes}")
+        # Увеличение емкости или лимитов может сразу разблокировать ожидающих
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, name: str):
+        """Держит слот класса name на время блока"""
+        await self.acquire(name)
+        try:
+            yield
+        finally:
+            self.release(name)
+
+    async def acquire(self, name: str):
+        """Ждет слот класса name"""
+        cls = self._get_class(name)
+        if not cls.waiters and cls.running < cls.max_running and self._running < self.capacity:
+            self._grant(cls, waited=0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        cls.waiters.append((future, time.monotonic()))
+        # Впереди могли остаться отмененные ожидающие - пробуем выдать слот сразу
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но ждущий отменен - возвращаем слот
+                self.release(name)
+            raise
+
+    def release(self, name: str):
+        """Возвращает слот"""
+        cls = self._classes[name]
+        cls.running -= 1
+        self._running -= 1
+        self._dispatch()
+
+    def _get_class(self, name: str) -> _PriorityClass:
+        cls = self._classes.get(name)
+        if cls is None:
+            cls = self._classes[name] = _PriorityClass(name, 1.0, self.capacity)
+        return cls
+
+    def _grant(self, cls: _PriorityClass, waited: float):
+        start = max(cls.vtime, self._vclock)
+        self._vclock = start
+        cls.vtime = start + 1.0 / cls.weight
+        cls.running += 1
+        cls.granted += 1
+        self._running += 1
+        metrics.observe('scheduler_wait_seconds', waited, priority=cls.name)
+
+    def _pick(self, now: float) -> Optional[_PriorityClass]:
+        eligible = [
+            cls for cls in self._classes.values()
+            if cls.waiters and cls.running < cls.max_running
+        ]
+        if not eligible:
+            return None
+
+        starving = [cls for cls in eligible if now - cls.waiters[0][1] >= self.max_wait]
+        if starving:
+            return min(starving, key=lambda cls: cls.waiters[0][1])
+
+        return min(eligible, key=lambda cls: max(cls.vtime, self._vclock) + 1.0 / cls.weight)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._running < self.capacity:
+            cls = self._pick(now)
+            if cls is None:
+                return
+            future, enqueued = cls.waiters.popleft()
+            if future.done():
+                # Ожидающий отменен
+                continue
+            self._grant(cls, waited=now - enqueued)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Загрузка по классам"""
+        now = time.monotonic()
+        return {
+            'capacity': self.capacity,
+            'running': self._running,
+            'classes': {
+                cls.name: {
+                    'weight': cls.weight,
+                    'max_running': cls.max_running,
+                    'running': cls.running,
+                    'waiting': len(cls.waiters),
+                    'oldest_wait': round(now - cls.waiters[0][1], 1) if cls.waiters else 0.0,
+                    'granted_total': cls.granted
+                }
+                for cls in self._classes.values()
+            }
+        }
@@ -0,0 +1,132 @@
+"""
+Фоновая очередь побочных действий (учет рефералов, уведомления, создание треда)
+с повторными попытками: обработчик отвечает пользователю сразу, не дожидаясь их
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from app.helpers.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[], Awaitable[Any]]
+
+
+class _Job:
+    __slots__ = ('name', 'steps', 'step', 'attempts')
+
+    def __init__(self, name: str, steps: List[Step]):
+        self.name = name
+        self.steps = steps
+        self.step = 0
+        self.attempts = 0
+
+
+class SideEffectQueue:
+    """
+    Задание - последовательность шагов. Шаг считается неудачным, если выбросил
+    исключение; он повторяется с экспоненциальной задержкой (воркер при этом
+    не ждет), выполненные шаги не повторяются. После max_attempts неудач
+    подряд задание отбрасывается
+    """
+
+    def __init__(self, workers: int = 2, max_attempts: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0, max_size: int = 10000):
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._tasks: List[asyncio.Task] = []
+        self._busy = 0
+        self._delayed = 0
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, name: str, *steps: Step) -> bool:
+        """Ставит задание в очередь (без ожидания). False - очередь переполнена"""
+        try:
+            self._queue.put_nowait(_Job(name, list(steps)))
+            return True
+        except asyncio.QueueFull:
+            metrics.incr('side_effects_dropped_total')
+            logger.error(f"❌ Side effect queue is full, dropped '{name}'")
+            return False
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"side-effects-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(f"✅ Side effect queue started with {self.workers} workers")
+
+    async def stop(self, timeout: float = 5.0):
+        """Дожидается очереди не дольше timeout и останавливает воркеры"""
+        deadline = time.monotonic() + timeout
+        while (not self._queue.empty() or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        lost = self._queue.qsize() + self._delayed
+        if lost:
+            logger.warning(f"⚠️ {lost} side effects not completed before shutdown")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._busy += 1
+            try:
+                await self._run(job)
+            finally:
+                self._busy -= 1
+
+    async def _run(self, job: _Job):
+        while job.step < len(job.steps):
+            try:
+                await job.steps[job.step]()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job.attempts += 1
+                if job.attempts >= self.max_attempts:
+                    self._failed += 1
+                    metrics.incr('side_effects_failed_total')
+                    logger.error(f"❌ Side effect '{job.name}' failed after {job.attempts} attempts: {e}")
+                    return
+
+                delay = min(self.max_delay, self.base_delay * 2 ** (job.attempts - 1))
+                logger.warning(f"⚠️ Side effect '{job.name}' failed (attempt {job.attempts}), "
+                               f"retry in {delay:.0f}s: {e}")
+                self._delayed += 1
+                asyncio.get_running_loop().call_later(delay, self._requeue, job)
+                return
+
+            job.step += 1
+            job.attempts = 0
+
+        self._completed += 1
+
+    def _requeue(self, job: _Job):
+        self._delayed -= 1
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            metrics.incr('side_effects_dropped_total')
+            logger.error(f"❌ Side effect queue is full, dropped retry of '{job.name}'")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queue.qsize(),
+            'delayed': self._delayed,
+            'busy': self._busy,
+            'completed_total': self._completed,
+            'failed_total': self._failed
+        }
@@ -0,0 +1,75 @@
+"""
+Единый таймер статуса "печатает..." для всех чатов с ответом в работе
+"""
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from app.helpers.outbound import OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class TypingTicker:
+    """
+    Хранит набор активных чатов и раз в interval секунд отправляет им статус
+    пачками через планировщик исходящих запросов. Обработчики только
+    регистрируют и снимают чат, отдельных задач на каждый ответ нет.
+    """
+
+    def __init__(self, outbound: OutboundScheduler, interval: float = 4.5,
+                 batch_size: int = 50, action: str = "typing"):
+        self.outbound = outbound
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.action = action
+        self._chats: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Запускает таймер"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="typing-ticker")
+
+    async def stop(self):
+        """Останавливает таймер"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._chats.clear()
+
+    def register(self, chat_id: int):
+        """Добавляет чат. Первый статус отправляется сразу"""
+        count = self._chats.get(chat_id, 0)
+        self._chats[chat_id] = count + 1
+        if count == 0:
+            self.outbound.chat_action(chat_id, self.action)
+
+    def unregister(self, chat_id: int):
+        """Снимает чат (с учетом нескольких ответов в одном чате)"""
+        count = self._chats.get(chat_id, 0)
+        if count <= 1:
+            self._chats.pop(chat_id, None)
+        else:
+            self._chats[chat_id] = count - 1
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chats)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            chats = list(self._chats)
+
+            for start in range(0, len(chats), self.batch_size):
+                for chat_id in chats[start:start + self.batch_size]:
+                    if chat_id in self._chats:
+                        self.outbound.chat_action(chat_id, self.action)
+                # Отдаем управление между пачками, чтобы не занимать цикл событий
+                await asyncio.sleep(0)
@@ -0,0 +1,144 @@
+"""
+Прием голосовых сообщений: скачивание в память и распознавание с отдельными лимитами
+"""
+import asyncio
+import io
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import Message
+
+from app.helpers.metrics import metrics
+from app.openai_client.transcriber import Transcriber
+
+logger = logging.getLogger(__name__)
+
+TranscriptHandler = Callable[[Message, str], Awaitable[None]]
+FailureHandler = Callable[[Message, Exception], Awaitable[None]]
+
+
+class VoicePipeline:
+    """
+    Голосовые сообщения ставятся в ограниченную очередь и обрабатываются воркерами:
+    файл скачивается потоком в BytesIO (без временных файлов), затем распознается.
+    Скачивание и распознавание ограничены отдельными семафорами, а воркеров ровно
+    столько, сколько слотов в обоих этапах, - всплеск голосовых не занимает
+    воркеры текстовых ответов. Транскрипт передается в on_transcript (обычная очередь)
+    """
+
+    def __init__(self, bot: Bot, transcriber: Transcriber, on_transcript: TranscriptHandler,
+                 on_failure: Optional[FailureHandler] = None,
+                 download_concurrency: int = 4, transcribe_concurrency: int = 2,
+                 queue_size: int = 100):
+        self.bot = bot
+        self.transcriber = transcriber
+        self.on_transcript = on_transcript
+        self.on_failure = on_failure
+        self.download_concurrency = max(1, download_concurrency)
+        self.transcribe_concurrency = max(1, transcribe_concurrency)
+        self._download_slots = asyncio.Semaphore(self.download_concurrency)
+        self._transcribe_slots = asyncio.Semaphore(self.transcribe_concurrency)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+        self._downloading = 0
+        self._transcribing = 0
+        self._processed = 0
+        self._failed = 0
+
+    def submit(self, message: Message) -> bool:
+        """Ставит голосовое в очередь. False - очередь заполнена"""
+        try:
+            self._queue.put_nowait((message, time.monotonic()))
+            return True
+        except asyncio.QueueFull:
+            metrics.incr('voice_rejected_total')
+            return False
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self):
+        if self._tasks:
+            return
+        workers = self.download_concurrency + self.transcribe_concurrency
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"voice-worker-{index}")
+            for index in range(workers)
+        ]
+        logger.info(f"✅ Voice pipeline started ({self.transcriber.name}: "
+                    f"{self.download_concurrency} downloads, {self.transcribe_concurrency} transcriptions)")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дает дообработать очередь не дольше timeout и останавливает воркеры"""
+        deadline = time.monotonic() + timeout
+        while (not self._queue.empty() or self._downloading or self._transcribing) \
+                and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        if self._queue.qsize():
+            logger.warning(f"⚠️ {self._queue.qsize()} voice messages dropped on shutdown")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            message, enqueued = await self._queue.get()
+            try:
+                await self._process(message, enqueued)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failed += 1
+                metrics.incr('voice_failed_total')
+                logger.error(f"❌ Voice message from user_id={message.from_user.id} failed: {e}")
+                if self.on_failure:
+                    # Ответ об ошибке тоже может не дойти (бот заблокирован) - воркер должен жить
+                    try:
+                        await self.on_failure(message, e)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as reply_error:
+                        logger.error(f"❌ Voice failure reply to user_id={message.from_user.id} failed: {reply_error}")
+
+    async def _process(self, message: Message, enqueued: float):
+        voice = message.voice
+
+        async with self._download_slots:
+            self._downloading += 1
+            started = time.monotonic()
+            try:
+                buffer = io.BytesIO()
+                await self.bot.download(voice, destination=buffer)
+                audio = buffer.getvalue()
+            finally:
+                self._downloading -= 1
+            metrics.observe('voice_download_seconds', time.monotonic() - started)
+
+        async with self._transcribe_slots:
+            self._transcribing += 1
+            started = time.monotonic()
+            try:
+                text = await self.transcriber.transcribe(audio, mime_type=voice.mime_type or "audio/ogg")
+            finally:
+                self._transcribing -= 1
+            metrics.observe('voice_transcribe_seconds', time.monotonic() - started)
+
+        self._processed += 1
+        logger.info(f"🎙 Voice from user_id={message.from_user.id} transcribed "
+                    f"({voice.duration}s, {len(audio)} bytes, {time.monotonic() - enqueued:.1f}s total)")
+        await self.on_transcript(message, text)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queue.qsize(),
+            'downloading': self._downloading,
+            'transcribing': self._transcribing,
+            'processed_total': self._processed,
+            'failed_total': self._failed
+        }
@@ -0,0 +1,134 @@
+"""
+Пул воркеров фиксированного размера с привязкой пользователей к шардам
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.helpers.mailbox import MailboxRegistry
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[int, Any], Awaitable[None]]
+
+
+class ShardedWorkerPool:
+    """
+    Каждый пользователь всегда попадает в один и тот же шард (user_id % workers),
+    поэтому его сообщения обрабатываются строго по порядку. В очереди шарда лежат
+    только id пользователей с непустым ящиком: после одного сообщения пользователь
+    уходит в конец очереди, и остальные пользователи шарда не ждут всю его очередь.
+    """
+
+    def __init__(self, mailboxes: MailboxRegistry, handler: MessageHandler,
+                 workers: int = 5, backlog_warning: int = 100):
+        self.mailboxes = mailboxes
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.backlog_warning = backlog_warning
+        self._shards: List[asyncio.Queue] = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks: List[asyncio.Task] = []
+        self._busy: List[Optional[int]] = [None] * self.workers
+        self._current: List[Optional[Tuple[int, Any]]] = [None] * self.workers
+        self._accepting = True
+        self._processed = 0
+
+    def shard_for(self, user_id: int) -> int:
+        """Номер шарда для пользователя"""
+        return user_id % self.workers
+
+    async def start(self):
+        """Запускает воркеры"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"user-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(f"✅ Worker pool started with {self.workers} workers")
+
+    async def stop(self):
+        """Останавливает воркеры"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("✅ Worker pool stopped")
+
+    async def drain(self, timeout: float) -> List[Tuple[int, Any, bool]]:
+        """
+        Останавливает пул: новые сообщения больше не берутся, текущие
+        дообрабатываются не дольше timeout. Возвращает необработанные сообщения
+        тройками (user_id, item, прервано ли) - прерванные идут первыми.
+        """
+        self._accepting = False
+        deadline = time.monotonic() + timeout
+
+        while any(user_id is not None for user_id in self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        interrupted = [current for current in self._current if current is not None]
+        if interrupted:
+            logger.warning(f"⚠️ {len(interrupted)} answers interrupted by shutdown deadline")
+
+        await self.stop()
+        leftovers = [(user_id, item, True) for user_id, item in interrupted]
+        leftovers += [(user_id, item, False) for user_id, item in self.mailboxes.drain()]
+        logger.info(f"✅ Worker pool drained, {len(leftovers)} messages left unprocessed")
+        return leftovers
+
+    def submit(self, user_id: int, item: Any) -> int:
+        """Ставит сообщение в очередь. Возвращает глубину очереди пользователя"""
+        if self.mailboxes.put(user_id, item):
+            shard = self._shards[self.shard_for(user_id)]
+            shard.put_nowait(user_id)
+
+            if shard.qsize() >= self.backlog_warning:
+                logger.warning(
+                    f"⚠️ Worker shard {self.shard_for(user_id)} backlog: {shard.qsize()} users waiting"
+                )
+
+        return self.mailboxes.depth(user_id)
+
+    async def _worker(self, index: int):
+        """Цикл одного воркера"""
+        shard = self._shards[index]
+
+        while True:
+            user_id = await shard.get()
+            if not self._accepting:
+                # Пул останавливается: сообщение остается в ящике и будет сохранено
+                return
+            item = self.mailboxes.take(user_id)
+            if item is None:
+                continue
+
+            self._busy[index] = user_id
+            self._current[index] = (user_id, item)
+            try:
+                await self.handler(user_id, item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Worker {index} failed to process message for user_id={user_id}: {e}")
+            finally:
+                self._busy[index] = None
+                self._current[index] = None
+                self._processed += 1
+
+            # Синхронно: либо возвращаем пользователя в очередь, либо снимаем флаг
+            if self.mailboxes.release(user_id):
+                shard.put_nowait(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Загрузка пула и глубина очередей"""
+        shard_depths = [shard.qsize() for shard in self._shards]
+        return {
+            'workers': self.workers,
+            'busy_workers': sum(1 for user_id in self._busy if user_id is not None),
+            'waiting_users': sum(shard_depths),
+            'shard_depths': shard_depths,
+            'processed_total': self._processed,
+            'mailboxes': self.mailboxes.stats()
+        }
@@ -1,21 +1,46 @@
 import logging
 import asyncio
-from typing import Optional, AsyncGenerator
+from typing import Dict, Optional, AsyncGenerator, Tuple
 from openai import AsyncOpenAI
+from config import config
 from app.storage.user_storage import UserStorage
 
 logger = logging.getLogger(__name__)
 
 class OpenAIClient:
     def __init__(self, user_storage: UserStorage):
-        from config import config
         self.client = AsyncOpenAI(api_key=config.OPENAI_API_KEY)
         self.assistant_id = config.ASSISTANT_ID
         self.user_storage = user_storage
+        # Тред может создаваться и фоном после /start, и первым сообщением - не создаем два
+        self._thread_locks: Dict[int, Tuple[asyncio.Lock, int]] = {}
         logger.info("✅ OpenAIClient initialized")
-    
+
+    async def warm_up(self) -> bool:
+        """Легкий запрос к API: держит HTTP-соединения открытыми (резервный экземпляр)"""
+        try:
+            await self.client.beta.assistants.retrieve(self.assistant_id)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ OpenAI warm-up failed: {e}")
+            return False
+
     async def get_or_create_thread(self, user_id: int) -> str:
         """Получает или создает тред для пользователя"""
+        lock, waiting = self._thread_locks.get(user_id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._thread_locks[user_id] = (lock, waiting + 1)
+        try:
+            async with lock:
+                return await self._get_or_create_thread(user_id)
+        finally:
+            lock, waiting = self._thread_locks[user_id]
+            if waiting > 1:
+                self._thread_locks[user_id] = (lock, waiting - 1)
+            else:
+                del self._thread_locks[user_id]
+    
+    async def _get_or_create_thread(self, user_id: int) -> str:
         try:
             # Проверяем есть ли сохраненный thread_id
             thread_id = await self.user_storage.get_thread_id(user_id)
@@ -0,0 +1,69 @@
+"""
+Распознавание голосовых сообщений: сменные бэкенды
+"""
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class Transcriber(ABC):
+    """Бэкенд распознавания: аудио (байты) -> текст"""
+
+    name = "base"
+
+    @abstractmethod
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg",
+                         mime_type: str = "audio/ogg") -> str:
+        """Распознает аудио и возвращает текст"""
+
+
+class OpenAITranscriber(Transcriber):
+    """Распознавание через OpenAI (Whisper); использует HTTP-клиент ассистента"""
+
+    name = "openai"
+
+    def __init__(self, client: AsyncOpenAI, model: str = "whisper-1", language: Optional[str] = "ru"):
+        self.client = client
+        self.model = model
+        self.language = language
+
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg",
+                         mime_type: str = "audio/ogg") -> str:
+        kwargs = {'language': self.language} if self.language else {}
+        result = await self.client.audio.transcriptions.create(
+            model=self.model,
+            file=(filename, audio, mime_type),
+            **kwargs
+        )
+        return result.text.strip()
+
+
+class StubTranscriber(Transcriber):
+    """
+    Локальная замена без сети: текст однозначно определяется содержимым файла,
+    поэтому одинаковое аудио всегда дает одинаковый "транскрипт" (для тестов и стендов)
+    """
+
+    name = "stub"
+
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg",
+                         mime_type: str = "audio/ogg") -> str:
+        digest = hashlib.sha256(audio).hexdigest()[:12]
+        return f"Голосовое сообщение {len(audio)} байт ({digest})"
+
+
+def create_transcriber(backend: str, client: Optional[AsyncOpenAI] = None, model: str = "whisper-1",
+                       language: Optional[str] = "ru") -> Transcriber:
+    """Бэкенд по имени из VOICE_BACKEND"""
+    if backend == "openai":
+        if client is None:
+            raise ValueError("OpenAI transcriber requires an AsyncOpenAI client")
+        return OpenAITranscriber(client, model=model, language=language or None)
+    if backend == "stub":
+        return StubTranscriber()
+    raise ValueError(f"Unknown voice backend: {backend}")
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from shared.storage.queries import queries
+
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityAggregator:
+    """
+    Копит активность пользователей в памяти (последняя активность и сколько
+    сообщений прибавить) и раз в flush_interval записывает ее одним UPDATE
+    на пачку пользователей вместо UPDATE строки users на каждое сообщение
+    """
+
+    def __init__(self, database: Database, flush_interval: float = 5.0, batch_size: int = 1000):
+        self.db = database
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: Dict[int, Tuple[datetime, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flushed_total = 0
+
+    def record(self, user_id: int, messages: int = 1, at: Optional[datetime] = None):
+        """Учитывает активность пользователя (без обращения к БД)"""
+        at = at or datetime.now()
+        last_activity, count = self._pending.get(user_id, (at, 0))
+        self._pending[user_id] = (max(last_activity, at), count + messages)
+
+    async def start(self):
+        """Запускает периодическую запись"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name="activity-flush")
+
+    async def stop(self):
+        """Останавливает запись и сбрасывает накопленное"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Записывает накопленную активность. Возвращает число обновленных пользователей"""
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, {}
+        rows = [(user_id, last_activity, count) for user_id, (last_activity, count) in pending.items()]
+
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                await self._write_batch(batch)
+                written += len(batch)
+            except Exception as e:
+                logger.error(f"❌ Failed to flush activity for {len(batch)} users: {e}")
+                # Возвращаем несохраненное - запишется со следующей пачкой
+                for user_id, last_activity, count in batch:
+                    self.record(user_id, count, last_activity)
+
+        self._flushed_total += written
+        return written
+
+    async def _write_batch(self, batch: List[Tuple[int, datetime, int]]):
+        user_ids, activity, messages = zip(*batch)
+
+        async with self.db.get_connection() as conn:
+            await queries.execute(conn, 'users.flush_activity', list(user_ids), list(activity), list(messages))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending_users': len(self._pending),
+            'flushed_total': self._flushed_total
+        }
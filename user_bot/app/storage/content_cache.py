@@ -0,0 +1,118 @@
+import logging
+from typing import Dict, List, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+from app.bot.keyboards import create_more_keyboard, create_support_topics_keyboard
+from app.helpers.metrics import metrics
+from shared.storage.notify import ChangeListener, change_channel, install_notify_trigger
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+MORE_BUTTONS_CATEGORY = 'more_buttons'
+SUPPORT_TOPICS_CATEGORY = 'support_topics'
+MORE_BUTTON_FIELDS = ('id', 'key', 'button_text', 'command', 'content_text', 'model', 'order_index', 'is_active')
+
+
+def _support_topic(row: Dict) -> Dict:
+    """Тема поддержки: emoji - первый символ button_text, остальное - название"""
+    button_text = row['button_text'] or ''
+    return {
+        'id': row['id'],
+        'name': row['key'],
+        'button_text': button_text[1:].strip() if len(button_text) > 1 else button_text,
+        'emoji': button_text[0] if button_text else '📝',
+        'description': row.get('content_text') or ''
+    }
+
+
+class ContentSnapshot:
+    """
+    Активные строки bot_content с индексами и готовыми клавиатурами. Снимок не
+    меняется после построения - обновление заменяет его целиком, поэтому читателям
+    не нужны блокировки. Возвращаемые словари общие: их нельзя изменять
+    """
+
+    def __init__(self, rows: List[Dict]):
+        self.by_id: Dict[int, Dict] = {}
+        self.by_key: Dict[str, Dict] = {}
+        self.by_command: Dict[str, Dict] = {}
+        self.by_category: Dict[str, List[Dict]] = {}
+        for row in rows:
+            self.by_id[row['id']] = row
+            # При дублях ключа или команды побеждает первая строка (порядок order_index, id)
+            self.by_key.setdefault(row['key'], row)
+            if row.get('command'):
+                self.by_command.setdefault(row['command'], row)
+            self.by_category.setdefault(row['category'], []).append(row)
+
+        self.more_buttons: List[Dict] = [
+            {field: row.get(field) for field in MORE_BUTTON_FIELDS}
+            for row in self.by_category.get(MORE_BUTTONS_CATEGORY, [])
+        ]
+        self.support_topics: List[Dict] = [
+            _support_topic(row) for row in self.by_category.get(SUPPORT_TOPICS_CATEGORY, [])
+        ]
+        self.support_topics_by_id: Dict[int, Dict] = {topic['id']: topic for topic in self.support_topics}
+        self.more_keyboard: Optional[InlineKeyboardMarkup] = (
+            create_more_keyboard(self.more_buttons) if self.more_buttons else None
+        )
+        self.support_keyboard: Optional[InlineKeyboardMarkup] = (
+            create_support_topics_keyboard(self.support_topics) if self.support_topics else None
+        )
+
+
+class ContentCache:
+    """
+    Кэш bot_content в памяти процесса. Таблица меняется редко, а читается почти на
+    каждом нажатии кнопки, поэтому все чтения идут из снимка, а снимок перечитывается
+    целиком по NOTIFY от триггера на bot_content (и не реже чем раз в refresh_interval)
+    """
+
+    def __init__(self, database: Database, refresh_interval: float = 300.0):
+        self.db = database
+        self._snapshot: Optional[ContentSnapshot] = None
+        self._listener = ChangeListener(
+            database.database_url, change_channel('bot_content'), self.refresh, refresh_interval
+        )
+        self._refreshes = 0
+
+    @property
+    def snapshot(self) -> Optional[ContentSnapshot]:
+        """Текущий снимок; None - контент еще не загружен (читать из БД)"""
+        return self._snapshot
+
+    async def start(self):
+        # Любое изменение bot_content (включая правки руками в psql) будит все процессы
+        await install_notify_trigger(self.db, 'bot_content')
+        await self.refresh()
+        await self._listener.start()
+
+    async def stop(self):
+        await self._listener.stop()
+
+    def invalidate(self):
+        """Перечитать снимок в фоне (после изменения контента этим процессом)"""
+        self._listener.invalidate()
+
+    async def refresh(self) -> bool:
+        """Перечитывает bot_content. При ошибке остается прежний снимок"""
+        try:
+            rows = await self.db.fetch('content.all_active')
+            self._snapshot = ContentSnapshot([dict(row) for row in rows])
+            self._refreshes += 1
+            metrics.incr('content_cache_refreshes_total')
+            logger.info(f"✅ Content cache loaded: {len(rows)} rows")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to refresh content cache: {e}")
+            return False
+
+    def stats(self) -> Dict[str, object]:
+        snapshot = self._snapshot
+        return {
+            'loaded': snapshot is not None,
+            'rows': len(snapshot.by_id) if snapshot else 0,
+            'refreshes_total': self._refreshes
+        }
@@ -15,8 +15,7 @@ class ContentStorage:
     async def get_content_by_key(self, key: str) -> Optional[Dict]:
         """Получает контент по ключу"""
         try:
-            query = "SELECT * FROM bot_content WHERE key = $1 AND is_active = TRUE"
-            row = await self.db.pool.fetchrow(query, key)
+            row = await self.db.fetchrow('content.by_key', key)
             return dict(row) if row else None
         except Exception as e:
             self.logger.error(f"❌ Failed to get content by key {key}: {e}")
@@ -25,21 +24,7 @@ class ContentStorage:
     async def get_all_active_buttons(self) -> List[Dict]:
         """Получает все активные кнопки для /more из таблицы bot_content"""
         try:
-            query = """
-                SELECT 
-                    id,
-                    key,
-                    button_text,
-                    command, 
-                    content_text,
-                    model,
-                    order_index,
-                    is_active
-                FROM bot_content 
-                WHERE category = 'more_buttons' AND is_active = TRUE
-                ORDER BY order_index
-            """
-            rows = await self.db.pool.fetch(query)
+            rows = await self.db.fetch('content.more_buttons')
             return [dict(row) for row in rows]
         except Exception as e:
             self.logger.error(f"❌ Failed to get active buttons: {e}")
@@ -48,8 +33,7 @@ class ContentStorage:
     async def get_button_by_id(self, button_id: int) -> Optional[Dict]:
         """Получает кнопку по ID"""
         try:
-            query = "SELECT * FROM bot_content WHERE id = $1 AND is_active = true"
-            row = await self.db.pool.fetchrow(query, button_id)
+            row = await self.db.fetchrow('content.button_by_id', button_id)
             return dict(row) if row else None
         except Exception as e:
             self.logger.error(f"❌ Error getting button by id {button_id}: {e}")
@@ -58,19 +42,7 @@ class ContentStorage:
     async def get_button_by_command(self, command: str) -> Optional[Dict]:
         """Получает кнопку по команде"""
         try:
-            query = """
-                SELECT 
-                    id,
-                    key,
-                    button_text,
-                    command,
-                    content_text,
-                    model,
-                    order_index
-                FROM bot_content 
-                WHERE command = $1 AND is_active = TRUE
-            """
-            row = await self.db.pool.fetchrow(query, command)
+            row = await self.db.fetchrow('content.button_by_command', command)
             return dict(row) if row else None
         except Exception as e:
             self.logger.error(f"❌ Failed to get button by command {command}: {e}")
@@ -81,20 +53,8 @@ class ContentStorage:
                         order_index: int = 0) -> bool:
         """Добавляет новую кнопку в таблицу bot_content"""
         try:
-            query = """
-                INSERT INTO bot_content 
-                (key, button_text, command, content_text, model, order_index, category, is_active, content_type)
-                VALUES ($1, $2, $3, $4, $5, $6, 'more_buttons', TRUE, 'prompt')
-                ON CONFLICT (key) DO UPDATE SET
-                    button_text = EXCLUDED.button_text,
-                    command = EXCLUDED.command,
-                    content_text = EXCLUDED.content_text,
-                    model = EXCLUDED.model,
-                    order_index = EXCLUDED.order_index,
-                    is_active = TRUE
-            """
-            await self.db.pool.execute(
-                query, key, button_text, command, content_text, model, order_index
+            await self.db.execute(
+                'content.upsert_button', key, button_text, command, content_text, model, order_index
             )
             self.logger.info(f"✅ Button added/updated: {key}")
             return True
@@ -115,6 +75,7 @@ class ContentStorage:
                 i += 1
             
             values.append(key)
+            # Набор колонок задает вызывающий, поэтому запрос собирается здесь, а не в реестре
             query = f"UPDATE bot_content SET {', '.join(set_parts)} WHERE key = ${i}"
             
             await self.db.pool.execute(query, *values)
@@ -127,11 +88,7 @@ class ContentStorage:
     async def log_button_click(self, user_id: int, button_key: str, button_text: str) -> bool:
         """Логирует нажатие кнопки"""
         try:
-            query = """
-                INSERT INTO button_clicks (user_id, button_key, button_text)
-                VALUES ($1, $2, $3)
-            """
-            await self.db.pool.execute(query, user_id, button_key, button_text)
+            await self.db.execute('button_clicks.insert', user_id, button_key, button_text)
             self.logger.info(f"📊 Button click logged: user_id={user_id}, button={button_key}")
             return True
         except Exception as e:
@@ -142,28 +99,10 @@ class ContentStorage:
         """Получает статистику нажатий кнопок"""
         try:
             # Общая статистика
-            total_stats_query = """
-                SELECT 
-                    COUNT(*) as total_clicks,
-                    COUNT(DISTINCT user_id) as unique_users
-                FROM button_clicks 
-                WHERE created_at >= NOW() - ($1 || ' days')::INTERVAL
-            """
-            total_stats = await self.db.pool.fetchrow(total_stats_query, str(days))
+            total_stats = await self.db.fetchrow('button_clicks.total', days)
             
             # Статистика по кнопкам
-            button_stats_query = """
-                SELECT 
-                    button_key,
-                    button_text,
-                    COUNT(*) as click_count,
-                    COUNT(DISTINCT user_id) as unique_users
-                FROM button_clicks 
-                WHERE created_at >= NOW() - ($1 || ' days')::INTERVAL
-                GROUP BY button_key, button_text
-                ORDER BY click_count DESC
-            """
-            button_stats = await self.db.pool.fetch(button_stats_query, str(days))
+            button_stats = await self.db.fetch('button_clicks.by_button', days)
             
             return {
                 'total': dict(total_stats) if total_stats else {},
@@ -176,19 +115,7 @@ class ContentStorage:
     async def get_support_topics(self) -> List[Dict]:
         """Получает все активные темы поддержки из таблицы bot_content"""
         try:
-            query = """
-                SELECT 
-                    id,
-                    key as name,
-                    button_text as emoji,
-                    content_text as description,
-                    order_index,
-                    is_active
-                FROM bot_content 
-                WHERE category = 'support_topics' AND is_active = TRUE 
-                ORDER BY order_index, id
-            """
-            rows = await self.db.pool.fetch(query)
+            rows = await self.db.fetch('content.support_topics')
             return [dict(row) for row in rows]
         except Exception as e:
             self.logger.error(f"❌ Failed to get support topics: {e}")
@@ -199,14 +126,8 @@ class ContentStorage:
         try:
             ticket_number = f"TKT-{uuid.uuid4().hex[:8].upper()}"
             
-            query = """
-                INSERT INTO support_tickets 
-                (user_id, ticket_number, topic, user_message, status, created_at)
-                VALUES ($1, $2, $3, $4, 'open', $5)
-            """
-            
-            await self.db.pool.execute(
-                query, user_id, ticket_number, topic, message, datetime.now()
+            await self.db.execute(
+                'tickets.insert', user_id, ticket_number, topic, message, datetime.now()
             )
             
             self.logger.info(f"✅ Support ticket created: {ticket_number} for user_id={user_id}")
@@ -219,21 +140,7 @@ class ContentStorage:
     async def get_user_tickets(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Получает тикеты пользователя"""
         try:
-            query = """
-                SELECT 
-                    ticket_number, 
-                    topic, 
-                    user_message, 
-                    admin_response, 
-                    status, 
-                    created_at, 
-                    updated_at
-                FROM support_tickets 
-                WHERE user_id = $1 
-                ORDER BY created_at DESC 
-                LIMIT $2
-            """
-            rows = await self.db.pool.fetch(query, user_id, limit)
+            rows = await self.db.fetch('tickets.by_user', user_id, limit)
             return [dict(row) for row in rows]
         except Exception as e:
             self.logger.error(f"❌ Failed to get user tickets: {e}")
@@ -242,20 +149,7 @@ class ContentStorage:
     async def get_ticket_by_number(self, ticket_number: str) -> Optional[Dict]:
         """Получает тикет по номеру"""
         try:
-            query = """
-                SELECT 
-                    ticket_number, 
-                    topic, 
-                    user_message, 
-                    admin_response, 
-                    status, 
-                    created_at, 
-                    updated_at, 
-                    user_id
-                FROM support_tickets 
-                WHERE ticket_number = $1
-            """
-            row = await self.db.pool.fetchrow(query, ticket_number)
+            row = await self.db.fetchrow('tickets.summary_by_number', ticket_number)
             return dict(row) if row else None
         except Exception as e:
             self.logger.error(f"❌ Failed to get ticket {ticket_number}: {e}")
@@ -264,12 +158,7 @@ class ContentStorage:
     async def update_ticket_status(self, ticket_number: str, status: str, admin_id: int = None, admin_response: str = None) -> bool:
         """Обновляет статус тикета"""
         try:
-            query = """
-                UPDATE support_tickets 
-                SET status = $1, admin_id = $2, admin_response = $3, updated_at = NOW()
-                WHERE ticket_number = $4
-            """
-            await self.db.pool.execute(query, status, admin_id, admin_response, ticket_number)
+            await self.db.execute('tickets.update_status', status, admin_id, admin_response, ticket_number)
             
             self.logger.info(f"✅ Ticket {ticket_number} status updated to {status}")
             return True
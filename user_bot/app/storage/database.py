@@ -4,22 +4,27 @@ from datetime import datetime
 from typing import Dict, List, Optional, Any
 from contextlib import asynccontextmanager
 
+from shared.storage.queries import queries
+
 logger = logging.getLogger(__name__)
 
 class Database:
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, pool: Optional[asyncpg.Pool] = None):
         self.database_url = database_url
-        self.pool: Optional[asyncpg.Pool] = None
+        # Готовый пул (несколько ботов в одном процессе) закрывает его владелец, а не Database
+        self.pool: Optional[asyncpg.Pool] = pool
+        self._owns_pool = pool is None
     
     async def connect(self):
-        """Создает пул подключений к базе данных"""
+        """Создает пул подключений к базе данных (если пул не передан снаружи)"""
         try:
-            self.pool = await asyncpg.create_pool(
-                self.database_url,
-                min_size=5,
-                max_size=20,
-                command_timeout=60
-            )
+            if self.pool is None:
+                self.pool = await queries.create_pool(
+                    self.database_url,
+                    min_size=5,
+                    max_size=20,
+                    command_timeout=60
+                )
             await self._init_database()
             logger.info("✅ PostgreSQL connection pool created successfully")
         except Exception as e:
@@ -28,7 +33,7 @@ class Database:
     
     async def close(self):
         """Закрывает пул подключений"""
-        if self.pool:
+        if self.pool and self._owns_pool:
             await self.pool.close()
             logger.info("✅ PostgreSQL connection pool closed")
     
@@ -41,6 +46,23 @@ class Database:
         async with self.pool.acquire() as connection:
             yield connection
     
+    async def fetch(self, name: str, *args) -> List[asyncpg.Record]:
+        """Выполняет запрос из реестра (shared/storage/queries.py) по имени"""
+        async with self.get_connection() as conn:
+            return await queries.fetch(conn, name, *args)
+    
+    async def fetchrow(self, name: str, *args) -> Optional[asyncpg.Record]:
+        async with self.get_connection() as conn:
+            return await queries.fetchrow(conn, name, *args)
+    
+    async def fetchval(self, name: str, *args) -> Any:
+        async with self.get_connection() as conn:
+            return await queries.fetchval(conn, name, *args)
+    
+    async def execute(self, name: str, *args) -> str:
+        async with self.get_connection() as conn:
+            return await queries.execute(conn, name, *args)
+    
     async def _init_database(self):
         """Инициализация таблиц в базе данных"""
         try:
@@ -172,6 +194,68 @@ class Database:
                     ON token_usage(model)
                 ''')
                 
+                # Дневные итоги токенов (TokenUsageRollup): свернутые строки token_usage
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS token_usage_daily (
+                        usage_date DATE NOT NULL,
+                        user_id BIGINT NOT NULL,
+                        model TEXT NOT NULL,
+                        prompt_tokens BIGINT NOT NULL DEFAULT 0,
+                        completion_tokens BIGINT NOT NULL DEFAULT 0,
+                        total_tokens BIGINT NOT NULL DEFAULT 0,
+                        request_count BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (usage_date, user_id, model)
+                    )
+                ''')
+                await conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_token_usage_daily_user
+                    ON token_usage_daily(user_id, usage_date DESC)
+                ''')
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS token_usage_rollup_state (
+                        name TEXT PRIMARY KEY,
+                        rolled_through DATE NOT NULL,
+                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                ''')
+                # Отметка свертки сырых строк. При добавлении колонки строки, уже свернутые
+                # по водяному знаку, отмечаются один раз - иначе свертка учла бы их дважды
+                await conn.execute('''
+                    DO $$
+                    BEGIN
+                        IF NOT EXISTS (
+                            SELECT 1 FROM information_schema.columns
+                            WHERE table_schema = current_schema()
+                              AND table_name = 'token_usage' AND column_name = 'rolled_up'
+                        ) THEN
+                            ALTER TABLE token_usage ADD COLUMN IF NOT EXISTS rolled_up BOOLEAN NOT NULL DEFAULT FALSE;
+                            UPDATE token_usage SET rolled_up = TRUE
+                            WHERE created_date <= (
+                                SELECT rolled_through FROM token_usage_rollup_state WHERE name = 'daily'
+                            );
+                        END IF;
+                    END $$
+                ''')
+                await conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_token_usage_unrolled
+                    ON token_usage(created_date) WHERE NOT rolled_up
+                ''')
+                
+                # Сообщения, не обработанные к моменту остановки бота (переигрываются при запуске)
+                await conn.execute('''
+                    CREATE TABLE IF NOT EXISTS pending_messages (
+                        id BIGSERIAL PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        payload JSONB NOT NULL,
+                        interrupted BOOLEAN DEFAULT FALSE,
+                        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                    )
+                ''')
+                # Несколько ботов в одном процессе/БД: каждый переигрывает только свои сообщения
+                await conn.execute('''
+                    ALTER TABLE pending_messages ADD COLUMN IF NOT EXISTS bot_id BIGINT NOT NULL DEFAULT 0
+                ''')
+                
             logger.info("✅ PostgreSQL tables initialized successfully")
                 
         except Exception as e:
@@ -181,22 +265,8 @@ class Database:
     async def add_or_update_user(self, user_data: Dict[str, Any]) -> bool:
         """Добавляет или обновляет пользователя"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute('''
-                    INSERT INTO users 
-                    (user_id, username, first_name, last_name, language_code, is_premium, last_activity)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                    ON CONFLICT (user_id) 
-                    DO UPDATE SET
-                        username = EXCLUDED.username,
-                        first_name = EXCLUDED.first_name,
-                        last_name = EXCLUDED.last_name,
-                        language_code = EXCLUDED.language_code,
-                        is_premium = EXCLUDED.is_premium,
-                        last_activity = EXCLUDED.last_activity,
-                        message_count = users.message_count + 1,
-                        is_active = TRUE
-                ''', 
+            await self.execute(
+                'users.upsert',
                 user_data['user_id'],
                 user_data.get('username'),
                 user_data.get('first_name'),
@@ -204,10 +274,10 @@ class Database:
                 user_data.get('language_code'),
                 user_data.get('is_premium', False),
                 datetime.now()
-                )
-                
-                logger.info(f"✅ User saved/updated: user_id={user_data['user_id']}")
-                return True
+            )
+            
+            logger.info(f"✅ User saved/updated: user_id={user_data['user_id']}")
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Failed to save user {user_data['user_id']}: {e}")
@@ -216,13 +286,9 @@ class Database:
     async def update_openai_thread(self, user_id: int, thread_id: str) -> bool:
         """Обновляет thread_id для пользователя"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute(
-                    'UPDATE users SET openai_thread_id = $1 WHERE user_id = $2',
-                    thread_id, user_id
-                )
-                logger.info(f"✅ Thread updated for user_id={user_id}: {thread_id}")
-                return True
+            await self.execute('users.update_thread', thread_id, user_id)
+            logger.info(f"✅ Thread updated for user_id={user_id}: {thread_id}")
+            return True
         except Exception as e:
             logger.error(f"❌ Failed to update thread for user_id={user_id}: {e}")
             return False
@@ -230,12 +296,8 @@ class Database:
     async def update_user_activity(self, user_id: int) -> bool:
         """Обновляет время последней активности"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute(
-                    'UPDATE users SET last_activity = $1, message_count = message_count + 1 WHERE user_id = $2',
-                    datetime.now(), user_id
-                )
-                return True
+            await self.execute('users.touch_activity', datetime.now(), user_id)
+            return True
         except Exception as e:
             logger.error(f"❌ Failed to update activity for user_id={user_id}: {e}")
             return False
@@ -243,12 +305,8 @@ class Database:
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получает данные пользователя"""
         try:
-            async with self.get_connection() as conn:
-                row = await conn.fetchrow(
-                    'SELECT * FROM users WHERE user_id = $1', 
-                    user_id
-                )
-                return dict(row) if row else None
+            row = await self.fetchrow('users.get', user_id)
+            return dict(row) if row else None
         except Exception as e:
             logger.error(f"❌ Failed to get user {user_id}: {e}")
             return None
@@ -256,11 +314,8 @@ class Database:
     async def get_all_users(self) -> List[Dict[str, Any]]:
         """Получает всех пользователей"""
         try:
-            async with self.get_connection() as conn:
-                rows = await conn.fetch(
-                    'SELECT * FROM users ORDER BY created_at DESC'
-                )
-                return [dict(row) for row in rows]
+            rows = await self.fetch('users.all')
+            return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"❌ Failed to get users: {e}")
             return []
@@ -268,13 +323,8 @@ class Database:
     async def get_active_users(self, days: int = 30) -> List[Dict[str, Any]]:
         """Получает активных пользователей за последние N дней"""
         try:
-            async with self.get_connection() as conn:
-                rows = await conn.fetch('''
-                    SELECT * FROM users 
-                    WHERE last_activity >= NOW() - INTERVAL '$1 days'
-                    ORDER BY last_activity DESC
-                ''', days)
-                return [dict(row) for row in rows]
+            rows = await self.fetch('users.active', days)
+            return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"❌ Failed to get active users: {e}")
             return []
@@ -285,20 +335,16 @@ class Database:
                          tokens_used: int = 0) -> bool:
         """Добавляет сообщение в лог"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute('''
-                    INSERT INTO messages 
-                    (user_id, message_text, message_type, openai_thread_id, openai_message_id, tokens_used)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                ''', 
+            await self.execute(
+                'messages.insert',
                 user_id,
                 message_text,
                 message_type,
                 openai_thread_id,
                 openai_message_id,
                 tokens_used
-                )
-                return True
+            )
+            return True
         except Exception as e:
             logger.error(f"❌ Failed to add message: {e}")
             return False
@@ -306,40 +352,41 @@ class Database:
     async def add_openai_activity(self, user_id: int, thread_id: str, run_id: str, 
                                  status: str, error_message: Optional[str] = None) -> bool:
         """Добавляет запись активности OpenAI"""
+        try:
+            await self.execute('openai_activity.insert', user_id, thread_id, run_id, status, error_message)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to add OpenAI activity: {e}")
+            return False
+    
+    async def save_pending_messages(self, bot_id: int, rows: List[tuple]) -> bool:
+        """Сохраняет необработанные сообщения: кортежи (user_id, payload_json, interrupted)"""
+        if not rows:
+            return True
         try:
             async with self.get_connection() as conn:
-                await conn.execute('''
-                    INSERT INTO openai_activity 
-                    (user_id, thread_id, run_id, status, error_message)
-                    VALUES ($1, $2, $3, $4, $5)
-                ''', 
-                user_id,
-                thread_id,
-                run_id,
-                status,
-                error_message
-                )
+                await queries.executemany(conn, 'pending_messages.insert', [(bot_id, *row) for row in rows])
                 return True
         except Exception as e:
-            logger.error(f"❌ Failed to add OpenAI activity: {e}")
+            logger.error(f"❌ Failed to save pending messages: {e}")
             return False
     
+    async def pop_pending_messages(self, bot_id: int) -> List[Dict[str, Any]]:
+        """Забирает (и удаляет) сохраненные сообщения бота в порядке поступления"""
+        try:
+            rows = await self.fetch('pending_messages.pop', bot_id)
+            return sorted((dict(row) for row in rows), key=lambda row: row['id'])
+        except Exception as e:
+            logger.error(f"❌ Failed to load pending messages: {e}")
+            return []
+    
     async def add_admin(self, user_id: int, username: str, first_name: str, added_by: int) -> bool:
         """Добавляет пользователя в список админов"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute('''
-                    INSERT INTO admins (user_id, username, first_name, added_by)
-                    VALUES ($1, $2, $3, $4)
-                    ON CONFLICT (user_id) 
-                    DO UPDATE SET
-                        username = EXCLUDED.username,
-                        first_name = EXCLUDED.first_name,
-                        is_active = TRUE
-                ''', user_id, username, first_name, added_by)
-                
-                logger.info(f"✅ Admin added: user_id={user_id} by added_by={added_by}")
-                return True
+            await self.execute('admins.upsert', user_id, username, first_name, added_by)
+            
+            logger.info(f"✅ Admin added: user_id={user_id} by added_by={added_by}")
+            return True
                 
         except Exception as e:
             logger.error(f"❌ Failed to add admin {user_id}: {e}")
@@ -348,13 +395,9 @@ class Database:
     async def remove_admin(self, user_id: int) -> bool:
         """Удаляет пользователя из списка админов"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute(
-                    'DELETE FROM admins WHERE user_id = $1',
-                    user_id
-                )
-                logger.info(f"✅ Admin removed: user_id={user_id}")
-                return True
+            await self.execute('admins.delete', user_id)
+            logger.info(f"✅ Admin removed: user_id={user_id}")
+            return True
         except Exception as e:
             logger.error(f"❌ Failed to remove admin {user_id}: {e}")
             return False
@@ -362,12 +405,8 @@ class Database:
     async def is_admin(self, user_id: int) -> bool:
         """Проверяет является ли пользователь админом"""
         try:
-            async with self.get_connection() as conn:
-                result = await conn.fetchval(
-                    'SELECT 1 FROM admins WHERE user_id = $1 AND is_active = TRUE',
-                    user_id
-                )
-                return result is not None
+            result = await self.fetchval('admins.is_active', user_id)
+            return result is not None
         except Exception as e:
             logger.error(f"❌ Failed to check admin status for {user_id}: {e}")
             return False
@@ -375,15 +414,8 @@ class Database:
     async def get_all_admins(self) -> List[Dict[str, Any]]:
         """Получает список всех админов"""
         try:
-            async with self.get_connection() as conn:
-                rows = await conn.fetch('''
-                    SELECT a.*, u.username as added_by_username 
-                    FROM admins a 
-                    LEFT JOIN users u ON a.added_by = u.user_id 
-                    WHERE a.is_active = TRUE 
-                    ORDER BY a.added_at DESC
-                ''')
-                return [dict(row) for row in rows]
+            rows = await self.fetch('admins.all')
+            return [dict(row) for row in rows]
         except Exception as e:
             logger.error(f"❌ Failed to get admins list: {e}")
             return []
@@ -392,12 +424,8 @@ class Database:
                              model: str, prompt_tokens: int, completion_tokens: int, total_tokens: int) -> bool:
         """Добавляет запись о использовании токенов"""
         try:
-            async with self.get_connection() as conn:
-                await conn.execute('''
-                    INSERT INTO token_usage 
-                    (user_id, thread_id, message_id, model, prompt_tokens, completion_tokens, total_tokens)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                ''', 
+            await self.execute(
+                'token_usage.insert',
                 user_id,
                 thread_id,
                 message_id,
@@ -405,8 +433,8 @@ class Database:
                 prompt_tokens,
                 completion_tokens,
                 total_tokens
-                )
-                return True
+            )
+            return True
         except Exception as e:
             logger.error(f"❌ Failed to add token usage: {e}")
             return False
@@ -416,43 +444,13 @@ class Database:
         try:
             async with self.get_connection() as conn:
                 # Общая статистика за период
-                total_stats = await conn.fetchrow('''
-                    SELECT 
-                        SUM(prompt_tokens) as total_prompt_tokens,
-                        SUM(completion_tokens) as total_completion_tokens,
-                        SUM(total_tokens) as total_tokens,
-                        COUNT(*) as request_count
-                    FROM token_usage 
-                    WHERE user_id = $1 AND created_date >= CURRENT_DATE - INTERVAL '$2 days'
-                ''', user_id, days)
+                total_stats = await queries.fetchrow(conn, 'token_usage.user_total', user_id, days)
                 
                 # Статистика по дням
-                daily_stats = await conn.fetch('''
-                    SELECT 
-                        created_date,
-                        SUM(prompt_tokens) as prompt_tokens,
-                        SUM(completion_tokens) as completion_tokens,
-                        SUM(total_tokens) as total_tokens,
-                        COUNT(*) as request_count
-                    FROM token_usage 
-                    WHERE user_id = $1 AND created_date >= CURRENT_DATE - INTERVAL '$2 days'
-                    GROUP BY created_date 
-                    ORDER BY created_date DESC
-                ''', user_id, days)
+                daily_stats = await queries.fetch(conn, 'token_usage.user_daily', user_id, days)
                 
                 # Статистика по моделям
-                model_stats = await conn.fetch('''
-                    SELECT 
-                        model,
-                        SUM(prompt_tokens) as prompt_tokens,
-                        SUM(completion_tokens) as completion_tokens,
-                        SUM(total_tokens) as total_tokens,
-                        COUNT(*) as request_count
-                    FROM token_usage 
-                    WHERE user_id = $1 AND created_date >= CURRENT_DATE - INTERVAL '$2 days'
-                    GROUP BY model 
-                    ORDER BY total_tokens DESC
-                ''', user_id, days)
+                model_stats = await queries.fetch(conn, 'token_usage.user_models', user_id, days)
                 
                 return {
                     'total': dict(total_stats) if total_stats else {},
@@ -468,47 +466,13 @@ class Database:
         try:
             async with self.get_connection() as conn:
                 # Общая статистика
-                total_stats = await conn.fetchrow('''
-                    SELECT 
-                        SUM(prompt_tokens) as total_prompt_tokens,
-                        SUM(completion_tokens) as total_completion_tokens,
-                        SUM(total_tokens) as total_tokens,
-                        COUNT(DISTINCT user_id) as unique_users,
-                        COUNT(*) as total_requests
-                    FROM token_usage 
-                    WHERE created_date >= CURRENT_DATE - INTERVAL '$1 days'
-                ''', days)
+                total_stats = await queries.fetchrow(conn, 'token_usage.global_total', days)
                 
                 # Топ пользователей по токенам
-                top_users = await conn.fetch('''
-                    SELECT 
-                        u.user_id,
-                        u.username,
-                        u.first_name,
-                        SUM(t.total_tokens) as total_tokens,
-                        COUNT(t.id) as request_count
-                    FROM token_usage t
-                    JOIN users u ON t.user_id = u.user_id
-                    WHERE t.created_date >= CURRENT_DATE - INTERVAL '$1 days'
-                    GROUP BY u.user_id, u.username, u.first_name
-                    ORDER BY total_tokens DESC
-                    LIMIT 10
-                ''', days)
+                top_users = await queries.fetch(conn, 'token_usage.global_top_users', days)
                 
                 # Статистика по дням
-                daily_stats = await conn.fetch('''
-                    SELECT 
-                        created_date,
-                        SUM(prompt_tokens) as prompt_tokens,
-                        SUM(completion_tokens) as completion_tokens,
-                        SUM(total_tokens) as total_tokens,
-                        COUNT(DISTINCT user_id) as unique_users,
-                        COUNT(*) as request_count
-                    FROM token_usage 
-                    WHERE created_date >= CURRENT_DATE - INTERVAL '$1 days'
-                    GROUP BY created_date 
-                    ORDER BY created_date DESC
-                ''', days)
+                daily_stats = await queries.fetch(conn, 'token_usage.global_daily', days)
                 
                 return {
                     'total': dict(total_stats) if total_stats else {},
@@ -519,22 +483,43 @@ class Database:
             logger.error(f"❌ Failed to get global token stats: {e}")
             return {}
     
-    async def get_user_stats(self) -> Dict[str, Any]:
-        """Получает общую статистику пользователей"""
+    async def count_active_users(self, days: int = 30) -> int:
+        """Число пользователей, активных за последние N дней"""
         try:
-            async with self.get_connection() as conn:
-                total_users = await conn.fetchval('SELECT COUNT(*) FROM users')
-                active_users = await conn.fetchval('''
-                    SELECT COUNT(*) FROM users 
-                    WHERE last_activity >= NOW() - INTERVAL '30 days'
-                ''')
-                total_messages = await conn.fetchval('SELECT COUNT(*) FROM messages')
-                
-                return {
-                    'total_users': total_users,
-                    'active_users_30d': active_users,
-                    'total_messages': total_messages
-                }
+            return await self.fetchval('users.count_active', days)
+        except Exception as e:
+            logger.error(f"❌ Failed to count active users: {e}")
+            return 0
+    
+    async def count_new_users(self, days: int = 30) -> int:
+        """Число пользователей, пришедших за последние N дней"""
+        try:
+            return await self.fetchval('users.count_new', days)
+        except Exception as e:
+            logger.error(f"❌ Failed to count new users: {e}")
+            return 0
+    
+    async def count_messages(self, days: Optional[int] = None) -> int:
+        """Число сообщений за последние N дней (None - за все время)"""
+        try:
+            if days is None:
+                return await self.fetchval('messages.count')
+            return await self.fetchval('messages.count_since', days)
+        except Exception as e:
+            logger.error(f"❌ Failed to count messages: {e}")
+            return 0
+    
+    async def get_user_stats(self, days: int = 30) -> Dict[str, Any]:
+        """Получает общую статистику пользователей (окно - последние N дней)"""
+        try:
+            row = await self.fetchrow('users.window_stats', days)
+            return {
+                'total_users': row['total_users'],
+                f'active_users_{days}d': row['active_users'],
+                f'new_users_{days}d': row['new_users'],
+                'total_messages': row['total_messages'],
+                f'messages_{days}d': row['messages']
+            }
         except Exception as e:
             logger.error(f"❌ Failed to get user stats: {e}")
-            return {}
\ No newline at end of file
+            return {}
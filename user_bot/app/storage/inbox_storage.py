@@ -0,0 +1,282 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from shared.storage.queries import queries
+
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+# Пространство ключей advisory-блокировок очереди (первый аргумент pg_try_advisory_lock,
+# второй - hashtext(user_id), см. inbox.lock_user в queries.py)
+INBOX_LOCK_NAMESPACE = 7301
+INBOX_CHANNEL = 'inbox_new'
+
+
+class InboxClaim:
+    """
+    Взятое в работу сообщение. Держит соединение, на котором висит
+    advisory-блокировка пользователя, до complete/retry/abandon - то есть
+    все время ответа. Каждый занятый воркер держит одно соединение пула
+    """
+
+    __slots__ = ('id', 'user_id', 'payload', 'attempts', 'conn')
+
+    def __init__(self, row, conn):
+        self.id = row['id']
+        self.user_id = row['user_id']
+        self.payload = json.loads(row['payload'])
+        self.attempts = row['attempts']
+        self.conn = conn
+
+
+class InboxStorage:
+    """
+    Надежная очередь входящих сообщений в таблице inbox.
+
+    Строка пишется при получении сообщения и помечается done только после ответа.
+    Порядок сообщений одного пользователя держит сессионная advisory-блокировка:
+    пока воркер (в любом процессе) обрабатывает пользователя, остальные его пропускают.
+    Взятая строка получает статус processing, и claim не рассматривает пользователей,
+    у которых такая строка есть, - занятые пользователи не забивают выборку кандидатов.
+    Если процесс упал, блокировка снимается вместе с соединением, и recover()
+    возвращает его строки в pending - обработка "хотя бы один раз".
+    """
+
+    def __init__(self, database: Database, max_attempts: int = 3, claim_batch: int = 50):
+        self.db = database
+        self.max_attempts = max_attempts
+        self.claim_batch = claim_batch
+        # Раздел очереди этого процесса: user_id % partition_count == partition_index
+        self.partition_index = 0
+        self.partition_count = 1
+        self._listen_conn = None
+        self._listen_callback = None
+
+    async def initialize(self):
+        """Создает таблицу очереди"""
+        async with self.db.get_connection() as conn:
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS inbox (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_id BIGINT NOT NULL,
+                    chat_id BIGINT NOT NULL,
+                    message_id BIGINT NOT NULL,
+                    payload JSONB NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    claimed_by TEXT,
+                    claimed_at TIMESTAMP WITH TIME ZONE,
+                    available_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                    processed_at TIMESTAMP WITH TIME ZONE,
+                    UNIQUE (chat_id, message_id)
+                )
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_inbox_pending
+                ON inbox(id) WHERE status = 'pending'
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_inbox_user_pending
+                ON inbox(user_id, id) WHERE status = 'pending'
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_inbox_user_processing
+                ON inbox(user_id) WHERE status = 'processing'
+            ''')
+
+    async def enqueue(self, user_id: int, chat_id: int, message_id: int,
+                      payload: Dict[str, Any]) -> int:
+        """
+        Записывает сообщение и будит воркеры. Повторная доставка того же
+        сообщения Telegram игнорируется. Возвращает число ожидающих сообщений пользователя
+        """
+        async with self.db.get_connection() as conn:
+            async with conn.transaction():
+                await queries.execute(conn, 'inbox.enqueue', user_id, chat_id, message_id,
+                                      json.dumps(payload, ensure_ascii=False))
+                # Уведомление уходит при коммите
+                await queries.execute(conn, 'inbox.notify', INBOX_CHANNEL, str(user_id))
+                return await queries.fetchval(conn, 'inbox.user_depth', user_id)
+
+    def set_partition(self, index: int, count: int):
+        """Ограничивает claim пользователями одного раздела (для нескольких воркер-процессов)"""
+        self.partition_index = index
+        self.partition_count = max(1, count)
+
+    async def claim(self, worker_id: str) -> Optional[InboxClaim]:
+        """
+        Берет самое старое готовое сообщение пользователя (из своего раздела),
+        которого сейчас никто не обрабатывает. None - работы нет
+        """
+        conn = await self.db.pool.acquire()
+        claim = None
+        try:
+            # Кандидаты - первые строки очереди пользователей без строки в работе
+            candidates = await queries.fetch(
+                conn, 'inbox.claim_candidates', self.claim_batch, self.partition_count, self.partition_index
+            )
+
+            for candidate in candidates:
+                user_id = candidate['user_id']
+                if not await queries.fetchval(conn, 'inbox.lock_user', INBOX_LOCK_NAMESPACE, user_id):
+                    continue
+
+                # Под блокировкой пользователя проверяем, что кандидат все еще первый
+                row = await queries.fetchrow(conn, 'inbox.claim', candidate['id'], user_id, worker_id)
+                if row is None:
+                    await self._unlock(conn, user_id)
+                    continue
+
+                claim = InboxClaim(row, conn)
+                break
+        except Exception:
+            await self.db.pool.release(conn)
+            raise
+
+        if claim is None:
+            await self.db.pool.release(conn)
+        return claim
+
+    async def recover(self) -> int:
+        """
+        Возвращает в pending строки processing, которые никто не обрабатывает
+        (процесс упал вместе с соединением и блокировкой). Возвращает число строк
+        """
+        recovered = 0
+        try:
+            async with self.db.get_connection() as conn:
+                user_ids = await queries.fetch(
+                    conn, 'inbox.processing_users', self.partition_count, self.partition_index
+                )
+
+                for row in user_ids:
+                    user_id = row['user_id']
+                    if not await queries.fetchval(conn, 'inbox.lock_user', INBOX_LOCK_NAMESPACE, user_id):
+                        # Пользователя обрабатывают
+                        continue
+                    try:
+                        result = await queries.execute(conn, 'inbox.recover_user', user_id)
+                        recovered += int(result.split()[-1])
+                    finally:
+                        await self._unlock(conn, user_id)
+        except Exception as e:
+            logger.error(f"❌ Failed to recover inbox messages: {e}")
+
+        if recovered:
+            logger.warning(f"♻️ Returned {recovered} abandoned inbox messages to the queue")
+        return recovered
+
+    async def complete(self, claim: InboxClaim) -> bool:
+        """Помечает сообщение обработанным и отпускает пользователя"""
+        try:
+            await queries.execute(claim.conn, 'inbox.complete', claim.id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to complete inbox message {claim.id}: {e}")
+            return False
+        finally:
+            await self._finish(claim)
+
+    async def retry(self, claim: InboxClaim, error: str, delay: float) -> bool:
+        """Откладывает сообщение на delay секунд; после max_attempts помечает failed"""
+        try:
+            status = 'failed' if claim.attempts >= self.max_attempts else 'pending'
+            await queries.execute(claim.conn, 'inbox.retry', claim.id, status, error[:1000], delay)
+            if status == 'failed':
+                logger.error(f"❌ Inbox message {claim.id} failed after {claim.attempts} attempts: {error}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to reschedule inbox message {claim.id}: {e}")
+            return False
+        finally:
+            await self._finish(claim)
+
+    async def abandon(self, claim: InboxClaim):
+        """Возвращает сообщение в очередь (остановка процесса)"""
+        try:
+            await queries.execute(claim.conn, 'inbox.abandon', claim.id)
+        except Exception as e:
+            # Строку вернет recover() после снятия блокировки
+            logger.error(f"❌ Failed to return inbox message {claim.id}: {e}")
+        finally:
+            await self._finish(claim)
+
+    async def load(self) -> Optional[Tuple[int, int]]:
+        """(ожидают, в работе) по всей очереди; None - запрос не удался"""
+        try:
+            async with self.db.get_connection() as conn:
+                row = await queries.fetchrow(conn, 'inbox.load')
+                return row['waiting'], row['in_progress']
+        except Exception as e:
+            logger.error(f"❌ Failed to count inbox messages: {e}")
+            return None
+
+    async def user_depth(self, user_id: int) -> int:
+        """Сколько сообщений пользователя ждет (без взятого в работу)"""
+        try:
+            async with self.db.get_connection() as conn:
+                return await queries.fetchval(conn, 'inbox.user_depth', user_id)
+        except Exception as e:
+            logger.error(f"❌ Failed to count inbox messages of user_id={user_id}: {e}")
+            return 0
+
+    async def positions(self, messages: List[Tuple[int, int]]) -> Optional[Dict[Tuple[int, int], int]]:
+        """
+        Места сообщений (chat_id, message_id) в очереди: сколько ожидающих строк
+        записано не позже них. Взятых в работу, обработанных и отсутствующих
+        сообщений в ответе нет, None - запрос не удался
+        """
+        if not messages:
+            return {}
+        try:
+            async with self.db.get_connection() as conn:
+                rows = await queries.fetch(
+                    conn, 'inbox.positions',
+                    [chat_id for chat_id, _ in messages], [message_id for _, message_id in messages]
+                )
+        except Exception as e:
+            logger.error(f"❌ Failed to get inbox positions: {e}")
+            return None
+        return {(row['chat_id'], row['message_id']): row['position'] for row in rows}
+
+    async def cleanup(self, retention_hours: int = 48) -> None:
+        """Удаляет давно обработанные сообщения"""
+        try:
+            async with self.db.get_connection() as conn:
+                await queries.execute(conn, 'inbox.cleanup', retention_hours)
+        except Exception as e:
+            logger.error(f"❌ Failed to clean inbox: {e}")
+
+    async def listen(self, callback: Callable[[], None]):
+        """Подписывается на уведомления о новых сообщениях (отдельное соединение)"""
+        self._listen_conn = await self.db.pool.acquire()
+        self._listen_callback = lambda *args: callback()
+        await self._listen_conn.add_listener(INBOX_CHANNEL, self._listen_callback)
+
+    async def unlisten(self):
+        """Снимает подписку и возвращает соединение в пул"""
+        if self._listen_conn is None:
+            return
+        try:
+            await self._listen_conn.remove_listener(INBOX_CHANNEL, self._listen_callback)
+        except Exception as e:
+            logger.error(f"❌ Failed to remove inbox listener: {e}")
+        finally:
+            await self.db.pool.release(self._listen_conn)
+            self._listen_conn = None
+            self._listen_callback = None
+
+    async def _unlock(self, conn, user_id: int):
+        await queries.execute(conn, 'inbox.unlock_user', INBOX_LOCK_NAMESPACE, user_id)
+
+    async def _finish(self, claim: InboxClaim):
+        try:
+            await self._unlock(claim.conn, claim.user_id)
+        except Exception as e:
+            logger.error(f"❌ Failed to unlock user_id={claim.user_id}: {e}")
+        finally:
+            await self.db.pool.release(claim.conn)
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Deque, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import asyncpg
+
+from app.helpers.metrics import metrics
+from .database import Database
+
+logger = logging.getLogger(__name__)
+
+# Колонки, которые пишет LogWriter (created_at - время события, а не записи пачки)
+LOG_TABLES: Dict[str, Tuple[str, ...]] = {
+    'messages': (
+        'user_id', 'message_text', 'message_type', 'openai_thread_id',
+        'openai_message_id', 'tokens_used', 'created_at'
+    ),
+    'openai_activity': (
+        'user_id', 'thread_id', 'run_id', 'status', 'error_message', 'created_at'
+    ),
+    'token_usage': (
+        'user_id', 'thread_id', 'message_id', 'model',
+        'prompt_tokens', 'completion_tokens', 'total_tokens', 'created_at', 'created_date'
+    ),
+}
+# Таблицы с колонкой created_date: по ней строятся суточные агрегаты, поэтому дата
+# берется из created_at (в часовом поясе сессии PostgreSQL, как у CURRENT_DATE
+# и свертки), а не из DEFAULT CURRENT_DATE в момент записи пачки
+DATED_TABLES = frozenset({'token_usage'})
+
+# Ошибки в данных одной строки: пачку дописываем построчно, плохие строки отбрасываем
+_ROW_ERRORS = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError)
+
+
+class LogWriter:
+    """
+    Журналы (messages, openai_activity, token_usage) пишутся не INSERT на строку
+    в пути ответа, а в буферы в памяти; фоновая задача сбрасывает их через COPY
+    (copy_records_to_table) раз в flush_interval или сразу, как только в буфере
+    набирается batch_size строк.
+
+    Память ограничена buffer_size строк на таблицу. Пока место есть, write()
+    не ждет вообще; если буфер полон (БД недоступна или не успевает), write()
+    ждет освобождения места не дольше max_block секунд, затем строка отбрасывается
+    """
+
+    def __init__(self, database: Database, flush_interval: float = 1.0, batch_size: int = 500,
+                 buffer_size: int = 10000, max_block: float = 0.5):
+        self.db = database
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.buffer_size = max(self.batch_size, buffer_size)
+        self.max_block = max_block
+        self._buffers: Dict[str, Deque[tuple]] = {table: deque() for table in LOG_TABLES}
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._timezone: Optional[tzinfo] = None
+        self._written = 0
+        self._dropped = 0
+
+    async def write(self, table: str, record: tuple) -> bool:
+        """Добавляет строку (без created_at - он проставляется здесь). False - строка отброшена"""
+        buffer = self._buffers[table]
+        if len(buffer) >= self.buffer_size:
+            # Обратное давление: даем фоновой записи освободить место, но недолго
+            self._space.clear()
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._space.wait(), timeout=self.max_block)
+            except asyncio.TimeoutError:
+                pass
+            if len(buffer) >= self.buffer_size:
+                self._dropped += 1
+                metrics.incr('log_records_dropped_total', table=table)
+                return False
+
+        buffer.append(record + (datetime.now(timezone.utc),))
+        if len(buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name="log-writer")
+
+    async def stop(self):
+        """Останавливает фоновую запись и сбрасывает все буферы"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        pending = sum(len(buffer) for buffer in self._buffers.values())
+        if pending:
+            logger.error(f"❌ {pending} log records not written on shutdown")
+
+    async def flush(self) -> int:
+        """Записывает все буферы. Возвращает число записанных строк"""
+        async with self._lock:
+            written = 0
+            for table, buffer in self._buffers.items():
+                while buffer:
+                    batch = [buffer.popleft() for _ in range(min(self.batch_size, len(buffer)))]
+                    self._space.set()
+                    unwritten = await self._write_batch(table, batch)
+                    written += len(batch) - len(unwritten)
+                    if unwritten:
+                        # БД недоступна - возвращаем остаток в начало буфера и пробуем позже
+                        buffer.extendleft(reversed(unwritten))
+                        break
+            self._written += written
+            return written
+
+    async def _write_batch(self, table: str, batch: List[tuple]) -> List[tuple]:
+        """Пишет пачку. Возвращает строки, которые нужно повторить позже (пусто - готово)"""
+        columns = LOG_TABLES[table]
+        records = batch
+        started = time.monotonic()
+        try:
+            async with self.db.get_connection() as conn:
+                if table in DATED_TABLES:
+                    session_tz = await self._session_timezone(conn)
+                    records = [record + (record[-1].astimezone(session_tz).date(),) for record in batch]
+                await conn.copy_records_to_table(table, records=records, columns=columns)
+            metrics.observe('log_flush_seconds', time.monotonic() - started, table=table)
+            return []
+        except _ROW_ERRORS as e:
+            logger.warning(f"⚠️ COPY into {table} rejected ({e}), writing {len(batch)} rows one by one")
+        except Exception as e:
+            logger.error(f"❌ Failed to write {len(batch)} rows into {table}: {e}")
+            return batch
+
+        placeholders = ', '.join(f"${index + 1}" for index in range(len(columns)))
+        query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        done = 0
+        try:
+            async with self.db.get_connection() as conn:
+                for record in records:
+                    try:
+                        await conn.execute(query, *record)
+                    except _ROW_ERRORS as e:
+                        self._dropped += 1
+                        metrics.incr('log_records_dropped_total', table=table)
+                        logger.error(f"❌ Dropped {table} row for user_id={record[0]}: {e}")
+                    done += 1
+        except Exception as e:
+            logger.error(f"❌ Failed to write {len(batch) - done} rows into {table}: {e}")
+        return batch[done:]
+
+    async def _session_timezone(self, conn) -> tzinfo:
+        """Часовой пояс сессии PostgreSQL (в нем CURRENT_DATE и границы дней свертки)"""
+        if self._timezone is None:
+            name = await conn.fetchval("SELECT current_setting('TimeZone')")
+            try:
+                self._timezone = ZoneInfo(name)
+            except (ZoneInfoNotFoundError, ValueError):
+                # Пояс, которого нет в базе zoneinfo: берем текущее смещение
+                offset = await conn.fetchval('SELECT EXTRACT(TIMEZONE FROM NOW())::int')
+                self._timezone = timezone(timedelta(seconds=offset))
+                logger.warning(f"⚠️ Unknown PostgreSQL TimeZone {name!r}, using fixed offset {offset}s")
+        return self._timezone
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'buffered': {table: len(buffer) for table, buffer in self._buffers.items()},
+            'written_total': self._written,
+            'dropped_total': self._dropped
+        }
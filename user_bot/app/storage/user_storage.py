@@ -1,31 +1,80 @@
 import logging
+from collections import OrderedDict
 from typing import Optional, Dict, Any, List
+from aiogram.types import InlineKeyboardMarkup
+import asyncpg
+from config import config
 from .database import Database
 from .content_storage import ContentStorage
+from .content_cache import ContentCache, ContentSnapshot
+from app.bot.keyboards import create_more_keyboard, create_support_topics_keyboard
 from .referral_storage import ReferralStorage
+from .inbox_storage import InboxStorage
+from .activity_aggregator import ActivityAggregator
+from .log_writer import LogWriter
 
 logger = logging.getLogger(__name__)
 
 class UserStorage:
-    def __init__(self, database_url: str):
-        self.db = Database(database_url)
+    def __init__(self, database_url: str, pool: Optional[asyncpg.Pool] = None,
+                 content_cache: Optional[ContentCache] = None):
+        self.db = Database(database_url, pool=pool)
         self.content_storage: Optional[ContentStorage] = None
+        # bot_content читается из снимка в памяти; пока он не загружен - из БД.
+        # Общий кэш нескольких ботов (хост) запускает и останавливает его владелец
+        self._owns_content_cache = content_cache is None
+        self.content_cache: Optional[ContentCache] = content_cache
+        if self.content_cache is None and config.CONTENT_CACHE_ENABLED:
+            self.content_cache = ContentCache(self.db, refresh_interval=config.CONTENT_CACHE_REFRESH_INTERVAL)
         self.referral_storage: Optional[ReferralStorage] = None
+        # Надежная очередь входящих сообщений (используется при MESSAGE_QUEUE=postgres)
+        self.inbox = InboxStorage(self.db)
+        # Активность (last_activity, message_count) пишется пачками, а не на каждое сообщение
+        self.activity = ActivityAggregator(self.db)
+        # Журналы (сообщения, активность OpenAI, токены) пишутся пачками через COPY
+        self.log_writer = LogWriter(
+            self.db,
+            flush_interval=config.LOG_FLUSH_INTERVAL,
+            batch_size=config.LOG_BATCH_SIZE,
+            buffer_size=config.LOG_BUFFER_SIZE
+        )
+        # Последний сохраненный профиль пользователя: повторно пишем только при изменении
+        self._saved_profiles: "OrderedDict[int, tuple]" = OrderedDict()
+        self._saved_profiles_limit = 50000
     
     async def initialize(self):
         """Инициализирует все хранилища"""
         await self.db.connect()
         self.content_storage = ContentStorage(self.db)
         self.referral_storage = ReferralStorage(self.db)
+        if self.content_cache and self._owns_content_cache:
+            await self.content_cache.start()
+        await self.inbox.initialize()
+        await self.activity.start()
+        await self.log_writer.start()
         logger.info("✅ All storages initialized")
     
     async def close(self):
-        """Закрывает подключение к базе данных"""
+        """Сбрасывает накопленную активность и журналы и закрывает подключение к базе данных"""
+        if self.content_cache and self._owns_content_cache:
+            await self.content_cache.stop()
+        await self.log_writer.stop()
+        await self.activity.stop()
         await self.db.close()
     
     async def save_user_from_message(self, message) -> bool:
-        """Сохраняет пользователя из сообщения Telegram"""
+        """
+        Сохраняет пользователя из сообщения Telegram. Запрос в БД идет только для
+        нового (для этого процесса) пользователя или при изменении профиля
+        """
         user = message.from_user
+        profile = (
+            user.username, user.first_name, user.last_name,
+            user.language_code, getattr(user, 'is_premium', False)
+        )
+        if self._saved_profiles.get(user.id) == profile:
+            self._saved_profiles.move_to_end(user.id)
+            return True
         
         user_data = {
             'user_id': user.id,
@@ -36,7 +85,13 @@ class UserStorage:
             'is_premium': getattr(user, 'is_premium', False)
         }
         
-        return await self.db.add_or_update_user(user_data)
+        saved = await self.db.add_or_update_user(user_data)
+        if saved:
+            self._saved_profiles[user.id] = profile
+            self._saved_profiles.move_to_end(user.id)
+            while len(self._saved_profiles) > self._saved_profiles_limit:
+                self._saved_profiles.popitem(last=False)
+        return saved
     
     async def get_thread_id(self, user_id: int) -> Optional[str]:
         """Получает thread_id для пользователя"""
@@ -48,8 +103,9 @@ class UserStorage:
         return await self.db.update_openai_thread(user_id, thread_id)
     
     async def update_activity(self, user_id: int) -> bool:
-        """Обновляет активность пользователя"""
-        return await self.db.update_user_activity(user_id)
+        """Учитывает сообщение пользователя (запишется в БД с ближайшей пачкой)"""
+        self.activity.record(user_id)
+        return True
     
     async def get_user_stats(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Получает статистику пользователя"""
@@ -61,25 +117,33 @@ class UserStorage:
     
     async def get_active_users_count(self, days: int = 30) -> int:
         """Получает количество активных пользователей"""
-        users = await self.db.get_active_users(days)
-        return len(users)
+        return await self.db.count_active_users(days)
     
     async def log_message(self, user_id: int, message_text: str, message_type: str, 
                          openai_thread_id: Optional[str] = None, 
                          openai_message_id: Optional[str] = None,
                          tokens_used: int = 0) -> bool:
-        """Логирует сообщение"""
-        return await self.db.add_message(
-            user_id, message_text, message_type, 
+        """Логирует сообщение (запись в БД - фоном, пачкой)"""
+        return await self.log_writer.write('messages', (
+            user_id, message_text, message_type,
             openai_thread_id, openai_message_id, tokens_used
-        )
+        ))
     
     async def log_openai_activity(self, user_id: int, thread_id: str, run_id: str, 
                                 status: str, error_message: Optional[str] = None) -> bool:
-        """Логирует активность OpenAI"""
-        return await self.db.add_openai_activity(
-            user_id, thread_id, run_id, status, error_message
-        )
+        """Логирует активность OpenAI (запись в БД - фоном, пачкой)"""
+        return await self.log_writer.write('openai_activity', (
+            user_id, thread_id, run_id, status,
+            str(error_message) if error_message is not None else None
+        ))
+    
+    async def save_pending_messages(self, bot_id: int, rows: List[tuple]) -> bool:
+        """Сохраняет очередь необработанных сообщений при остановке"""
+        return await self.db.save_pending_messages(bot_id, rows)
+    
+    async def pop_pending_messages(self, bot_id: int) -> List[Dict[str, Any]]:
+        """Забирает сохраненные при прошлой остановке сообщения бота"""
+        return await self.db.pop_pending_messages(bot_id)
     
     async def get_bot_stats(self) -> Dict[str, Any]:
         """Получает общую статистику бота"""
@@ -104,17 +168,16 @@ class UserStorage:
     
     async def is_super_admin(self, user_id: int) -> bool:
         """Проверяет является ли пользователь суперадмином"""
-        from config import config
         return user_id == config.SUPER_ADMIN_ID
     
     # Методы для работы с токенами
     async def add_token_usage(self, user_id: int, thread_id: Optional[str], message_id: Optional[str], 
                              model: str, prompt_tokens: int, completion_tokens: int, total_tokens: int) -> bool:
-        """Добавляет запись о использовании токенов"""
-        return await self.db.add_token_usage(
-            user_id, thread_id, message_id, model, 
+        """Добавляет запись о использовании токенов (запись в БД - фоном, пачкой)"""
+        return await self.log_writer.write('token_usage', (
+            user_id, thread_id, message_id, model,
             prompt_tokens, completion_tokens, total_tokens
-        )
+        ))
     
     async def get_user_token_stats(self, user_id: int, days: int = 30) -> Dict[str, Any]:
         """Получает статистику токенов для пользователя"""
@@ -126,34 +189,69 @@ class UserStorage:
 
     # 🔥 МЕТОДЫ ДЛЯ КОНТЕНТА И РЕФЕРАЛОВ
     
+    def _content_snapshot(self) -> Optional[ContentSnapshot]:
+        return self.content_cache.snapshot if self.content_cache else None
+    
     async def get_more_buttons(self) -> List[Dict]:
         """Получает все кнопки для /more"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.more_buttons
         if self.content_storage:
             return await self.content_storage.get_all_active_buttons()
         return []
     
+    async def get_more_keyboard(self) -> Optional[InlineKeyboardMarkup]:
+        """Клавиатура /more (None - кнопок нет)"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.more_keyboard
+        buttons = await self.get_more_buttons()
+        return create_more_keyboard(buttons) if buttons else None
+    
     async def get_button_by_id(self, button_id: int) -> Optional[Dict]:
         """Получает кнопку по ID"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.by_id.get(button_id)
         if self.content_storage:
             return await self.content_storage.get_button_by_id(button_id)
         return None
     
     async def get_button_by_command(self, command: str) -> Optional[Dict]:
         """Получает кнопку по команде"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.by_command.get(command)
         if self.content_storage:
             return await self.content_storage.get_button_by_command(command)
         return None
     
     async def get_content_by_key(self, key: str) -> Optional[Dict]:
         """Получает контент по ключу"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.by_key.get(key)
         if self.content_storage:
             return await self.content_storage.get_content_by_key(key)
         return None
     
+    async def get_content_by_category(self, category: str) -> List[Dict]:
+        """Активный контент категории в порядке order_index"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.by_category.get(category, [])
+        rows = await self.db.fetch('content.all_active')
+        return [dict(row) for row in rows if row['category'] == category]
+    
     async def update_content(self, key: str, **kwargs) -> bool:
         """Обновляет контент"""
         if self.content_storage:
-            return await self.content_storage.update_content(key, **kwargs)
+            updated = await self.content_storage.update_content(key, **kwargs)
+            if updated and self.content_cache:
+                # Триггер разбудит остальные процессы, этот перечитает сразу
+                self.content_cache.invalidate()
+            return updated
         return False
     
     async def add_button(self, key: str, button_text: str, command: str, 
@@ -161,31 +259,27 @@ class UserStorage:
                         order_index: int = 0) -> bool:
         """Добавляет новую кнопку"""
         if self.content_storage:
-            return await self.content_storage.add_button(
+            added = await self.content_storage.add_button(
                 key, button_text, command, content_text, model, order_index
             )
+            if added and self.content_cache:
+                self.content_cache.invalidate()
+            return added
         return False
 
     # 🔥 МЕТОДЫ ДЛЯ СИСТЕМЫ ПОДДЕРЖКИ (ТИКЕТЫ)
     
     async def get_support_topics(self) -> List[Dict]:
         """Получает все темы поддержки из таблицы bot_content"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.support_topics
         try:
             if not self.db.pool:
                 logger.error("Database pool not initialized")
                 return []
                 
-            query = """
-                SELECT 
-                    id,
-                    key as name,
-                    button_text,
-                    content_text as description
-                FROM bot_content 
-                WHERE category = 'support_topics' AND is_active = TRUE
-                ORDER BY order_index
-            """
-            rows = await self.db.pool.fetch(query)
+            rows = await self.db.fetch('content.support_topic_buttons')
             
             # 🔥 ИСПРАВЛЕНИЕ: парсим emoji из button_text
             topics = []
@@ -212,6 +306,24 @@ class UserStorage:
             logger.error(f"❌ Error getting support topics: {e}")
             return []
 
+    async def get_support_topic(self, topic_id: int) -> Optional[Dict]:
+        """Тема поддержки по ID"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.support_topics_by_id.get(topic_id)
+        for topic in await self.get_support_topics():
+            if topic['id'] == topic_id:
+                return topic
+        return None
+    
+    async def get_support_topics_keyboard(self) -> Optional[InlineKeyboardMarkup]:
+        """Клавиатура тем поддержки (None - тем нет)"""
+        snapshot = self._content_snapshot()
+        if snapshot:
+            return snapshot.support_keyboard
+        topics = await self.get_support_topics()
+        return create_support_topics_keyboard(topics) if topics else None
+
     async def create_support_ticket(self, user_id: int, topic: str, message: str) -> Optional[str]:
         """Создает новый тикет поддержки"""
         try:
@@ -222,15 +334,8 @@ class UserStorage:
             
             logger.info(f"🎫 Creating ticket: {ticket_number}, user: {user_id}, topic: {topic}")
             
-            query = """
-                INSERT INTO support_tickets 
-                (ticket_number, user_id, topic, user_message, status, created_at)
-                VALUES ($1, $2, $3, $4, 'open', $5)
-                RETURNING ticket_number
-            """
-            
-            result = await self.db.pool.fetchval(
-                query, ticket_number, user_id, topic, message, datetime.now()
+            result = await self.db.fetchval(
+                'tickets.insert_returning', ticket_number, user_id, topic, message, datetime.now()
             )
             
             logger.info(f"✅ Support ticket created successfully: {result}")
@@ -248,14 +353,7 @@ class UserStorage:
     ) -> bool:
         """Обновляет ID сообщения в канале для тикета"""
         try:
-            query = """
-                UPDATE support_tickets 
-                SET channel_message_id = $1, 
-                    channel_thread_id = $2
-                WHERE ticket_number = $3
-                RETURNING ticket_number
-            """
-            result = await self.db.pool.fetchval(query, message_id, thread_id, ticket_number)
+            result = await self.db.fetchval('tickets.set_channel_message', message_id, thread_id, ticket_number)
             return result is not None
         except Exception as e:
             logger.error(f"❌ Error updating channel message: {e}")
@@ -265,22 +363,14 @@ class UserStorage:
     async def get_user_tickets(self, user_id: int, limit: int = 5) -> List[Dict]:
         """Получает тикеты пользователя"""
         try:
-            query = """
-                SELECT ticket_number, topic, user_message, admin_response, 
-                    status, created_at, updated_at
-                FROM support_tickets 
-                WHERE user_id = $1 
-                ORDER BY created_at DESC 
-                LIMIT $2
-            """
-            return await self.db.pool.fetch(query, user_id, limit)
+            return await self.db.fetch('tickets.by_user', user_id, limit)
         except Exception as e:
             logger.error(f"Error getting user tickets: {e}")
             return []
 
     # Методы для реферальной системы
-    async def add_referral(self, referrer_id: int, referral_id: int, referral_code: str = None) -> bool:
-        """Добавляет реферальную связь"""
+    async def add_referral(self, referrer_id: int, referral_id: int, referral_code: str = None) -> Optional[bool]:
+        """Добавляет реферальную связь. False - уже добавлена, None - ошибка БД"""
         if self.referral_storage:
             return await self.referral_storage.add_referral(referrer_id, referral_id, referral_code)
         return False
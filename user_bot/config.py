@@ -36,6 +36,106 @@ class Config:
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "5"))
     
+    # Прием обновлений: "polling" или "webhook"
+    UPDATES_MODE: str = os.getenv("UPDATES_MODE", "polling")
+    WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "")
+    WEBHOOK_SECRET: str = os.getenv("USER_BOT_WEBHOOK_SECRET", "")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    WEBHOOK_PORT: int = int(os.getenv("USER_BOT_WEBHOOK_PORT", "8081"))
+    WEBHOOK_PATH: str = os.getenv("USER_BOT_WEBHOOK_PATH", "/webhook/user")
+    WEBHOOK_INTAKE_SIZE: int = int(os.getenv("WEBHOOK_INTAKE_SIZE", "1000"))
+    
+    # Адрес Bot API (локальный Bot API сервер или тестовая заглушка), пусто - api.telegram.org
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "")
+    
+    # FSM (диалоги поддержки/тикетов): "postgres" - переживает рестарт, "memory" - в процессе
+    FSM_STORAGE: str = os.getenv("FSM_STORAGE", "postgres")
+    FSM_CACHE_TTL: float = float(os.getenv("FSM_CACHE_TTL", "5"))
+    FSM_STATE_TTL_HOURS: int = int(os.getenv("FSM_STATE_TTL_HOURS", "24"))
+    
+    # Очереди пользователей: через сколько секунд простоя удалять ящик
+    MAILBOX_IDLE_TTL: float = float(os.getenv("MAILBOX_IDLE_TTL", "600"))
+    
+    # Исходящие запросы к Telegram
+    OUTBOUND_GLOBAL_RATE: float = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+    OUTBOUND_CHAT_INTERVAL: float = float(os.getenv("OUTBOUND_CHAT_INTERVAL", "1.0"))
+    STREAM_EDIT_INTERVAL: float = float(os.getenv("STREAM_EDIT_INTERVAL", "2.0"))
+    STREAM_EDIT_MAX_INTERVAL: float = float(os.getenv("STREAM_EDIT_MAX_INTERVAL", "10.0"))
+    
+    # Очередь сообщений: "memory" (в процессе) или "postgres" (таблица inbox, переживает падения)
+    MESSAGE_QUEUE: str = os.getenv("MESSAGE_QUEUE", "memory")
+    INBOX_POLL_INTERVAL: float = float(os.getenv("INBOX_POLL_INTERVAL", "2.0"))
+    INBOX_MAX_ATTEMPTS: int = int(os.getenv("INBOX_MAX_ATTEMPTS", "3"))
+    
+    # Роль процесса: "all" - прием и обработка в одном процессе,
+    # "ingest" - только прием обновлений в inbox, "worker" - только обработка inbox
+    BOT_ROLE: str = os.getenv("BOT_ROLE", "all")
+    # Воркер-процесс обрабатывает пользователей с user_id % WORKER_COUNT == WORKER_INDEX
+    WORKER_INDEX: int = int(os.getenv("WORKER_INDEX", "0"))
+    WORKER_COUNT: int = int(os.getenv("WORKER_COUNT", "1"))
+    
+    # Антифлуд: лимиты вида "сообщений/секунд"; для отдельных команд - "more=5/60,start=3/60"
+    ANTIFLOOD_ENABLED: bool = os.getenv("ANTIFLOOD_ENABLED", "true").lower() == "true"
+    ANTIFLOOD_TEXT_LIMIT: str = os.getenv("ANTIFLOOD_TEXT_LIMIT", "5/30")
+    ANTIFLOOD_COMMAND_LIMIT: str = os.getenv("ANTIFLOOD_COMMAND_LIMIT", "10/60")
+    ANTIFLOOD_COMMAND_LIMITS: str = os.getenv("ANTIFLOOD_COMMAND_LIMITS", "start=3/60,support=3/60")
+    ANTIFLOOD_EXEMPT_IDS: str = os.getenv("ANTIFLOOD_EXEMPT_IDS", "")
+    
+    # Нагрузка: выше SHED_BACKLOG ожидающих сообщений новые не принимаются (вежливый отказ),
+    # у одного пользователя в очереди не больше SHED_USER_QUEUE сообщений (0 - без лимита).
+    # Ожидающим показывается позиция и ETA (обновляется раз в QUEUE_FEEDBACK_INTERVAL секунд)
+    SHED_BACKLOG: int = int(os.getenv("SHED_BACKLOG", "200"))
+    SHED_USER_QUEUE: int = int(os.getenv("SHED_USER_QUEUE", "3"))
+    QUEUE_FEEDBACK_INTERVAL: float = float(os.getenv("QUEUE_FEEDBACK_INTERVAL", "15"))
+    # Начальная оценка длительности ответа, пока нет живой статистики
+    EXPECTED_ANSWER_SECONDS: float = float(os.getenv("EXPECTED_ANSWER_SECONDS", "20"))
+    
+    # Приоритеты: общая емкость слотов, веса классов (interactive - команды и поддержка,
+    # button - ответы кнопок /more, llm - ответы на текст) и лимиты одновременных слотов класса.
+    # Перечитываются из .env по SIGHUP
+    PRIORITY_CAPACITY: int = int(os.getenv("PRIORITY_CAPACITY", "10"))
+    PRIORITY_WEIGHTS: str = os.getenv("PRIORITY_WEIGHTS", "interactive=8,button=4,llm=1")
+    PRIORITY_LIMITS: str = os.getenv("PRIORITY_LIMITS", "button=3")
+    PRIORITY_MAX_WAIT: float = float(os.getenv("PRIORITY_MAX_WAIT", "20"))
+    
+    # Горячий резерв: два экземпляра, обновления принимает ведущий (advisory-блокировка + аренда).
+    # Ведущий продлевает аренду раз в LEADER_HEARTBEAT_INTERVAL секунд; если аренда не продлевалась
+    # LEADER_LEASE_SECONDS секунд, резервный экземпляр забирает роль ведущего
+    STANDBY_ENABLED: bool = os.getenv("STANDBY_ENABLED", "false").lower() == "true"
+    LEADER_LEASE_SECONDS: float = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+    LEADER_HEARTBEAT_INTERVAL: float = float(os.getenv("LEADER_HEARTBEAT_INTERVAL", "3"))
+    STANDBY_WARM_UP_INTERVAL: float = float(os.getenv("STANDBY_WARM_UP_INTERVAL", "60"))
+    
+    # Фоновые действия после /start (учет реферала, уведомление, создание треда):
+    # число воркеров и попыток на шаг (задержка между попытками растет: 1, 2, 4... сек.)
+    SIDE_EFFECT_WORKERS: int = int(os.getenv("SIDE_EFFECT_WORKERS", "2"))
+    SIDE_EFFECT_MAX_ATTEMPTS: int = int(os.getenv("SIDE_EFFECT_MAX_ATTEMPTS", "5"))
+    
+    # Голосовые сообщения: бэкенд распознавания "openai" или "stub" (локальный, детерминированный),
+    # отдельные лимиты одновременных скачиваний и распознаваний, размер очереди и макс. длительность
+    VOICE_ENABLED: bool = os.getenv("VOICE_ENABLED", "true").lower() == "true"
+    VOICE_BACKEND: str = os.getenv("VOICE_BACKEND", "openai")
+    VOICE_MODEL: str = os.getenv("VOICE_MODEL", "whisper-1")
+    VOICE_LANGUAGE: str = os.getenv("VOICE_LANGUAGE", "ru")
+    VOICE_DOWNLOAD_CONCURRENCY: int = int(os.getenv("VOICE_DOWNLOAD_CONCURRENCY", "4"))
+    VOICE_TRANSCRIBE_CONCURRENCY: int = int(os.getenv("VOICE_TRANSCRIBE_CONCURRENCY", "2"))
+    VOICE_QUEUE_SIZE: int = int(os.getenv("VOICE_QUEUE_SIZE", "100"))
+    VOICE_MAX_DURATION: int = int(os.getenv("VOICE_MAX_DURATION", "300"))
+    
+    # Журналы (messages, openai_activity, token_usage): запись пачками через COPY раз в
+    # LOG_FLUSH_INTERVAL секунд или по LOG_BATCH_SIZE строк; в памяти не больше LOG_BUFFER_SIZE строк на таблицу
+    LOG_FLUSH_INTERVAL: float = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+    LOG_BATCH_SIZE: int = int(os.getenv("LOG_BATCH_SIZE", "500"))
+    LOG_BUFFER_SIZE: int = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+    
+    # Кэш bot_content в памяти: обновляется по NOTIFY от триггера и не реже чем раз в
+    # CONTENT_CACHE_REFRESH_INTERVAL секунд
+    CONTENT_CACHE_ENABLED: bool = os.getenv("CONTENT_CACHE_ENABLED", "true").lower() == "true"
+    CONTENT_CACHE_REFRESH_INTERVAL: float = float(os.getenv("CONTENT_CACHE_REFRESH_INTERVAL", "300"))
+    
+    # Остановка: сколько секунд ждать текущие ответы, прежде чем сохранить их для переигровки
+    SHUTDOWN_DEADLINE: float = float(os.getenv("SHUTDOWN_DEADLINE", "20"))
+    
     @property
     def database_url(self) -> str:
         """Возвращает URL для подключения к PostgreSQL"""
@@ -55,8 +155,23 @@ class Config:
             "SUPER_ADMIN_ID": self.SUPER_ADMIN_ID
         }
         
+        if self.UPDATES_MODE == "webhook":
+            required_vars["WEBHOOK_BASE_URL"] = self.WEBHOOK_BASE_URL
+            required_vars["WEBHOOK_SECRET"] = self.WEBHOOK_SECRET
+        
         for var_name, var_value in required_vars.items():
             if not var_value:
                 raise ValueError(f"{var_name} is required")
+        
+        if self.BOT_ROLE not in ("all", "ingest", "worker"):
+            raise ValueError(f"Unknown BOT_ROLE: {self.BOT_ROLE}")
+        if self.BOT_ROLE != "all" and self.MESSAGE_QUEUE != "postgres":
+            raise ValueError(f"BOT_ROLE={self.BOT_ROLE} requires MESSAGE_QUEUE=postgres")
+        if not 0 <= self.WORKER_INDEX < self.WORKER_COUNT:
+            raise ValueError("WORKER_INDEX must be in range 0..WORKER_COUNT-1")
+        if self.VOICE_BACKEND not in ("openai", "stub"):
+            raise ValueError(f"Unknown VOICE_BACKEND: {self.VOICE_BACKEND}")
+        if self.LEADER_HEARTBEAT_INTERVAL * 2 >= self.LEADER_LEASE_SECONDS:
+            raise ValueError("LEADER_LEASE_SECONDS must be more than twice LEADER_HEARTBEAT_INTERVAL")
 
 config = Config()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import signal
 import sys
 import os
 from datetime import datetime
@@ -54,6 +55,29 @@ logger = logging.getLogger(__name__)
 # Специальный логгер для событий запуска
 startup_logger = logging.getLogger('startup')
 
+_shutdown_tasks = set()
+
+def install_signal_handlers(bot):
+    """SIGTERM/SIGINT запускают корректную остановку: сначала прекращается прием обновлений,
+    затем start() возвращается и close() в finally дообрабатывает и сохраняет очередь"""
+    loop = asyncio.get_running_loop()
+    
+    def on_signal(sig):
+        logger.info(f"🛑 Received {sig.name}, shutting down gracefully...")
+        task = asyncio.create_task(bot.stop_intake())
+        _shutdown_tasks.add(task)
+        task.add_done_callback(_shutdown_tasks.discard)
+    
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, on_signal, sig)
+    
+    def on_reload():
+        # Перечитываем .env и применяем то, что можно менять на ходу
+        load_dotenv(override=True)
+        bot.reload_priorities()
+    
+    loop.add_signal_handler(signal.SIGHUP, on_reload)
+
 async def main():
     bot = None
     try:
@@ -72,19 +96,15 @@ async def main():
         # Создаем бота
         bot = TelegramBot()
         logger.info("🤖 Bot instance created")
+        install_signal_handlers(bot)
         
         # Инициализируем зависимости бота
         logger.info("🔄 Initializing bot dependencies...")
         await bot.initialize()
         logger.info("✅ Bot dependencies initialized")
         
-        # УДАЛЯЕМ ВЕБХУК перед запуском поллинга
-        logger.info("🔄 Deleting webhook...")
-        await bot.delete_webhook()
-        logger.info("✅ Webhook deleted successfully")
-        
-        # Запускаем бота
-        logger.info("🔄 Starting bot polling...")
+        # Запускаем бота (в режиме polling вебхук удаляется внутри start)
+        logger.info(f"🔄 Starting bot ({config.UPDATES_MODE}, role={config.BOT_ROLE})...")
         await bot.start()
         
     except Exception as e: